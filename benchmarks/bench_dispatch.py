@@ -0,0 +1,112 @@
+"""
+
+Micro-benchmark for BeoPlay._processNotification.
+
+Compares the type-keyed dispatch table against the previous approach, where every
+notification went through all the _process* methods, each one re-indexing
+data["notification"]["type"] and string-comparing it.
+
+Usage: python benchmarks/bench_dispatch.py [iterations]
+
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pybeoplay import BeoPlay
+from pybeoplay.replay import load_events_md
+
+EVENTS_MD = os.path.join(os.path.dirname(__file__), "..", "EVENTS.md")
+
+
+def load_events(path=EVENTS_MD):
+    """Extract the JSON notifications from EVENTS.md"""
+    return [json.loads(raw) for _, raw in load_events_md(path)]
+
+
+class LegacyBeoPlay(BeoPlay):
+    """Reproduces the previous dispatch: six checks, each re-indexing the message."""
+
+    def _legacyVolume(self, data):
+        if data["notification"]["type"] == "VOLUME" and data["notification"]["data"] is not None:
+            self._processVolume(data["notification"])
+
+    def _legacySource(self, data):
+        if data["notification"]["type"] == "SOURCE" and data["notification"]["data"] is not None:
+            self._processSource(data["notification"])
+
+    def _legacyExperience(self, data):
+        if data["notification"]["type"] == "SOURCE_EXPERIENCE_CHANGED":
+            self._processSourceExperienceChanged(data["notification"])
+
+    def _legacyState(self, data):
+        if data["notification"]["type"] == "PROGRESS_INFORMATION" and data["notification"]["data"] is not None:
+            self._processState(data["notification"])
+
+    def _legacyMusicInfo(self, data):
+        if data["notification"]["type"] == "NOW_PLAYING_STORED_MUSIC":
+            self._processStoredMusic(data["notification"])
+        elif data["notification"]["type"] == "NOW_PLAYING_STORED_VIDEO":
+            self._processStoredVideo(data["notification"])
+        elif data["notification"]["type"] == "NOW_PLAYING_NET_RADIO":
+            self._processNetRadio(data["notification"])
+        elif data["notification"]["type"] == "NOW_PLAYING_LEGACY":
+            self._processLegacy(data["notification"])
+        elif data["notification"]["type"] == "NOW_PLAYING_ENDED":
+            self._processNowPlayingEnded(data["notification"])
+        elif data["notification"]["type"] == "NUMBER_AND_NAME":
+            self._processNumberAndName(data["notification"])
+
+    def _legacySoundMode(self, data):
+        if data["notification"]["type"] == "SOUND_ACTIVE_MODE_CHANGED":
+            self._processSoundMode(data["notification"])
+
+    def _processNotification(self, data, trackChanges=False):
+        try:
+            self._legacyVolume(data)
+            self._legacySource(data)
+            self._legacyExperience(data)
+            self._legacyState(data)
+            self._legacyMusicInfo(data)
+            self._legacySoundMode(data)
+        except KeyError:
+            pass
+
+
+def bench(device, events, iterations, trackChanges=False):
+    process = device._processNotification
+
+    def run():
+        for event in events:
+            process(event, trackChanges)
+
+    best = min(timeit.repeat(run, number=iterations, repeat=5))
+    return iterations * len(events) / best
+
+
+def run(iterations=20000) -> dict:
+    events = load_events()
+    return {
+        "notifications": len(events),
+        "iterations": iterations,
+        "legacy_chain_per_s": bench(LegacyBeoPlay("localhost"), events, iterations),
+        "dispatch_table_per_s": bench(BeoPlay("localhost"), events, iterations),
+        "change_set_per_s": bench(BeoPlay("localhost"), events, iterations, True),
+    }
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    result = run(iterations)
+    legacy = result["legacy_chain_per_s"]
+    table = result["dispatch_table_per_s"]
+    changes = result["change_set_per_s"]
+    print("%d notifications x %d iterations" % (result["notifications"], iterations))
+    print("legacy chain:   %12.0f notifications/s" % legacy)
+    print("dispatch table: %12.0f notifications/s" % table)
+    print("speedup:        %12.2fx" % (table / legacy))
+    print("with change set:%12.0f notifications/s" % changes)
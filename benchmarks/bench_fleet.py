@@ -0,0 +1,61 @@
+"""
+
+Fan-out scaling of BeoPlayFleet: the time taken by async_refresh_all and
+async_set_volume_all over 1 to 1000 simulated devices, all served from this
+process.
+
+Usage: python benchmarks/bench_fleet.py [count ...]
+
+"""
+
+import asyncio
+import sys
+import time
+
+from common import start_devices, stop_devices
+
+from pybeoplay import BeoPlayFleet
+
+COUNTS = (1, 10, 100, 1000)
+
+
+async def bench_fleet(count) -> dict:
+    devices = await start_devices(count, notification_rate=0)
+    try:
+        async with BeoPlayFleet([device.address for device in devices]) as fleet:
+            for device in fleet:
+                device._command_rate = None
+            start = time.perf_counter()
+            refresh = await fleet.async_refresh_all()
+            refresh_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            volume = await fleet.async_set_volume_all(0.3)
+            volume_seconds = time.perf_counter() - start
+    finally:
+        await stop_devices(devices)
+    return {
+        "devices": count,
+        "refresh_all_s": refresh_seconds,
+        "refresh_all_errors": len(refresh.errors),
+        "set_volume_all_s": volume_seconds,
+        "set_volume_all_errors": len(volume.errors),
+    }
+
+
+def run(counts=COUNTS) -> list:
+    return [asyncio.run(bench_fleet(count)) for count in counts]
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or COUNTS
+    print("%8s %14s %14s %8s" % ("devices", "refresh_all", "volume_all", "errors"))
+    for stats in run(counts):
+        print(
+            "%8d %13.3fs %13.3fs %8d"
+            % (
+                stats["devices"],
+                stats["refresh_all_s"],
+                stats["set_volume_all_s"],
+                stats["refresh_all_errors"] + stats["set_volume_all_errors"],
+            )
+        )
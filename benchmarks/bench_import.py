@@ -0,0 +1,72 @@
+"""
+
+Benchmark of the import cost of pybeoplay: wall time and peak memory of a fresh
+interpreter importing the package, creating a BeoPlay object, and loading the
+HTTP stack (aiohttp), which is imported on first use only.
+
+Usage: python benchmarks/bench_import.py [repeat]
+
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# each scenario runs in a new interpreter, timed from before its first import
+SCENARIOS = {
+    "import": "import pybeoplay",
+    "device": "import pybeoplay; pybeoplay.BeoPlay('192.168.1.10')",
+    "http_stack": "import pybeoplay; pybeoplay.lazy.aiohttp.load()",
+}
+
+CHILD = """
+import sys, time
+start = time.perf_counter()
+{0}
+seconds = time.perf_counter() - start
+maxrss = None
+try:
+    # peak resident memory of this process, in KB (ru_maxrss survives the
+    # exec and would report the peak of the parent process instead)
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                maxrss = int(line.split()[1])
+except OSError:
+    pass
+print(seconds, maxrss, "aiohttp" in sys.modules)
+"""
+
+
+def measure(code):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(code)],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    maxrss = None if output[1] == "None" else int(output[1])
+    return float(output[0]), maxrss, output[2] == "True"
+
+
+def run(repeat=10) -> dict:
+    result = {}
+    for name, code in SCENARIOS.items():
+        samples = [measure(code) for _ in range(repeat)]
+        result[name] = {
+            "median_ms": statistics.median(seconds for seconds, _, _ in samples) * 1000,
+            "aiohttp_loaded": samples[0][2],
+        }
+        if samples[0][1] is not None:
+            result[name]["maxrss_kb"] = statistics.median(rss for _, rss, _ in samples)
+    return result
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(json.dumps(run(repeat), indent=2))
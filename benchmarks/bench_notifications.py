@@ -0,0 +1,75 @@
+"""
+
+Benchmark of the notification stream parser: splitting and decoding the
+BeoNotify stream line by line (the readline path) and in arbitrary chunks (the
+chunked path), with the json module and with orjson when it is installed.
+
+Usage: python benchmarks/bench_notifications.py [repeat]
+
+"""
+
+import io
+import json
+import sys
+import time
+
+from common import EVENTS_MD
+
+from pybeoplay.replay import load_events_md
+from pybeoplay.stream import NotificationParser, _json_loads_bytes, orjson
+
+CHUNK_SIZE = 4096
+
+
+def make_stream(repeat) -> bytes:
+    lines = [raw for _, raw in load_events_md(EVENTS_MD)]
+    return b"\r\n".join(lines * repeat) + b"\r\n"
+
+
+def bench_lines(stream, loads) -> float:
+    """Read and decode the stream one line at a time, doing the per-line work of
+    BeoPlay._readNotificationLines: utf-8 decode, CR/LF removal, and loads on
+    the str."""
+    readline = io.BytesIO(stream).readline
+    start = time.perf_counter()
+    count = 0
+    while True:
+        data = readline()
+        if not data:
+            break
+        data = data.decode("utf-8").replace("\r", "").replace("\n", "")
+        if len(data) > 0:
+            loads(data)
+            count += 1
+    return count / (time.perf_counter() - start)
+
+
+def bench_chunks(stream, loads) -> float:
+    """Feed the stream to a NotificationParser in fixed size chunks."""
+    parser = NotificationParser(loads)
+    chunks = [stream[i:i + CHUNK_SIZE] for i in range(0, len(stream), CHUNK_SIZE)]
+    start = time.perf_counter()
+    count = 0
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+    count += len(parser.flush())
+    return count / (time.perf_counter() - start)
+
+
+def run(repeat=5000) -> dict:
+    stream = make_stream(repeat)
+    backends = {"json": json.loads}
+    if orjson is not None:
+        backends["orjson"] = orjson.loads
+    result = {"bytes": len(stream)}
+    for name, loads in backends.items():
+        result["lines_%s_per_s" % name] = bench_lines(stream, loads)
+        chunk_loads = _json_loads_bytes if name == "json" else loads
+        result["chunks_%s_per_s" % name] = bench_chunks(stream, chunk_loads)
+    return result
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for key, value in run(repeat).items():
+        print("%-24s %12.0f" % (key, value))
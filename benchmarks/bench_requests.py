@@ -0,0 +1,123 @@
+"""
+
+Throughput and latency of the request paths against a simulated device:
+async GET and PUT through async_getReq / async_postReq with a number of
+concurrent workers, and the blocking _getReq / _postReq path from one thread.
+
+Each async worker uses its own BeoPlay instance so that concurrent GETs are not
+coalesced into one request; the response cache is not used.
+
+Usage: python benchmarks/bench_requests.py [requests] [concurrency]
+
+"""
+
+import asyncio
+import sys
+import time
+
+import aiohttp
+
+from common import BackgroundDevices, SimulatedDevice, percentiles
+
+from pybeoplay import BeoPlay
+from pybeoplay.breaker import CircuitBreaker
+from pybeoplay.const import *
+
+
+def _result(latencies, seconds) -> dict:
+    result = {"requests": len(latencies), "per_s": len(latencies) / seconds}
+    result.update(percentiles(latencies))
+    return result
+
+
+def _device(device, session=None) -> BeoPlay:
+    # a private breaker: benchmark errors must not open the shared one
+    return BeoPlay(
+        device.host, session, breaker=CircuitBreaker(), command_rate=None, port=device.port
+    )
+
+
+async def bench_async(device, requests, concurrency, request) -> dict:
+    latencies = []
+
+    async def worker(gateway, count):
+        for _ in range(count):
+            start = time.perf_counter()
+            await request(gateway)
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # warm up the connections
+        await asyncio.gather(*[request(_device(device, session)) for _ in range(concurrency)])
+        per_worker = max(1, requests // concurrency)
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[worker(_device(device, session), per_worker) for _ in range(concurrency)]
+        )
+        return _result(latencies, time.perf_counter() - start)
+
+
+def bench_blocking(device, requests, request) -> dict:
+    gateway = _device(device)
+    latencies = []
+    request(gateway)
+    start = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        request(gateway)
+        latencies.append(time.perf_counter() - begin)
+    seconds = time.perf_counter() - start
+    gateway.close()
+    return _result(latencies, seconds)
+
+
+def async_get(gateway):
+    return gateway.async_getReq(BEOPLAY_URL_STANDBY)
+
+
+def async_put(gateway):
+    return gateway.async_postReq("PUT", BEOPLAY_URL_SET_VOLUME, {"level": 30})
+
+
+def blocking_get(gateway):
+    return gateway._getReq(BEOPLAY_URL_STANDBY)
+
+
+def blocking_put(gateway):
+    return gateway._postReq("PUT", BEOPLAY_URL_SET_VOLUME, {"level": 30})
+
+
+async def run_async(requests, concurrency) -> dict:
+    device = SimulatedDevice(notification_rate=0)
+    await device.start()
+    try:
+        return {
+            "async_get": await bench_async(device, requests, concurrency, async_get),
+            "async_put": await bench_async(device, requests, concurrency, async_put),
+        }
+    finally:
+        await device.stop()
+
+
+def run(requests=2000, concurrency=16) -> dict:
+    result = {"concurrency": concurrency}
+    result.update(asyncio.run(run_async(requests, concurrency)))
+    # the blocking path needs the device served from another thread
+    with BackgroundDevices(1, notification_rate=0) as devices:
+        result["blocking_get"] = bench_blocking(devices[0], requests // 4, blocking_get)
+        result["blocking_put"] = bench_blocking(devices[0], requests // 4, blocking_put)
+    return result
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    result = run(requests, concurrency)
+    print("concurrency %d" % concurrency)
+    for name in ("async_get", "async_put", "blocking_get", "blocking_put"):
+        stats = result[name]
+        print(
+            "%-14s %8.0f req/s  p50 %6.2fms  p90 %6.2fms  p99 %6.2fms"
+            % (name, stats["per_s"], stats["p50_ms"], stats["p90_ms"], stats["p99_ms"])
+        )
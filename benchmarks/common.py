@@ -0,0 +1,54 @@
+"""
+
+Helpers shared by the benchmarks.
+
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pybeoplay.simulator import SimulatedDevice, start_devices, stop_devices
+
+EVENTS_MD = os.path.join(os.path.dirname(__file__), "..", "EVENTS.md")
+
+
+def percentiles(samples, points=(50, 90, 99)) -> dict:
+    """Return the given percentiles of a list of samples, in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        index = min(len(ordered) - 1, int(round(point / 100 * (len(ordered) - 1))))
+        result["p%d_ms" % point] = ordered[index] * 1000
+    result["max_ms"] = ordered[-1] * 1000
+    return result
+
+
+class BackgroundDevices(object):
+    """Simulated devices running on an event loop in a background thread, for the
+    blocking benchmarks."""
+
+    def __init__(self, count=1, **kwargs):
+        self._count = count
+        self._kwargs = kwargs
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self.devices = []
+
+    def __enter__(self):
+        self._thread.start()
+        self.devices = asyncio.run_coroutine_threadsafe(
+            start_devices(self._count, **self._kwargs), self._loop
+        ).result()
+        return self.devices
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(stop_devices(self.devices), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,49 @@
+"""
+
+Run all the benchmarks and write the results as JSON, to compare runs over time.
+
+Usage: python benchmarks/run.py [--output results.json] [--quick]
+
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import bench_dispatch
+import bench_fleet
+import bench_import
+import bench_notifications
+import bench_requests
+
+import pybeoplay
+
+
+def run(quick=False) -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "dispatch": bench_dispatch.run(2000 if quick else 20000),
+        "notifications": bench_notifications.run(500 if quick else 5000),
+        "requests": bench_requests.run(*((200, 4) if quick else (2000, 16))),
+        "fleet": bench_fleet.run((1, 10) if quick else bench_fleet.COUNTS),
+        "import": bench_import.run(3 if quick else 10),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pybeoplay benchmarks")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--quick", action="store_true", help="small run, for a smoke test")
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
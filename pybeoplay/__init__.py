@@ -9,34 +9,148 @@ https://widdowquinn.github.io/coding/update-pypi-package/
 
 """
 
-import requests
-import aiohttp
+from __future__ import annotations
+
 import asyncio
-from aiohttp import ClientResponse
 import json
 import logging
+import random
+import time
 from typing import Optional
 from .const import *
+from .lazy import aiohttp
+from .background import BackgroundLoop, get_background_loop
+from .breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from .cache import ResponseCache
+from .commands import LatestValueChannel
+from .history import EventHistory, HistoryEntry
+from .metadata import MetadataEntry, MetadataStore
+from .metrics import ERROR_CONNECTION, ERROR_TIMEOUT, InMemoryMetrics, MetricsSink
+from .pubsub import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+    NotificationHub,
+    Subscription,
+)
+from .retry import LatencyTracker, RetryBudget
+from .sources import Source, SourceRegistry, SourcesView
+from .state import STATE_FIELDS, BeoPlayState, StateField, diff, field_getter
+from .stream import NotificationParser
 
 
 LOG = logging.getLogger(__name__)
 
 
 class BeoPlay(object):
-    def __init__(self, host, session: Optional[aiohttp.ClientSession] = None):
+    # State and Media information, stored in the BeoPlayState record self._snapshot
+    on = StateField("on")
+    min_volume = StateField("min_volume")
+    max_volume = StateField("max_volume")
+    volume = StateField("volume")
+    muted = StateField("muted")
+    state = StateField("state")
+    media_url = StateField("media_url")
+    media_track = StateField("media_track")
+    media_artist = StateField("media_artist")
+    media_album = StateField("media_album")
+    media_genre = StateField("media_genre")
+    media_country = StateField("media_country")
+    media_languages = StateField("media_languages")
+    primary_experience = StateField("primary_experience")
+    source = StateField("source")
+    listeners = StateField("listeners")
+    _soundMode = StateField("soundMode")
+    _standPosition = StateField("standPosition")
+
+    def __init__(
+        self,
+        host,
+        session: Optional[aiohttp.ClientSession] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        background: Optional[BackgroundLoop] = None,
+        cache: Optional[ResponseCache] = None,
+        command_rate: Optional[float] = COMMAND_MAX_RATE,
+        port: int = DEFAULT_PORT,
+        metrics: Optional[MetricsSink] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        hedge_percentile: Optional[float] = None,
+        history_size: int = 0,
+        metadata: Optional[MetadataStore] = None,
+    ):
         """Initializes a BeoPlay connection to the speaker / TV
         Host: the IP address of the speaker
         Session (optional): a asyncio client session to be used for async
         communication with the speaker (if not provided, only blocking calls 
-        using Requests will work)
+        will work)
+        Breaker (optional): the circuit breaker of the device (by default, one
+        circuit breaker is shared by all the BeoPlay objects of the same host)
+        Background (optional): the BackgroundLoop running the blocking calls (by
+        default, one loop and its connection pool are shared by all the BeoPlay
+        objects)
+        Cache (optional): a ResponseCache for the read endpoints that rarely change
+        (device info, sources, sound modes, stand positions). It can be shared
+        across BeoPlay objects.
+        Command_rate: maximum number of volume, mute and stand position commands
+        sent per second by the async calls. Intermediate values are dropped, only
+        the latest one is sent (None for no rate limit).
+        Port: the HTTP port of the device (8080 on B&O devices, other values are
+        useful with simulated devices)
+        Metrics (optional): a MetricsSink receiving the latency, status and size of
+        every request and the notifications received (see InMemoryMetrics)
+        Retry_budget (optional): the RetryBudget limiting the retries and hedges of
+        the GET requests. It can be shared across BeoPlay objects.
+        Hedge_percentile (optional): send a second GET when the first one is slower
+        than this percentile (e.g. 95) of the recent GET latencies of the device,
+        and use the first answer (None: no hedging)
+        History_size: the number of recent notifications kept in the history of
+        the device (see history), 0 to keep none
+        Metadata (optional): a MetadataStore. The device information, sources, sound
+        modes and stand positions saved for this address are loaded right away
+        (see async_revalidate_metadata).
         """
         # network information
         self._host = host
-        self._host_notifications = BASE_URL.format(
-            self._host, BEOPLAY_URL_NOTIFICATIONS
-        )
-        self._connfail = 0
+        self._port = port
+        # host, or host:port if not on the default port: identifies the device in
+        # the circuit breakers, caches and fleets
+        self._address = host if port == DEFAULT_PORT else "{0}:{1}".format(host, port)
+        self._base_url = BASE_URL_PORT.format(host, port, "")
+        self._host_notifications = self._base_url + BEOPLAY_URL_NOTIFICATIONS
+        self._breaker = breaker if breaker is not None else get_breaker(self._address)
         self._clientsession = session
+        self._background = background
+        self._cache = cache
+        self._metrics = metrics
+        # GET requests in flight, by path, shared by concurrent callers (one dict
+        # for the loop of the async calls, one for the background loop)
+        self._inflight = {}
+        self._backgroundInflight = {}
+        self.issued_get_requests = 0
+        self.coalesced_get_requests = 0
+        # Deadline, retries and hedging of the GET requests
+        self.get_timeout = GET_TIMEOUT
+        self.get_retries = GET_RETRIES
+        self._retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        self._hedge_percentile = hedge_percentile
+        self._latencies = LatencyTracker() if hedge_percentile is not None else None
+        self.retried_get_requests = 0
+        self.hedged_get_requests = 0
+        # Latest-wins channels of the continuous-valued commands
+        self._command_rate = command_rate
+        self._channels = {}
+        # Delay between the keys of a macro, can be tuned per device
+        self.key_delay = MACRO_KEY_DELAY
+        # (predicate, future) waiting for a state reached through notifications
+        self._waiters = []
+        # notification streams currently connected
+        self._streams = 0
+        # subscribers to the notifications (see subscribe)
+        self._hub = NotificationHub()
+        # recent notifications, for time range queries
+        self._history = EventHistory(history_size) if history_size else None
+        # notification stream of the blocking API, on the background loop
+        self._backgroundSupervisor = None
         # The following are only going ot be valid after a call to getDeviceInfo
         # device information
         self._name = None
@@ -51,6 +165,7 @@ class BeoPlay(object):
         # Notifications varies by device. Some devices for example provide notifications when
         # Sound mode changes (e.g., Stage), others (e.g., BeoVision Avant 55) don't.
         # State and Media information
+        self._snapshot = BeoPlayState()
         self.on = None
         self.min_volume = None
         self.max_volume = None
@@ -68,9 +183,10 @@ class BeoPlay(object):
         # The following are only going ot be valid after a call to getSources
         # Sources
         self.source = None
-        self.sources = []
-        self.sourcesID = []
-        self.sourcesBorrowed = []
+        self._sources = SourceRegistry()
+        self._sourcesView = self._sources.view("name")
+        self._sourcesIDView = self._sources.view("id")
+        self._sourcesBorrowedView = self._sources.view("borrowed")
         self.listeners = []
         # The following are only going ot be valid after a call to getSoundModes
         # Sound modes
@@ -80,12 +196,29 @@ class BeoPlay(object):
         # Stand control
         self._standPosition = None
         self._standPositions = {}
+        # Notification handlers, shared with the class until a handler is registered
+        self._notification_handlers = self._NOTIFICATION_HANDLERS
+        self._own_notification_handlers = False
+        # Static metadata saved on disk, usable before contacting the device
+        self._metadata = metadata
+        if metadata is not None:
+            self._loadMetadata()
 
     @property
     def host(self):
         """Return the device host."""
         return self._host
     
+    @property
+    def port(self):
+        """Return the device HTTP port."""
+        return self._port
+
+    @property
+    def address(self):
+        """Return the device address: host, or host:port if not on the default port."""
+        return self._address
+
     @property
     def name(self):
         """Return the device name."""
@@ -121,6 +254,78 @@ class BeoPlay(object):
         """Return the device serial number."""
         return self._hardwareVersion
 
+    @property
+    def jid(self):
+        """Return the jid identifying the device in multiroom experiences, or None
+        if the device information was not retrieved."""
+        if self._serialNumber is None:
+            return None
+        return BEOPLAY_JID_FORMAT.format(
+            self._typeNumber, self._itemNumber, self._serialNumber
+        )
+
+    @property
+    def streaming(self) -> bool:
+        """Return True if a notification stream is connected."""
+        return self._streams > 0
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        """Return the circuit breaker of the device."""
+        return self._breaker
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        """Return the response cache, if any."""
+        return self._cache
+
+    @property
+    def metrics(self) -> Optional[MetricsSink]:
+        """Return the metrics sink, if any."""
+        return self._metrics
+
+    @property
+    def sources(self) -> SourcesView:
+        """Return the friendly names of the sources in use (a read-only list that
+        follows the source registry)."""
+        return self._sourcesView
+
+    @property
+    def sourcesID(self) -> SourcesView:
+        """Return the ids of the sources, in the order of sources."""
+        return self._sourcesIDView
+
+    @property
+    def sourcesBorrowed(self) -> SourcesView:
+        """Return the borrowed flags of the sources, in the order of sources."""
+        return self._sourcesBorrowedView
+
+    @property
+    def source_registry(self) -> SourceRegistry:
+        """Return the registry of the sources, indexed by id, name, type and jid."""
+        return self._sources
+
+    @property
+    def metadata(self) -> Optional[MetadataStore]:
+        """Return the metadata store of the device, if any."""
+        return self._metadata
+
+    @property
+    def history(self) -> Optional[EventHistory]:
+        """Return the history of the recent notifications, or None if not kept
+        (see history_size)."""
+        return self._history
+
+    @property
+    def retry_budget(self) -> RetryBudget:
+        """Return the retry budget of the GET requests."""
+        return self._retry_budget
+
+    @property
+    def circuit_state(self):
+        """Return the circuit breaker state: closed, open or half_open."""
+        return self._breaker.state
+
     @property
     def remote_commands(self):
         """Get the list of available remote commands"""
@@ -155,98 +360,320 @@ class BeoPlay(object):
     def standPositions(self):
         """Get the list of available stand positions"""
         return self._standPositions
+
+    @property
+    def snapshot(self) -> BeoPlayState:
+        """Get the state record of the device (volume, source, media information...)"""
+        return self._snapshot
     
     ###############################################################
     # ASYNC BASED NETWORK CALLS
     ###############################################################
 
-    async def async_getReq(self, path):
-        """Non blocking GET call to the speaker, with a given path."""
-        if self._clientsession is None:
+    def _inBackground(self) -> bool:
+        """Return True when running on the background loop of the blocking calls."""
+        return self._background is not None and self._background.is_current()
+
+    def _getSession(self):
+        """Return the aiohttp session of the running loop: the session of the
+        background loop for the blocking calls, the session given otherwise."""
+        if self._background is not None and self._background.is_current():
+            return self._background.session
+        return self._clientsession
+
+    def _checkCircuit(self):
+        """Raise CircuitOpenError if the circuit of the host is open."""
+        if not self._breaker.allow():
+            raise CircuitOpenError(
+                "Circuit open for {0}, retry in {1:.1f}s".format(
+                    self._address, self._breaker.retry_after
+                )
+            )
+
+    async def async_getReq(
+        self, path, bypass_cache: bool = False, timeout: Optional[float] = None
+    ):
+        """Non blocking GET call to the speaker, with a given path.
+        Cacheable endpoints are served from the response cache, if configured,
+        unless bypass_cache is True.
+        Concurrent calls for the same path share one request, and all receive the
+        same parsed result (which must not be modified). A call only joins a
+        request that does not give up before its own deadline (within
+        GET_COALESCE_SLACK), and issues its own request, in the time left, if the
+        request it joined times out first.
+        timeout: deadline of the call in seconds, including the retries (defaults
+        to the get_timeout attribute, GET_TIMEOUT). Each attempt is also bounded
+        by TIMEOUT. Timeouts and connection errors are retried up to get_retries
+        times, as long as the retry budget allows it.
+        Raises asyncio.TimeoutError when the deadline expires, and CircuitOpenError
+        (an asyncio.TimeoutError) without contacting the device if its circuit
+        breaker is open."""
+        if timeout is None:
+            timeout = self.get_timeout
+        if self._cache is not None and not bypass_cache:
+            json = self._cache.get(self._address, path)
+            if json is not None:
+                return json
+        session = self._getSession()
+        if session is None:
             LOG.error("Attempt asyncio with no ClientSession")
             return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        inflights = self._backgroundInflight if self._inBackground() else self._inflight
+        inflight, inflightDeadline = inflights.get(path, (None, 0.0))
+        if inflight is not None and inflightDeadline >= deadline - GET_COALESCE_SLACK:
+            self.coalesced_get_requests += 1
+            try:
+                # shielded: a cancelled (or timed out) caller does not cancel the
+                # request of the others
+                return await asyncio.wait_for(asyncio.shield(inflight), timeout)
+            except asyncio.TimeoutError:
+                # the request joined gave up a little before this call's
+                # deadline: try again in the time left
+                timeout = deadline - loop.time()
+                if not inflight.done() or timeout <= 0:
+                    raise
+        # the request in flight, if any, would give up too early for this call:
+        # issue a new one, that later calls will join instead
+        inflight = asyncio.ensure_future(self._async_fetch(session, path, timeout))
+        inflights[path] = (inflight, deadline)
+        inflight.add_done_callback(
+            lambda future, path=path: self._inflightDone(inflights, path, future)
+        )
+        self.issued_get_requests += 1
+        return await asyncio.wait_for(asyncio.shield(inflight), timeout)
+
+    @staticmethod
+    def _inflightDone(inflights, path, future):
+        if inflights.get(path, (None,))[0] is future:
+            del inflights[path]
+        if not future.cancelled():
+            # mark the exception as retrieved, in case all the callers were cancelled
+            future.exception()
+
+    async def _async_fetch(self, session, path, timeout):
+        """GET with retries, within timeout seconds. The circuit breaker sees the
+        whole call as one: it is checked before the first attempt, and records a
+        single failure if all the attempts fail."""
+        self._checkCircuit()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        budget = self._retry_budget
+        budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return await self._async_fetchHedged(session, path, deadline)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as _e:
+                attempt += 1
+                # jittered, so that the retries of many callers do not synchronize
+                backoff = GET_RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+                if (
+                    attempt > self.get_retries
+                    or loop.time() + backoff >= deadline
+                    or not budget.withdraw()
+                ):
+                    self._breaker.record_failure()
+                    raise
+                LOG.debug("Retrying %s on %s after %s", path, self._address, str(_e))
+                self.retried_get_requests += 1
+                await asyncio.sleep(backoff)
+
+    async def _async_fetchHedged(self, session, path, deadline):
+        """GET, sending a second request if the first one is slower than the hedge
+        percentile. Returns the first answer."""
+        loop = asyncio.get_running_loop()
+        delay = None
+        if self._latencies is not None:
+            delay = self._latencies.percentile(self._hedge_percentile)
+        if delay is None or loop.time() + delay >= deadline:
+            return await self._async_fetchOnce(session, path, deadline)
+        first = asyncio.ensure_future(self._async_fetchOnce(session, path, deadline))
+        second = None
         try:
-            async with self._clientsession.get(
-                BASE_URL.format(self._host, path)
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            if done or not self._retry_budget.withdraw():
+                return await first
+            self.hedged_get_requests += 1
+            LOG.debug("Hedging %s on %s after %.3fs", path, self._address, delay)
+            second = asyncio.ensure_future(
+                self._async_fetchOnce(session, path, deadline)
+            )
+            pending = {first, second}
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for request in done:
+                    if request.exception() is None:
+                        return request.result()
+                if not pending:
+                    # both failed
+                    return first.result()
+        finally:
+            for request in (first, second):
+                if request is not None and not request.done():
+                    request.cancel()
+
+    async def _async_fetchOnce(self, session, path, deadline):
+        metrics = self._metrics
+        timed = metrics is not None or self._latencies is not None
+        start = time.perf_counter() if timed else 0.0
+        timeout = min(TIMEOUT, deadline - asyncio.get_running_loop().time())
+        if timeout <= 0:
+            raise asyncio.TimeoutError()
+        try:
+            async with session.get(
+                self._base_url + path, timeout=aiohttp.ClientTimeout(total=timeout)
             ) as resp:
                 LOG.debug("Request Status: %s", str(resp.status))
                 if resp.status != 200:
+                    self._breaker.record_success()
+                    if metrics is not None:
+                        self._recordRequest("GET", path, resp.status, start)
                     return None
+                body = await resp.read()
                 json = await resp.json()
+                self._breaker.record_success()
+                if timed:
+                    if self._latencies is not None:
+                        self._latencies.record(time.perf_counter() - start)
+                    if metrics is not None:
+                        self._recordRequest("GET", path, 200, start, len(body))
                 LOG.debug("Request Json: %s", json)
+                if self._cache is not None:
+                    self._cache.put(self._address, path, json)
                 return json
         except (asyncio.TimeoutError, aiohttp.ClientError) as _e:
             LOG.info("Client error %s on %s" , str(_e), self._name)
+            if metrics is not None:
+                self._recordError("GET", path, _e, start)
             raise
 
+    def _recordRequest(self, method, path, status, start, size=0):
+        self._metrics.record_request(
+            self._address, method, path, status, time.perf_counter() - start, size
+        )
+
+    def _recordError(self, method, path, error, start):
+        self._metrics.record_error(
+            self._address,
+            method,
+            path,
+            ERROR_TIMEOUT if isinstance(error, asyncio.TimeoutError) else ERROR_CONNECTION,
+            time.perf_counter() - start,
+        )
+
     async def async_postReq(self, type, path, jsondata: dict = {}):
         """Non blocking POST call to the speaker, with a given path and JSON data.
         type: PUT POST or DELETE
         path: the path of the request
         data: JSON data for the POST, in the form of Python dict/arrays
+        Raises CircuitOpenError (an asyncio.TimeoutError) without contacting the
+        device if its circuit breaker is open.
         """
-        if self._clientsession is None:
+        session = self._getSession()
+        if session is None:
             LOG.error("Attempt asyncio with no ClientSession")
             return
+        if type == "PUT" or type == "POST":
+            kwargs = {"json": jsondata}
+        elif type == "DELETE":
+            kwargs = {}
+        else:
+            return False
+        self._checkCircuit()
+        metrics = self._metrics
+        start = time.perf_counter() if metrics is not None else 0.0
         try:
-            if type == "PUT":
-                async with self._clientsession.put(
-                    BASE_URL.format(self._host, path), json=jsondata, timeout=aiohttp.ClientTimeout(total=TIMEOUT)
-                ) as resp:
-                    LOG.debug("Status: %s", resp.status)
-                    if resp.status != 200:
-                        return False
-            elif type == "POST":
-                async with self._clientsession.post(
-                    BASE_URL.format(self._host, path), json=jsondata, timeout=aiohttp.ClientTimeout(total=TIMEOUT)
-                ) as resp:
-                    LOG.debug("Status: %s", resp.status)
-                    if resp.status != 200:
-                        return False
-            elif type == "DELETE":
-                async with self._clientsession.delete(
-                    BASE_URL.format(self._host, path), timeout=aiohttp.ClientTimeout(total=TIMEOUT)
-                ) as resp:
-                    LOG.debug("Status: %s", resp.status)
-                    if resp.status != 200:
-                        return False
-
-            else:
-                return False
+            async with session.request(
+                type,
+                self._base_url + path,
+                timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+                **kwargs
+            ) as resp:
+                self._breaker.record_success()
+                if self._cache is not None:
+                    self._cache.invalidate_command(self._address, path)
+                if metrics is not None:
+                    self._recordRequest(type, path, resp.status, start)
+                LOG.debug("Status: %s", resp.status)
+                if resp.status != 200:
+                    return False
         except (asyncio.TimeoutError, aiohttp.ClientError) as _e:
             LOG.info("Client error %s on %s" , str(_e), self._name)
+            self._breaker.record_failure()
+            if metrics is not None:
+                self._recordError(type, path, _e, start)
             raise
         return True
 
-    async def async_notificationsTask(self, callback=None) -> bool:
+    async def async_notificationsTask(
+        self,
+        callback=None,
+        batch_callback=None,
+        chunked: bool = None,
+        loads=None,
+        read_timeout: Optional[float] = None,
+        connected_callback=None,
+        change_callback=None,
+        recorder=None,
+    ) -> bool:
         """
         Async notifications taks that can be used to keep track of the speaker actions.
-        B&O speakers disconnect after 5 minutes of inactivity, so restart the task if this exits.
+        B&O speakers disconnect after 5 minutes of inactivity, so restart the task if this exits
+        (or use a NotificationSupervisor, that reconnects automatically).
         This function automatically updates the internal state of the BeoPlay object.
 
         callback: a function to be called to use the notification (E.g. to update a UI...)
+        batch_callback: a function called once with the list of notifications that arrived
+        together in one chunk (only in chunked mode)
+        chunked: read the stream in large chunks and parse all the notifications they contain
+        in one go, instead of one line at a time. Defaults to True if batch_callback is given.
+        loads: the JSON backend used in chunked mode (defaults to orjson, if installed)
+        read_timeout: raise asyncio.TimeoutError if nothing is received for this many seconds
+        connected_callback: a function called once the stream is established
+        change_callback: a function called with the dict field -> new value of the state
+        fields (see BeoPlayState) changed by a notification, if any changed
+        recorder: a NotificationRecorder that captures the raw stream
         """
-        if self._clientsession is None:
+        session = self._getSession()
+        if session is None:
             LOG.error("Attempt asyncio with no ClientSession")
             return False
+        if chunked is None:
+            chunked = batch_callback is not None
         try:
-            async with self._clientsession.get(self._host_notifications) as response:
-                data = None
+            kwargs = {}
+            if read_timeout is not None or self._inBackground():
+                # the stream must outlive the total timeout of the requests
+                kwargs["timeout"] = aiohttp.ClientTimeout(
+                    total=None, connect=TIMEOUT, sock_read=read_timeout
+                )
+            async with session.get(
+                self._host_notifications, **kwargs
+            ) as response:
                 if response.status == 200:
-                    while True:
-                        data = await response.content.readline()
-                        if data and len(data) > 0:
-                            data = (
-                                data.decode("utf-8").replace("\r", "").replace("\n", "")
+                    self._streams += 1
+                    try:
+                        if connected_callback is not None:
+                            connected_callback()
+                        if chunked:
+                            await self._readNotificationChunks(
+                                response,
+                                callback,
+                                batch_callback,
+                                change_callback,
+                                NotificationParser(loads),
+                                recorder,
                             )
-                            if len(data) > 0:
-                                LOG.debug("Update status: %s %s", self._name, data)
-                                data_json = json.loads(data)
-                                self._processNotification(data_json)
-                                if callback is not None:
-                                    callback(data_json["notification"])
                         else:
-                            break
+                            await self._readNotificationLines(
+                                response, callback, change_callback, recorder
+                            )
+                    finally:
+                        self._streams -= 1
                 else:
                     LOG.error(
                         "Error %s on %s.",
@@ -261,6 +688,85 @@ class BeoPlay(object):
 
         return True
 
+    async def _readNotificationLines(
+        self, response: aiohttp.ClientResponse, callback, change_callback, recorder
+    ):
+        while True:
+            data = await response.content.readline()
+            if data and len(data) > 0:
+                if recorder is not None:
+                    recorder.feed(data)
+                if self._metrics is not None:
+                    self._metrics.record_stream_bytes(self._address, len(data))
+                data = (
+                    data.decode("utf-8").replace("\r", "").replace("\n", "")
+                )
+                if len(data) > 0:
+                    LOG.debug("Update status: %s %s", self._name, data)
+                    try:
+                        data_json = json.loads(data)
+                    except ValueError:
+                        # skip the malformed line, like NotificationParser
+                        LOG.debug("Malformed notification line: %s", data)
+                        continue
+                    changes = self._processNotification(
+                        data_json, change_callback is not None
+                    )
+                    if callback is not None:
+                        callback(data_json["notification"])
+                    if changes and change_callback is not None:
+                        change_callback(changes)
+                    if self._hub and not self._hub.publish(data_json["notification"]):
+                        await self._hub.async_drain()
+            else:
+                break
+
+    async def _readNotificationChunks(
+        self,
+        response: aiohttp.ClientResponse,
+        callback,
+        batch_callback,
+        change_callback,
+        parser: NotificationParser,
+        recorder,
+    ):
+        async for chunk in response.content.iter_any():
+            if recorder is not None:
+                recorder.feed(chunk)
+            if self._metrics is not None:
+                self._metrics.record_stream_bytes(self._address, len(chunk))
+            if not self._processNotificationBatch(
+                parser.feed(chunk), callback, batch_callback, change_callback
+            ):
+                await self._hub.async_drain()
+        if not self._processNotificationBatch(
+            parser.flush(), callback, batch_callback, change_callback
+        ):
+            await self._hub.async_drain()
+
+    def _processNotificationBatch(
+        self, batch, callback, batch_callback, change_callback
+    ) -> bool:
+        """Process notifications. Returns False if a blocking subscriber is full:
+        the hub must be drained before reading more."""
+        if not batch:
+            return True
+        LOG.debug("Update status: %s %d notifications", self._name, len(batch))
+        trackChanges = change_callback is not None
+        hub = self._hub if self._hub else None
+        delivered = True
+        for data_json in batch:
+            changes = self._processNotification(data_json, trackChanges)
+            if callback is not None:
+                callback(data_json["notification"])
+            if changes and change_callback is not None:
+                change_callback(changes)
+            if hub is not None and not hub.publish(data_json["notification"]):
+                delivered = False
+        if batch_callback is not None:
+            batch_callback([data_json["notification"] for data_json in batch])
+        return delivered
+
     ###############################################################
     # GET ATTRIBUTES FROM THE SPEAKER - NON-BLOCKING CALLS
     ###############################################################
@@ -275,25 +781,23 @@ class BeoPlay(object):
         return self.source
 
     # edited to only include in Use sources
-    async def async_get_sources(self):
+    async def async_get_sources(self, bypass_cache: bool = False):
         """Returns a list of available sources, or None if not retrieved."""
-        r = await self.async_getReq(BEOPLAY_URL_GET_SOURCES)
+        r = await self.async_getReq(BEOPLAY_URL_GET_SOURCES, bypass_cache)
         if r:
-            # clear previously stored sources
-            self.sources = []
-            self.sourcesID = []
-            self.sourcesBorrowed = []
-            for elements in r:
-                i = 0
-                while i < len(r[elements]):
-                    if r[elements][i][1]["inUse"] == True:
-                        self.sourcesBorrowed.append(r[elements][i][1]["borrowed"])
-                        self.sources.append(r[elements][i][1]["friendlyName"])
-                        self.sourcesID.append(r[elements][i][0])
-                    i += 1
-            return self.sources
+            return self._processSources(r)
         return
 
+    def _processSources(self, r):
+        """Store the sources in use of a Sources response."""
+        self._sources.replace(
+            Source.from_json(dict(source, id=sourceID))
+            for elements in r
+            for sourceID, source in r[elements]
+            if source["inUse"] == True
+        )
+        return list(self.sources)
+
     async def async_get_standby(self) -> bool:
         """Returns True of the device is on, False if off or unavailable."""
         r = await self.async_getReq(BEOPLAY_URL_STANDBY)
@@ -306,24 +810,31 @@ class BeoPlay(object):
         return False
     
     async def async_get_sound_mode(self):
-        """Returns the current sound mode, or None if not retrieved."""
+        """Returns the current sound mode, or None if not retrieved.
+        The active mode is always read from the device, not from the cache."""
         self._soundMode = None
-        await self.async_get_sound_modes()
+        await self.async_get_sound_modes(bypass_cache=True)
         return self._soundMode
 
-    async def async_get_sound_modes(self):
+    async def async_get_sound_modes(self, bypass_cache: bool = False):
         """Returns a dictionary of available sound modes, or None if not retrieved."""
-        r = await self.async_getReq(BEOPLAY_URL_GET_SOUND_MODE)
+        r = await self.async_getReq(BEOPLAY_URL_GET_SOUND_MODE, bypass_cache)
         if r:
-            r = r.get("mode", {"list": []})
-            l = r.get("list", [])
-            a = r.get("active", None)
-            for element in l:
-                self._soundModes[element["friendlyName"]] = element["id"]
-                if a and a == element["id"]:
-                    self._soundMode = element["friendlyName"]
-            return self._soundModes
+            return self._processSoundModes(r)
         return
+
+    def _processSoundModes(self, r):
+        """Store the sound modes, and the active one, of a Sound mode response."""
+        r = r.get("mode", {"list": []})
+        l = r.get("list", [])
+        a = r.get("active", None)
+        soundModes = {}
+        for element in l:
+            soundModes[element["friendlyName"]] = element["id"]
+            if a and a == element["id"]:
+                self._soundMode = element["friendlyName"]
+        self._soundModes = soundModes
+        return self._soundModes
     
     async def async_get_stand_position(self):
         """Returns the stand position, or None if not retrieved."""
@@ -335,46 +846,143 @@ class BeoPlay(object):
             return self._standPosition
         return
 
-    async def async_get_stand_positions(self):
+    async def async_get_stand_positions(self, bypass_cache: bool = False):
         """Returns a list of available stand positions, or None if not retrieved."""
         # clear previous stand positions
         self._standPositions = {}
-        r = await self.async_getReq(BEOPLAY_URL_STAND)
+        r = await self.async_getReq(BEOPLAY_URL_STAND, bypass_cache)
+        return self._processStandPositions(r)
+
+    def _processStandPositions(self, r):
+        """Store the stand positions of a Stand response."""
         if r and "stand" in r:
             if r["stand"] is not None:
-                for elements in r["stand"]["list"]:
-                    self._standPositions[elements["friendlyName"]] = elements["id"]
+                self._standPositions = {
+                    elements["friendlyName"]: elements["id"]
+                    for elements in r["stand"]["list"]
+                }
                 return self._standPositions
         return
 
-    async def async_get_device_info(self):
+    async def async_get_device_info(self, bypass_cache: bool = False):
         """Returns a tuple serialNumber, name, typeNumber, itemNumber"""
-        r = await self.async_getReq("BeoDevice")
+        r = await self.async_getReq(BEOPLAY_URL_DEVICE, bypass_cache)
         if r:
-            self._serialNumber = r["beoDevice"]["productId"]["serialNumber"]
-            self._name = r["beoDevice"]["productFriendlyName"]["productFriendlyName"]
-            self._typeNumber = r["beoDevice"]["productId"]["typeNumber"]
-            self._itemNumber = r["beoDevice"]["productId"]["itemNumber"]
-            self._softwareVersion = r["beoDevice"]["software"]["version"]
-            self._hardwareVersion = r["beoDevice"]["hardware"].get("version", "Unknown")
-            self._typeName = r["beoDevice"]["productId"]["productType"]
-            return self._serialNumber, self._name, self._typeNumber, self._itemNumber
+            return self._processDeviceInfo(r)
         return
 
+    def _processDeviceInfo(self, r):
+        """Store the device information of a BeoDevice response."""
+        self._serialNumber = r["beoDevice"]["productId"]["serialNumber"]
+        self._name = r["beoDevice"]["productFriendlyName"]["productFriendlyName"]
+        self._typeNumber = r["beoDevice"]["productId"]["typeNumber"]
+        self._itemNumber = r["beoDevice"]["productId"]["itemNumber"]
+        self._softwareVersion = r["beoDevice"]["software"]["version"]
+        self._hardwareVersion = r["beoDevice"]["hardware"].get("version", "Unknown")
+        self._typeName = r["beoDevice"]["productId"]["productType"]
+        return self._serialNumber, self._name, self._typeNumber, self._itemNumber
+
+    # Metadata endpoint -> parser of its response
+    _METADATA_PARSERS = {
+        BEOPLAY_URL_DEVICE: _processDeviceInfo,
+        BEOPLAY_URL_GET_SOURCES: _processSources,
+        BEOPLAY_URL_GET_SOUND_MODE: _processSoundModes,
+        BEOPLAY_URL_STAND: _processStandPositions,
+    }
+
+    def _loadMetadata(self) -> bool:
+        """Fill in the metadata saved in the metadata store, if any."""
+        entry = self._metadata.get(self._address)
+        if entry is None:
+            return False
+        for path, r in entry.responses.items():
+            parser = self._METADATA_PARSERS.get(path)
+            if parser is not None and r:
+                try:
+                    parser(self, r)
+                except (KeyError, TypeError, AttributeError):
+                    LOG.debug("Unexpected saved metadata for %s: %s", path, str(r))
+        return True
+
+    async def async_revalidate_metadata(self) -> bool:
+        """Check the metadata loaded from the metadata store against the device:
+        read the device information and, if the serial number or the software
+        version changed (or nothing was saved), read the sources, sound modes and
+        stand positions again and save them.
+        Returns True if the metadata was refreshed."""
+        store = self._metadata
+        if store is None:
+            return False
+        r = await self.async_getReq(BEOPLAY_URL_DEVICE, bypass_cache=True)
+        if not r:
+            return False
+        self._processDeviceInfo(r)
+        entry = store.get(self._address)
+        if (
+            entry is not None
+            and entry.serial == self._serialNumber
+            and entry.software == self._softwareVersion
+        ):
+            return False
+        LOG.info("Refreshing the metadata of %s", self._address)
+        paths = [path for path in METADATA_ENDPOINTS if path != BEOPLAY_URL_DEVICE]
+        results = await asyncio.gather(
+            *[self.async_getReq(path, bypass_cache=True) for path in paths]
+        )
+        responses = {BEOPLAY_URL_DEVICE: r}
+        # the responses not read keep their previous values, saved ones included
+        saved = {}
+        if entry is not None and entry.serial == self._serialNumber:
+            saved = entry.responses
+        for path, result in zip(paths, results):
+            if result:
+                responses[path] = result
+                self._METADATA_PARSERS[path](self, result)
+            elif path in saved:
+                responses[path] = saved[path]
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            store.put,
+            self._address,
+            self._serialNumber,
+            self._softwareVersion,
+            responses,
+        )
+        return True
+
     ###############################################################
     # COMMANDS - Non Blocking
     ###############################################################
 
+    def _channel(self, name, send) -> LatestValueChannel:
+        # channels are bound to their loop: the blocking calls have their own
+        key = (name, True) if self._inBackground() else name
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = LatestValueChannel(send, self._command_rate)
+            self._channels[key] = channel
+        return channel
+
+    async def _async_send_volume(self, volume):
+        return await self.async_postReq("PUT", BEOPLAY_URL_SET_VOLUME, {"level": volume})
+
+    async def _async_send_mute(self, mute):
+        return await self.async_postReq("PUT", BEOPLAY_URL_MUTE, {"muted": mute})
+
+    async def _async_send_stand_position(self, standPositionID):
+        return await self.async_postReq("PUT", BEOPLAY_URL_STAND_ACTIVE, {"active": standPositionID})
+
     async def async_set_volume(self, volume):
+        """Set the volume (0.0 - 1.0). When called faster than command_rate, only
+        the latest volume is sent."""
         self.volume = volume
         volume = int(volume * 100)
-        await self.async_postReq("PUT", BEOPLAY_URL_SET_VOLUME, {"level": volume})
+        await self._channel("volume", self._async_send_volume).submit(volume)
 
     async def async_set_mute(self, mute):
-        if mute:
-            await self.async_postReq("PUT", BEOPLAY_URL_MUTE, {"muted": True})
-        else:
-            await self.async_postReq("PUT", BEOPLAY_URL_MUTE, {"muted": False})
+        """Set mute on or off. When called faster than command_rate, only the
+        latest value is sent."""
+        await self._channel("mute", self._async_send_mute).submit(bool(mute))
 
     async def async_play(self):
         await self.async_postReq("POST", BEOPLAY_URL_PLAY, {})
@@ -417,16 +1025,18 @@ class BeoPlay(object):
             self.on = True
 
     async def async_set_source(self, source):
-        i = 0
-        while i < len(self.sources):
-            if self.sources[i] == source:
-                chosenSource = self.sourcesID[i]
-                await self.async_postReq(
-                    "POST",
-                    BEOPLAY_URL_ACTIVE_SOURCES,
-                    {"primaryExperience": {"source": {"id": chosenSource}}},
-                )
-            i += 1
+        """Select a source, by friendly name (the device's own source, if several
+        have that name) or by id. Returns True if accepted, False if there is no
+        such source (see async_get_sources)."""
+        chosenSource = self._sources.by_name(source) or self._sources.get(source)
+        if chosenSource is None:
+            LOG.debug("Unknown source %s on %s", source, self._address)
+            return False
+        return await self.async_postReq(
+            "POST",
+            BEOPLAY_URL_ACTIVE_SOURCES,
+            {"primaryExperience": {"source": {"id": chosenSource.id}}},
+        )
 
     async def async_set_sound_mode(self, soundMode):
         # get sound modes if not already done
@@ -450,13 +1060,73 @@ class BeoPlay(object):
 
         standPositionID = self._standPositions.get(standPosition, None)
 
-        await self.async_postReq("PUT", BEOPLAY_URL_STAND_ACTIVE, {"active": standPositionID})
+        await self._channel("stand", self._async_send_stand_position).submit(standPositionID)
 
     async def async_join_experience(self):
-        await self.async_postReq("POST", BEOPLAY_URL_JOIN_EXPERIENCE)
+        """Join the latest experience of the network. Returns True if accepted."""
+        return await self.async_postReq("POST", BEOPLAY_URL_JOIN_EXPERIENCE)
 
     async def async_leave_experience(self):
-        await self.async_postReq("DELETE", BEOPLAY_URL_LEAVE_EXPERIENCE)
+        """Leave the current experience. Returns True if accepted."""
+        return await self.async_postReq("DELETE", BEOPLAY_URL_LEAVE_EXPERIENCE)
+
+    def _waitFor(self, predicate) -> asyncio.Future:
+        """Return a future resolved when predicate(self) becomes true after a
+        notification (or immediately, if it already is)."""
+        future = asyncio.get_running_loop().create_future()
+        if predicate(self):
+            future.set_result(True)
+        else:
+            self._waiters.append((predicate, future))
+        return future
+
+    def _wakeWaiters(self):
+        waiting = []
+        for predicate, future in self._waiters:
+            if future.done():
+                continue
+            try:
+                reached = predicate(self)
+            except Exception as _e:
+                future.set_exception(_e)
+                continue
+            if reached:
+                future.set_result(True)
+            else:
+                waiting.append((predicate, future))
+        self._waiters = waiting
+
+    def subscribe(
+        self,
+        types=None,
+        maxsize: int = SUBSCRIBER_QUEUE_SIZE,
+        overflow: str = OVERFLOW_DROP_OLDEST,
+    ) -> Subscription:
+        """Subscribe to the notifications received by the notification streams of
+        the device (see async_notificationsTask, NotificationSupervisor). Returns an
+        async iterator over the notifications, with its own bounded queue; close it
+        (or use it in a with block) to unsubscribe. It is consumed on the event loop
+        it is created on, including the notifications of the stream of the
+        blocking API (see startNotifications), handed over from the background loop.
+        types: the notification types received (e.g. {"VOLUME", "SOURCE"}), or None
+        for all
+        maxsize: the number of notifications queued for this subscriber
+        overflow: OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST (the stream never waits
+        for the subscriber), or OVERFLOW_BLOCK (no notification is lost, the stream
+        waits until the subscriber catches up)
+        """
+        return self._hub.subscribe(types, maxsize, overflow)
+
+    async def async_wait_for(self, predicate, timeout: Optional[float] = None):
+        """Wait until predicate(self) is true, checking it after every notification
+        received. A notification stream must be running (see async_notificationsTask).
+        Raises asyncio.TimeoutError after timeout seconds."""
+        future = self._waitFor(predicate)
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            if not future.done():
+                future.cancel()
 
     async def async_play_queue_item(self, instantplay: bool, queueItem: dict):
         """Play a queue item, from Deezer, TuneIn or DLNA.
@@ -527,417 +1197,501 @@ class BeoPlay(object):
     async def async_digits(self, digit : str):
         """
         Send a digit keypress to the device. Digits are 0-9  
+        Several digits ("99") are sent one after the other, key_delay apart.
 
         """
+        if len(digit) > 1 and digit.isdigit():
+            await self.async_run_macro([digit])
+            return
         if (digit not in BEOPLAY_DIGITS):
             return
         await self.async_postReq("POST", BEOPLAY_DIGITS_URL, {BEOPLAY_DIGITS_KEY: int(digit)})
 
+    @staticmethod
+    def _macroKeys(steps) -> list:
+        """Translate macro steps into a list of (path, data, delay) key presses."""
+        keys = []
+        for step in steps:
+            delay = None
+            if isinstance(step, tuple):
+                step, delay = step
+            if step in BEOPLAY_REMOTE_COMMANDS:
+                keys.append(
+                    (BEOPLAY_REMOTE_PREFIX + step, {"toBeReleased": False}, delay)
+                )
+            elif isinstance(step, str) and step.isdigit():
+                for digit in step:
+                    keys.append((BEOPLAY_DIGITS_URL, {BEOPLAY_DIGITS_KEY: int(digit)}, delay))
+            else:
+                raise ValueError("Unknown macro step: {0}".format(step))
+        return keys
+
+    async def async_run_macro(self, steps, key_delay: Optional[float] = None) -> int:
+        """Send a sequence of remote commands and digits, one key at a time.
+        steps: a list of remote commands (see async_remote_command) and digit
+        strings ("123" sends 1, 2 and 3). A step can be a tuple (step, delay) to
+        wait delay seconds after it instead of key_delay.
+        key_delay: seconds between the start of two keys (defaults to the
+        key_delay attribute of the device). The round trip of a key counts
+        towards the delay.
+        The keys are sent in sequence over the kept-alive connection of the
+        session. Cancelling the task running the macro stops it before the next key.
+        Raises ValueError, without sending anything, if a step is unknown.
+        Returns the number of keys accepted by the device (the macro stops at the
+        first key refused).
+        """
+        keys = self._macroKeys(steps)
+        if key_delay is None:
+            key_delay = self.key_delay
+        loop = asyncio.get_running_loop()
+        sent = 0
+        for i, (path, data, delay) in enumerate(keys):
+            start = loop.time()
+            if not await self.async_postReq("POST", path, data):
+                LOG.info("Macro key %s refused by %s", path, self._name)
+                break
+            sent += 1
+            if i < len(keys) - 1 or delay is not None:
+                wait = key_delay if delay is None else delay
+                await asyncio.sleep(max(0.0, start + wait - loop.time()))
+        return sent
+
+    async def async_enter_channel(self, number, confirm: bool = False) -> bool:
+        """Enter a channel number, one digit at a time.
+        number: the channel number, as an int or a string of digits
+        confirm: send Cursor/Select after the digits
+        Returns True if all the keys were accepted."""
+        number = str(number)
+        if not number.isdigit():
+            raise ValueError("Invalid channel number: {0}".format(number))
+        steps = [number, "Cursor/Select"] if confirm else [number]
+        return await self.async_run_macro(steps) == len(number) + (1 if confirm else 0)
+
 
     ###############################################################
-    # REQUESTS (BLOCKING) NETWORK CALLS
+    # BLOCKING CALLS
+    # Thin wrappers running the async calls on the background loop
     ###############################################################
 
-    def _getReq(self, path):
+    @property
+    def background(self) -> BackgroundLoop:
+        """Return the background loop running the blocking calls."""
+        if self._background is None:
+            self._background = get_background_loop()
+        return self._background
+
+    def _run(self, coro, default=None):
+        """Run a coroutine on the background loop and return its result. Network
+        errors are logged and return default, as the blocking calls never raise them."""
         try:
-            if self._connfail:
-                LOG.debug("Connfail: %i", self._connfail)
-                self._connfail -= 1
-                return False
-            r = requests.get(BASE_URL.format(self._host, path), timeout=TIMEOUT)
-            if r.status_code != 200:
-                return None
-            return json.loads(r.text)
-        except requests.exceptions.RequestException as err:
-            LOG.debug("Exception: %s", str(err))
-            self._connfail = CONNFAILCOUNT
-            return None
+            return self.background.run(coro)
+        except (asyncio.TimeoutError, aiohttp.ClientError) as _e:
+            LOG.debug("Exception: %s", str(_e))
+            return default
+
+    def close(self):
+        """Stop the notification stream of the blocking API, if started."""
+        if self._backgroundSupervisor is not None:
+            supervisor = self._backgroundSupervisor
+            self._backgroundSupervisor = None
+            self.background.run(supervisor.async_stop())
+
+    def _getReq(self, path, bypass_cache: bool = False):
+        return self._run(self.async_getReq(path, bypass_cache))
 
     def _postReq(self, type, path, data: dict = {}):
-        try:
-            r = None
-            if self._connfail:
-                LOG.debug("Connfail: %i", self._connfail)
-                self._connfail -= 1
-                return False
-            if type == "PUT":
-                r = requests.put(
-                    BASE_URL.format(self._host, path),
-                    json=data,
-                    timeout=TIMEOUT,
-                )
-            elif type == "POST":
-                if data is None or data == "":
-                    r = requests.post(
-                        BASE_URL.format(self._host, path), timeout=TIMEOUT
-                    )
-                else:
-                    r = requests.post(
-                        BASE_URL.format(self._host, path),
-                        json=data,
-                        timeout=TIMEOUT,
-                    )
-            elif type == "DELETE":
-                r = requests.delete(BASE_URL.format(self._host, path), timeout=TIMEOUT)
-            if r:
-                LOG.debug("Response: %s", r.content)
-                if r.status_code == 200:
-                    return True
-            return False
-        except requests.exceptions.RequestException as err:
-            LOG.debug("Exception: %s", str(err))
-            self._connfail = CONNFAILCOUNT
-            return False
+        return self._run(self.async_postReq(type, path, data), False)
+
+    def startNotifications(self, callback=None, change_callback=None, **kwargs):
+        """Start a supervised notification stream on the background loop, that
+        keeps the state of the object up to date. The callbacks are called from
+        the thread of the background loop.
+        callback: a function called with every notification
+        change_callback: a function called with the state fields changed by a
+        notification
+        kwargs: passed to NotificationSupervisor
+        """
+        if self._backgroundSupervisor is not None:
+            return self._backgroundSupervisor
+
+        async def start():
+            supervisor = NotificationSupervisor(
+                self, callback=callback, change_callback=change_callback, **kwargs
+            )
+            supervisor.start()
+            return supervisor
+
+        self._backgroundSupervisor = self.background.run(start())
+        return self._backgroundSupervisor
+
+    def stopNotifications(self):
+        """Stop the notification stream started by startNotifications."""
+        self.close()
 
     ###############################################################
     # GET ATTRIBUTES FROM THE SPEAKER - BLOCKING CALLS
     ###############################################################
 
-    # edited to only include in Use sources
-    def getSources(self):
-        r = self._getReq(BEOPLAY_URL_GET_SOURCES)
-        if r:
-            for elements in r:
-                i = 0
-                while i < len(r[elements]):
-                    if r[elements][i][1]["inUse"] == True:
-                        self.sourcesBorrowed.append(r[elements][i][1]["borrowed"])
-                        self.sources.append(r[elements][i][1]["friendlyName"])
-                        self.sourcesID.append(r[elements][i][0])
-                    i += 1
+    def getSources(self, bypass_cache: bool = False):
+        return self._run(self.async_get_sources(bypass_cache))
 
     def getSource(self):
-        self.source = None
-        r = self._getReq(BEOPLAY_URL_ACTIVE_SOURCES)
-        if r:
-            self.source = r["primaryExperience"]["source"]["friendlyName"] if "friendlyName" in r["primaryExperience"]["source"] else None
-            self.listeners = [listener["jid"] for listener in r["primaryExperience"]["listenerList"]["listener"]] if "listenerList" in r["primaryExperience"] else []
-        return self.source
+        return self._run(self.async_get_source())
 
     def getStandby(self):
-        r = self._getReq(BEOPLAY_URL_STANDBY)
-        if r:
-            if r["standby"]["powerState"] == "on":
-                self.on = True
-            else:
-                self.on = False
+        return self._run(self.async_get_standby(), False)
 
     def getSoundMode(self):
-        """ Get sound mode. Return the current active sound mode or None if not retreived."""
-        self._soundMode = None
-        self.getSoundModes()
-        return self._soundMode
+        """ Get sound mode. Return the current active sound mode or None if not retreived.
+        The active mode is always read from the device, not from the cache."""
+        return self._run(self.async_get_sound_mode())
 
-    def getSoundModes(self):
+    def getSoundModes(self, bypass_cache: bool = False):
         """ Get sound modes. You need to call this before reading soundMode or soundModes."""
-        r = self._getReq(BEOPLAY_URL_GET_SOUND_MODE)
-        if r:
-            r = r.get("mode", {"list": []})
-            l = r.get("list", [])
-            a = r.get("active", None)
-            for element in l:
-                self._soundModes[element["friendlyName"]] = element["id"]
-                if a and a == element["id"]:
-                    self._soundMode = element["friendlyName"]
-            return self._soundModes
-        return None
+        return self._run(self.async_get_sound_modes(bypass_cache))
 
     def getStandPosition(self):
-        self._standPosition = None
-        r = self._getReq(BEOPLAY_URL_STAND_ACTIVE)
-        if r and "active" in r:
-            if r["active"] is not None:
-                self._standPosition = r["active"] 
-            return self._standPosition
-        return None
+        return self._run(self.async_get_stand_position())
 
-    def getStandPositions(self):
-        self._standPositions = {}
-        r = self._getReq(BEOPLAY_URL_STAND)
-        if r and "stand" in r:
-            if r["stand"] is not None:
-                for elements in r["stand"]["list"]:
-                    self._standPositions[elements["friendlyName"]] = elements["id"]
-                return self._standPositions
-        return
+    def getStandPositions(self, bypass_cache: bool = False):
+        return self._run(self.async_get_stand_positions(bypass_cache))
+
+    def getDeviceInfo(self, bypass_cache: bool = False):
+        return self._run(self.async_get_device_info(bypass_cache))
 
-    def getDeviceInfo(self):
-        r = self._getReq("BeoDevice")
-        if r:
-            self._serialNumber = r["beoDevice"]["productId"]["serialNumber"]
-            self._name = r["beoDevice"]["productFriendlyName"]["productFriendlyName"]
-            self._typeNumber = r["beoDevice"]["productId"]["typeNumber"]
-            self._itemNumber = r["beoDevice"]["productId"]["itemNumber"]
-            self._softwareVersion = r["beoDevice"]["software"]["version"]
-            self._hardwareVersion = r["beoDevice"]["hardware"]["version"]
-            self._typeName = r["beoDevice"]["productId"]["productType"]
     ###############################################################
     # COMMANDS - Blocking
     ###############################################################
 
     def setVolume(self, volume):
-        self.volume = volume
-        volume = int(volume * 100)
-        self._postReq("PUT", BEOPLAY_URL_SET_VOLUME, {"level": volume})
+        self._run(self.async_set_volume(volume))
 
     def setMute(self, mute):
-        if mute:
-            self._postReq("PUT", BEOPLAY_URL_MUTE, {"muted": True})
-        else:
-            self._postReq("PUT", BEOPLAY_URL_MUTE, {"muted": False})
+        self._run(self.async_set_mute(mute))
 
     def Play(self):
-        self._postReq("POST", BEOPLAY_URL_PLAY, {})
+        self._run(self.async_play())
 
     def Pause(self):
-        self._postReq("POST", BEOPLAY_URL_PAUSE, {})
+        self._run(self.async_pause())
 
     def Stop(self):
-        self._postReq("POST", BEOPLAY_URL_STOP, {})
+        self._run(self.async_stop())
 
     def StepUp(self):
-        self._postReq("POST", BEOPLAY_URL_STEPUP, {})
+        self._run(self.async_stepup())
 
     def StepDown(self):
-        self._postReq("POST", BEOPLAY_URL_STEPDOWN, {})
+        self._run(self.async_stepdown())
 
     def Forward(self):
-        self._postReq("POST", BEOPLAY_URL_FORWARD, {})
+        self._run(self.async_forward())
 
     def Backward(self):
-        self._postReq("POST", BEOPLAY_URL_BACKWARD, {})
+        self._run(self.async_backward())
 
     def Repeat(self):
-        self._postReq("POST", BEOPLAY_URL_REPEAT, {})
+        self._run(self.async_repeat())
 
     def Shuffle(self):
-        self._postReq("POST", BEOPLAY_URL_SHUFFLE, {})
+        self._run(self.async_shuffle())
 
     def Standby(self):
-        self._postReq(
-            "PUT", BEOPLAY_URL_STANDBY, {"standby": {"powerState": "standby"}}
-        )
-        self.on = False
+        self._run(self.async_standby())
 
     def turnOn(self):
         """Turn on the device. There is no such thing as an "on" command on B&O 
         equipment, so just select the first source, if it exists."""
-        if len(self.sources)>0:
-            self.setSource(self.sources[0])
-            self.on = True
+        self._run(self.async_turn_on())
 
-    def setSource(self, source):
-        i = 0
-        while i < len(self.sources):
-            if self.sources[i] == source:
-                chosenSource = self.sourcesID[i]
-                self._postReq(
-                    "POST",
-                    BEOPLAY_URL_ACTIVE_SOURCES,
-                    {"primaryExperience": {"source": {"id": chosenSource}}},
-                )
-            i += 1
+    def setSource(self, source) -> bool:
+        return self._run(self.async_set_source(source), False)
 
     def setSoundMode(self, soundMode):
-        """Get sound modes if not already done."""
-        if not self._soundModes:
-            self.getSoundModes()
-        
-        if soundMode not in self._soundModes:
-            raise ValueError("Sound mode not available")
-        
-        soundModeId = self._soundModes[soundMode]
-        
-        self._postReq("PUT", BEOPLAY_URL_SET_SOUND_MODE, {"active": soundModeId})
+        self._run(self.async_set_sound_mode(soundMode))
 
     def setStandPosition(self, standPosition):
-        """Get sound modes if not already done."""
-        if not self._standPositions:
-            self.getStandPositions()
-        
-        if standPosition not in self._standPositions:
-            raise ValueError("Stand position not available")
-
-        standPositionID = self._standPositions.get(standPosition)
-
-        self._postReq("PUT", BEOPLAY_URL_STAND_ACTIVE, {"active": standPositionID})
+        self._run(self.async_set_stand_position(standPosition))
 
     def joinExperience(self):
-        self._postReq("POST", BEOPLAY_URL_JOIN_EXPERIENCE, {})
+        return self._run(self.async_join_experience(), False)
 
     def leaveExperience(self):
-        self._postReq("DELETE", BEOPLAY_URL_LEAVE_EXPERIENCE, {})
+        return self._run(self.async_leave_experience(), False)
 
     def playQueueItem(self, instantplay: bool, queueItem: dict):
-        if instantplay:
-            self._postReq(
-                "POST", BEOPLAY_URL_PLAYQUEUE + BEOPLAY_URL_PLAYQUEUE_INSTANT, queueItem
-            )
-        else:
-            self._postReq("POST", BEOPLAY_URL_PLAYQUEUE, queueItem)
+        self._run(self.async_play_queue_item(instantplay, queueItem))
+
+    def remoteCommand(self, command: str, toBeReleased: bool = False):
+        self._run(self.async_remote_command(command, toBeReleased))
+
+    def remoteRelease(self, command: str):
+        self._run(self.async_remote_release(command))
+
+    def runMacro(self, steps, key_delay: Optional[float] = None) -> int:
+        return self._run(self.async_run_macro(steps, key_delay), 0)
+
+    def enterChannel(self, number, confirm: bool = False) -> bool:
+        return self._run(self.async_enter_channel(number, confirm), False)
 
     ###############################################################
     # PARSE NOTIFICATIONS MESSAGES
     ###############################################################
 
-    def _processVolume(self, data):
-        if (
-            data["notification"]["type"] == "VOLUME"
-            and data["notification"]["data"] is not None
-        ):
-            self.volume = int(data["notification"]["data"]["speaker"]["level"]) / 100
-            self.min_volume = (
-                int(data["notification"]["data"]["speaker"]["range"]["minimum"]) / 100
-            )
-            self.max_volume = (
-                int(data["notification"]["data"]["speaker"]["range"]["maximum"]) / 100
-            )
-            self.muted = data["notification"]["data"]["speaker"]["muted"]
-
-    def _processSource(self, data):
-        if (
-            data["notification"]["type"] == "SOURCE"
-            and data["notification"]["data"] is not None
-        ):
-            if not data["notification"]["data"]:
-                self.source = None
-                self.state = None
-                self.on = False
+    # The handlers read the notification dicts directly, on the hot path of the
+    # notification stream. The typed events of events.py give the same values to
+    # the history and the subscribers.
+
+    def _processVolume(self, notification):
+        data = notification.get("data")
+        if data is not None:
+            speaker = data["speaker"]
+            range = speaker["range"]
+            st = self._snapshot
+            st.volume = int(speaker["level"]) / 100
+            st.min_volume = int(range["minimum"]) / 100
+            st.max_volume = int(range["maximum"]) / 100
+            st.muted = speaker["muted"]
+
+    def _processSource(self, notification):
+        data = notification.get("data")
+        if data is not None:
+            st = self._snapshot
+            if not data:
+                st.source = None
+                st.state = None
+                st.on = False
+                st.listeners = []
             else:
-                self.source = data["notification"]["data"]["primaryExperience"][
-                    "source"
-                ]["friendlyName"]
-                self.state = data["notification"]["data"]["primaryExperience"]["state"]
-                self.on = True
-            self.media_url = None
-            self.media_track = None
-            self.media_artist = None
-            self.media_album = None
-            self.media_genre = None
-            self.media_country = None
-            self.media_languages = None
+                primaryExperience = data["primaryExperience"]
+                source = primaryExperience["source"]
+                st.source = source["friendlyName"]
+                st.state = primaryExperience["state"]
+                st.on = True
+                self._updateSource(source)
+                listeners = primaryExperience.get("listener")
+                if listeners is not None:
+                    st.listeners = listeners
+            self._clearMediaInfo()
 
 #    def _processPrimaryExperience(self, data):
 #        if data["notification"]["type"] == "SOURCE":
 #            self.primary_experience = data["primary"]
 
-    def _processSourceExperienceChanged(self, data):
-        if data["notification"]["type"] == "SOURCE_EXPERIENCE_CHANGED":
-            self.listeners = data["notification"]["data"]["primaryExperience"]["listener"]
+    def _updateSource(self, source):
+        """Add (or update) a source seen in a notification to the registry."""
+        if not source.get("inUse", True) or "id" not in source:
+            return
+        known = self._sources.get(source["id"])
+        borrowed = source.get("borrowed")
+        if known is not None:
+            # the usual case: a source already known, unchanged
+            if known.name == source.get("friendlyName") and (
+                borrowed is None or borrowed == known.borrowed
+            ):
+                return
+            if borrowed is None:
+                borrowed = known.borrowed
+        elif borrowed is None:
+            jid = (source.get("product") or {}).get("jid")
+            borrowed = jid is not None and self.jid is not None and jid != self.jid
+        try:
+            self._sources.add(Source.from_json(source, borrowed))
+        except KeyError:
+            LOG.debug("Unexpected source: %s", str(source))
 
-    def _processState(self, data):
+    def _processSourceExperienceChanged(self, notification):
+        data = notification.get("data")
+        if not data:
+            self._snapshot.listeners = []
+            return
+        listeners = data["primaryExperience"].get("listener")
+        if listeners is not None:
+            self._snapshot.listeners = listeners
+
+    def _processState(self, notification):
         """Progress information provides info about the current state of play. 
         It is only reliable if the device is on. """
-        if (
-            data["notification"]["type"] == "PROGRESS_INFORMATION"
-            and data["notification"]["data"] is not None
-        ):
-            self.state = data["notification"]["data"]["state"]
+        data = notification.get("data")
+        if data is not None:
+            self._snapshot.state = data["state"]
 #            self.on = True
 
-    def _processMusicInfo(self, data):
-        if data["notification"]["type"] == "NOW_PLAYING_STORED_MUSIC":
-            if data["notification"]["data"]["trackImage"]:
-                self.media_url = data["notification"]["data"]["trackImage"][0]["url"]
-            else:
-                self.media_url = None
-            self.media_artist = data["notification"]["data"]["artist"]
-            self.media_album = data["notification"]["data"]["album"]
-            self.media_track = data["notification"]["data"]["name"]
-            self.media_genre = data["notification"]["data"]["genre"]
-            self.media_country = None
-            self.media_languages = None
-
-        elif data["notification"]["type"] == "NOW_PLAYING_STORED_VIDEO":     
-            self.media_url = None
-            self.media_artist = None
-            self.media_album = None
-            self.media_track = data["notification"]["data"]["name"]
-            self.media_genre = None
-            self.media_country = None
-            self.media_languages = None
-
-        elif data["notification"]["type"] == "NOW_PLAYING_NET_RADIO":
-            self.media_url = None
-            self.media_artist = None
-            self.media_album = None
-            self.media_genre = None
-            self.media_country = None
-            self.media_languages = None
-            if (
-                "image" in data["notification"]["data"]
-                and data["notification"]["data"]["image"]
-            ):
-                self.media_url = data["notification"]["data"]["image"][0]["url"]
-                self.media_url = self.media_url.replace(
-                    ".:8080/", ":8080/"
-                )  # some B&O devices provide a hostname with trailing '.' which doesn't resolve
-            if "name" in data["notification"]["data"]:
-                self.media_artist = data["notification"]["data"]["name"]
-            if "liveDescription" in data["notification"]["data"]:
-                self.media_track = data["notification"]["data"]["liveDescription"]
-            if "genre" in data["notification"]["data"]:
-                self.media_genre = data["notification"]["data"]["genre"]
-            if "country" in data["notification"]["data"]:
-                self.media_country = data["notification"]["data"]["country"]
-            if "languages" in data["notification"]["data"]["languages"]:
-                self.media_languages = data["notification"]["data"]["languages"]
-
-        elif data["notification"]["type"] == "NOW_PLAYING_LEGACY":
-            self.media_url = None
-            self.media_artist = None
-            self.media_album = None
-            self.media_genre = None
-            self.media_country = None
-            self.media_languages = None
-            self.media_track = str(data["notification"]["data"]["trackNumber"])
-            if data["notification"]["kind"] == "playing":
-                self.on = True
-            else:
-                self.on = False
-            self.state = data["notification"]["kind"]
-
-        elif data["notification"]["type"] == "NOW_PLAYING_ENDED":
-            self.media_url = None
-            self.media_artist = None
-            self.media_album = None
-            self.media_genre = None
-            self.media_country = None
-            self.media_languages = None
-            self.media_track = None
-
-        elif data["notification"]["type"] == "NUMBER_AND_NAME":
-            self.media_url = None
-            self.media_artist = None
-            self.media_album = None
-            self.media_genre = None
-            self.media_country = None
-            self.media_languages = None
-            self.media_track = (
-                str(data["notification"]["data"]["number"])
-                + ". "
-                + data["notification"]["data"]["name"]
-            )
-
-    def _processSoundMode(self, data):
-        if data["notification"]["type"] == "SOUND_ACTIVE_MODE_CHANGED":
-            self._soundMode = data["notification"]["data"]["friendlyName"]
-
+    def _clearMediaInfo(self):
+        st = self._snapshot
+        st.media_url = None
+        st.media_track = None
+        st.media_artist = None
+        st.media_album = None
+        st.media_genre = None
+        st.media_country = None
+        st.media_languages = None
+
+    def _processStoredMusic(self, notification):
+        data = notification["data"]
+        images = data["trackImage"]
+        st = self._snapshot
+        st.media_url = images[0]["url"] if images else None
+        st.media_artist = data["artist"]
+        st.media_album = data["album"]
+        st.media_track = data["name"]
+        st.media_genre = data["genre"]
+        st.media_country = None
+        st.media_languages = None
+
+    def _processStoredVideo(self, notification):
+        self._clearMediaInfo()
+        self._snapshot.media_track = notification["data"]["name"]
+
+    def _processNetRadio(self, notification):
+        data = notification["data"]
+        images = data.get("image")
+        st = self._snapshot
+        # some B&O devices provide a hostname with trailing '.' which doesn't resolve
+        st.media_url = images[0]["url"].replace(".:8080/", ":8080/") if images else None
+        st.media_artist = data.get("name")
+        st.media_track = data.get("liveDescription")
+        st.media_album = None
+        st.media_genre = data.get("genre")
+        st.media_country = data.get("country")
+        st.media_languages = data.get("languages")
+
+    def _processLegacy(self, notification):
+        trackNumber = notification["data"]["trackNumber"]
+        kind = notification["kind"]
+        st = self._snapshot
+        self._clearMediaInfo()
+        st.media_track = str(trackNumber)
+        st.on = kind == "playing"
+        st.state = kind
+
+    def _processNowPlayingEnded(self, notification):
+        self._clearMediaInfo()
+
+    def _processNumberAndName(self, notification):
+        data = notification["data"]
+        track = str(data["number"]) + ". " + data["name"]
+        self._clearMediaInfo()
+        self._snapshot.media_track = track
+
+    def _processSoundMode(self, notification):
+        self._snapshot.soundMode = notification["data"]["friendlyName"]
+
+    # Notification type -> handler. Each handler is called as handler(beoplay, notification),
+    # where notification is the content of the "notification" key of the message.
+    _NOTIFICATION_HANDLERS = {
+        "VOLUME": _processVolume,
+        "SOURCE": _processSource,
+        "SOURCE_EXPERIENCE_CHANGED": _processSourceExperienceChanged,
+        "PROGRESS_INFORMATION": _processState,
+        "NOW_PLAYING_STORED_MUSIC": _processStoredMusic,
+        "NOW_PLAYING_STORED_VIDEO": _processStoredVideo,
+        "NOW_PLAYING_NET_RADIO": _processNetRadio,
+        "NOW_PLAYING_LEGACY": _processLegacy,
+        "NOW_PLAYING_ENDED": _processNowPlayingEnded,
+        "NUMBER_AND_NAME": _processNumberAndName,
+        "SOUND_ACTIVE_MODE_CHANGED": _processSoundMode,
+    }
+    # never modified: register_default_notification_handler replaces the class table
+    _BUILTIN_NOTIFICATION_HANDLERS = _NOTIFICATION_HANDLERS
+
+    # Notification type -> state fields its built-in handler may change, used to compute
+    # the change set. Notifications handled by any other handler (registered on the
+    # device or on the class) compare all the fields.
+    _MEDIA_FIELDS = (
+        "media_url",
+        "media_track",
+        "media_artist",
+        "media_album",
+        "media_genre",
+        "media_country",
+        "media_languages",
+    )
+    _NOTIFICATION_FIELDS = {
+        "VOLUME": ("volume", "min_volume", "max_volume", "muted"),
+        "SOURCE": ("source", "state", "on", "listeners") + _MEDIA_FIELDS,
+        "SOURCE_EXPERIENCE_CHANGED": ("listeners",),
+        "PROGRESS_INFORMATION": ("state",),
+        "NOW_PLAYING_STORED_MUSIC": _MEDIA_FIELDS,
+        "NOW_PLAYING_STORED_VIDEO": _MEDIA_FIELDS,
+        "NOW_PLAYING_NET_RADIO": _MEDIA_FIELDS,
+        "NOW_PLAYING_LEGACY": ("on", "state") + _MEDIA_FIELDS,
+        "NOW_PLAYING_ENDED": _MEDIA_FIELDS,
+        "NUMBER_AND_NAME": _MEDIA_FIELDS,
+        "SOUND_ACTIVE_MODE_CHANGED": ("soundMode",),
+    }
+    _FIELD_GETTERS = {
+        notificationType: (fields, field_getter(fields))
+        for notificationType, fields in _NOTIFICATION_FIELDS.items()
+    }
+    _ALL_FIELDS_GETTER = (STATE_FIELDS, field_getter(STATE_FIELDS))
+
+    @classmethod
+    def register_default_notification_handler(cls, notificationType: str, handler):
+        """Register a handler for a notification type on all BeoPlay objects created afterwards.
+        handler: a function called as handler(beoplay, notification), replacing the built-in
+        handler for that type, if any.
+        """
+        cls._NOTIFICATION_HANDLERS = dict(cls._NOTIFICATION_HANDLERS)
+        cls._NOTIFICATION_HANDLERS[notificationType] = handler
+
+    def register_notification_handler(self, notificationType: str, handler):
+        """Register a handler for a notification type (e.g. SHUTDOWN, NOW_PLAYING_STORED_PHOTO)
+        on this device.
+        handler: a function called as handler(beoplay, notification), replacing the built-in
+        handler for that type, if any. Pass None to remove the handler.
+        """
+        if not self._own_notification_handlers:
+            self._notification_handlers = dict(self._notification_handlers)
+            self._own_notification_handlers = True
+        if handler is None:
+            self._notification_handlers.pop(notificationType, None)
+        else:
+            self._notification_handlers[notificationType] = handler
 
-    def _processNotification(self, data):
-        """Cumulative process all the potential notification information."""
+    def _processNotification(self, data, trackChanges: bool = True) -> Optional[dict]:
+        """Process a notification message, dispatching it to the handler for its type.
+        Returns the dict field -> new value of the state fields that changed, or None
+        if trackChanges is False."""
         try:
-            # get volume
-            self._processVolume(data)
-            # get source
-            self._processSource(data)
-            # get source experience
-            self._processSourceExperienceChanged(data)
-            # get state
-            self._processState(data)
-            # get currently playing music info
-            self._processMusicInfo(data)
-            # get sound mode
-            self._processSoundMode(data)
-        except KeyError:
+            notification = data["notification"]
+            notificationType = notification["type"]
+        except (KeyError, TypeError):
             LOG.debug("Malformed notification: %s", str(data))
+            return {} if trackChanges else None
+        if self._cache is not None:
+            self._cache.invalidate_notification(self._address, notificationType)
+        if self._metrics is not None:
+            self._metrics.record_notification(self._address, notificationType)
+        if self._history is not None:
+            self._history.record(notification)
+        handler = self._notification_handlers.get(notificationType)
+        if handler is None:
+            return {} if trackChanges else None
+        if not trackChanges:
+            try:
+                handler(self, notification)
+            except (KeyError, TypeError):
+                LOG.debug("Malformed notification: %s", str(data))
+            if self._waiters:
+                self._wakeWaiters()
+            return None
+        if handler is self._BUILTIN_NOTIFICATION_HANDLERS.get(notificationType):
+            fields, getter = self._FIELD_GETTERS[notificationType]
+        else:
+            fields, getter = self._ALL_FIELDS_GETTER
+        st = self._snapshot
+        before = getter(st)
+        try:
+            handler(self, notification)
+        except (KeyError, TypeError):
+            LOG.debug("Malformed notification: %s", str(data))
+        if self._waiters:
+            self._wakeWaiters()
+        return diff(fields, before, getter(st))
+
+
+from .supervisor import NotificationSupervisor
+from .discovery import async_discover, async_discover_all
+from .fleet import BeoPlayFleet, FleetResult
+from .group import GroupError, async_join_group, async_leave_group
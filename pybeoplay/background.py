@@ -0,0 +1,126 @@
+"""
+
+Background event loop for the blocking API.
+
+The blocking methods of BeoPlay (getSources, setVolume...) are thin wrappers
+around the async ones: they submit the coroutine to an event loop running in a
+daemon thread and wait for its result. The loop owns one aiohttp session, so all
+the blocking calls of a process share one keep-alive connection pool, the same
+caches, circuit breakers and parsers as the async calls, and can run a
+notification stream.
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import threading
+
+
+from .const import *
+from .lazy import aiohttp
+
+
+LOG = logging.getLogger(__name__)
+
+
+class BackgroundLoop(object):
+    def __init__(self, pool_per_host: int = BACKGROUND_POOL_PER_HOST):
+        """An event loop running in a daemon thread, with its own aiohttp session.
+        It is started on the first call to run.
+        pool_per_host: maximum number of connections to one device
+        """
+        self._pool_per_host = pool_per_host
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._session = None
+
+    @property
+    def loop(self):
+        """Return the event loop, or None if not started."""
+        return self._loop
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Return the aiohttp session of the loop, or None if not started."""
+        return self._session
+
+    def is_current(self) -> bool:
+        """Return True if called from the thread of the loop."""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def start(self):
+        """Start the thread and the session, if not started yet."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="pybeoplay-loop", daemon=True
+            )
+            thread.start()
+            self._session = asyncio.run_coroutine_threadsafe(
+                self._create_session(), loop
+            ).result()
+            self._loop = loop
+            self._thread = thread
+
+    async def _create_session(self):
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=self._pool_per_host),
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+        )
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future."""
+        if self._thread is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and return its result (or raise its
+        exception). Must not be called from the loop itself."""
+        if self.is_current():
+            coro.close()
+            raise RuntimeError("Blocking call from the pybeoplay event loop")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stop(self):
+        """Close the session and stop the thread."""
+        with self._lock:
+            loop, thread, session = self._loop, self._thread, self._session
+            self._loop = self._thread = self._session = None
+        if thread is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(TIMEOUT)
+        except Exception as _e:
+            LOG.debug("Error closing the background session: %s", str(_e))
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(TIMEOUT)
+        if not thread.is_alive():
+            loop.close()
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Return the background loop shared by all the BeoPlay objects (created on
+    first use, and stopped when the interpreter exits)."""
+    global _background
+    if _background is None:
+        with _background_lock:
+            if _background is None:
+                _background = BackgroundLoop()
+                atexit.register(_background.stop)
+    return _background
@@ -0,0 +1,132 @@
+"""
+
+Per-host circuit breaker, shared by the blocking and the async request paths.
+
+After CIRCUIT_FAILURE_THRESHOLD consecutive connection failures the circuit of a
+host opens and every call fails immediately, instead of waiting for a full
+TIMEOUT. After CIRCUIT_RESET_TIMEOUT seconds the circuit becomes half-open and a
+single probe call is let through: if it succeeds the circuit closes, otherwise
+it opens again.
+
+"""
+
+import asyncio
+import threading
+import time
+
+from .const import *
+
+
+class CircuitOpenError(asyncio.TimeoutError):
+    """Raised by the async calls when the circuit of the host is open.
+    It is a subclass of asyncio.TimeoutError, which is what the call would
+    otherwise have raised after waiting for the timeout."""
+
+
+class CircuitBreaker(object):
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        """Circuit breaker for one host.
+        failure_threshold: consecutive failures that open the circuit
+        reset_timeout: seconds the circuit stays open before a probe is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = None
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        """Return the state of the circuit: closed, open or half_open."""
+        if (
+            self._state == CIRCUIT_OPEN
+            and self._clock() - self._opened_at >= self.reset_timeout
+        ):
+            return CIRCUIT_HALF_OPEN
+        return self._state
+
+    @property
+    def failures(self) -> int:
+        """Return the number of consecutive failures."""
+        return self._failures
+
+    @property
+    def retry_after(self) -> float:
+        """Return the seconds until the next probe is allowed (0 if closed)."""
+        if self._state == CIRCUIT_CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def allow(self) -> bool:
+        """Return True if a call can go through. In the half-open state only one
+        probe call at a time is allowed."""
+        if self._state == CIRCUIT_CLOSED:
+            return True
+        with self._lock:
+            now = self._clock()
+            if self._state == CIRCUIT_OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._state = CIRCUIT_HALF_OPEN
+            # half open: let one probe through. A probe that never reports back
+            # (e.g. cancelled) expires after reset_timeout.
+            if self._probe_at is not None and now - self._probe_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self._probe_at = now
+            return True
+
+    def record_success(self):
+        """Record a successful call: closes the circuit."""
+        if self._state == CIRCUIT_CLOSED and not self._failures:
+            return
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probe_at = None
+
+    def record_failure(self):
+        """Record a failed call: opens the circuit after enough failures, or
+        immediately if the call was the half-open probe."""
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == CIRCUIT_HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != CIRCUIT_OPEN:
+                    self.opened += 1
+                self._state = CIRCUIT_OPEN
+                self._opened_at = self._clock()
+                self._probe_at = None
+
+    def reset(self):
+        """Close the circuit."""
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probe_at = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host) -> CircuitBreaker:
+    """Return the circuit breaker shared by all the BeoPlay objects of a host."""
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker())
+    return breaker
@@ -0,0 +1,91 @@
+"""
+
+TTL cache for the read endpoints whose content rarely changes (device info,
+sources, sound modes, stand positions).
+
+Entries are keyed by host and endpoint, expire after a per-endpoint time to live
+(CACHE_TTLS) and are invalidated when a related notification arrives
+(CACHE_INVALIDATIONS) or a related command is sent
+(CACHE_COMMAND_INVALIDATIONS). One cache can be shared by many BeoPlay objects.
+
+"""
+
+import time
+
+from .const import *
+
+
+class ResponseCache(object):
+    def __init__(
+        self,
+        ttls: dict = None,
+        invalidations: dict = None,
+        clock=time.monotonic,
+        command_invalidations: dict = None,
+    ):
+        """Initializes a response cache.
+        ttls: endpoint -> time to live in seconds, overriding CACHE_TTLS.
+        Endpoints with no time to live are not cached.
+        invalidations: notification type -> list of endpoints to invalidate (None
+        for all), overriding CACHE_INVALIDATIONS
+        command_invalidations: command path -> list of endpoints to invalidate
+        (None for all), overriding CACHE_COMMAND_INVALIDATIONS
+        """
+        self._ttls = dict(CACHE_TTLS)
+        if ttls:
+            self._ttls.update(ttls)
+        self._invalidations = dict(CACHE_INVALIDATIONS)
+        if invalidations:
+            self._invalidations.update(invalidations)
+        self._command_invalidations = dict(CACHE_COMMAND_INVALIDATIONS)
+        if command_invalidations:
+            self._command_invalidations.update(command_invalidations)
+        self._clock = clock
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl(self, path):
+        """Return the time to live of an endpoint, or None if it is not cached."""
+        return self._ttls.get(path)
+
+    def get(self, host, path):
+        """Return the cached response, or None if missing or expired."""
+        entry = self._entries.get((host, path))
+        if entry is not None:
+            if entry[0] > self._clock():
+                self.hits += 1
+                return entry[1]
+            del self._entries[(host, path)]
+        self.misses += 1
+        return None
+
+    def put(self, host, path, value):
+        """Store a response, if the endpoint is cacheable."""
+        ttl = self._ttls.get(path)
+        if ttl is not None and ttl > 0 and value is not None:
+            self._entries[(host, path)] = (self._clock() + ttl, value)
+
+    def invalidate(self, host, paths=None):
+        """Remove the given endpoints (or all of them) of a host."""
+        if paths is None:
+            paths = list(self._ttls)
+        for path in paths:
+            self._entries.pop((host, path), None)
+
+    def invalidate_notification(self, host, notificationType):
+        """Remove the endpoints of a host related to a notification type."""
+        if notificationType in self._invalidations:
+            self.invalidate(host, self._invalidations[notificationType])
+
+    def invalidate_command(self, host, path):
+        """Remove the endpoints of a host changed by a command sent to path."""
+        if path in self._command_invalidations:
+            self.invalidate(host, self._command_invalidations[path])
+
+    def clear(self):
+        """Remove all the entries."""
+        self._entries.clear()
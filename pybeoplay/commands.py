@@ -0,0 +1,89 @@
+"""
+
+Latest-wins command channel for continuous-valued commands (volume, mute,
+stand position).
+
+Dragging a volume slider produces many more values than a device can process.
+A LatestValueChannel keeps at most one command in flight and at most one value
+waiting: a new value replaces the waiting one, and commands are sent no faster
+than max_rate per second. Callers whose value was replaced resolve with the
+result of the command that superseded it.
+
+"""
+
+import asyncio
+import logging
+
+from .const import *
+
+
+LOG = logging.getLogger(__name__)
+
+_NOTHING = object()
+
+
+class LatestValueChannel(object):
+    def __init__(self, send, max_rate: float = COMMAND_MAX_RATE):
+        """Initializes a command channel.
+        send: a coroutine function called as send(value) to send the command
+        max_rate: maximum number of commands sent per second (None or 0 for no limit)
+        """
+        self._send = send
+        self._interval = 1.0 / max_rate if max_rate else 0.0
+        self._pending = _NOTHING
+        self._waiters = []
+        self._worker = None
+        self._last_sent = None
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def busy(self) -> bool:
+        """Return True if a command is in flight or waiting."""
+        return self._worker is not None and not self._worker.done()
+
+    async def submit(self, value):
+        """Submit a value and wait for the command that sends it, or for the
+        command that superseded it. Returns the result of send."""
+        future = asyncio.get_running_loop().create_future()
+        if self._pending is not _NOTHING:
+            self.dropped += 1
+        self._pending = value
+        self._waiters.append(future)
+        if not self.busy:
+            self._worker = asyncio.ensure_future(self._run())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        waiters = []
+        try:
+            while self._pending is not _NOTHING:
+                if self._last_sent is not None:
+                    delay = self._last_sent + self._interval - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                value, waiters = self._pending, self._waiters
+                self._pending = _NOTHING
+                self._waiters = []
+                self._last_sent = loop.time()
+                try:
+                    result = await self._send(value)
+                except Exception as _e:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(_e)
+                else:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(result)
+                self.sent += 1
+        finally:
+            # only reached with waiters left if the worker itself is cancelled,
+            # waiting or sending: the callers of the value in flight too
+            waiters = waiters + self._waiters
+            self._pending = _NOTHING
+            self._waiters = []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.cancel()
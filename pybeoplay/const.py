@@ -7,9 +7,70 @@
 #
 
 # Connection constants
-BASE_URL = 'http://{0}:8080/{1}'
+BASE_URL_PORT = 'http://{0}:{1}/{2}'
+DEFAULT_PORT = 8080
 TIMEOUT = 5.0
-CONNFAILCOUNT = 5
+# Deadline of a GET call, including its retries
+GET_TIMEOUT = 10.0
+# Retries of a GET after a timeout or a connection error, and the delay before
+# the first one (doubled for each following retry)
+GET_RETRIES = 2
+GET_RETRY_BACKOFF = 0.1
+# A GET joins a request in flight only if that request gives up at most this
+# many seconds before its own deadline
+GET_COALESCE_SLACK = 0.05
+# Retry budget: retries (and hedges) earned per request and per second, and the
+# maximum number saved up
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN_PER_SECOND = 1.0
+RETRY_BUDGET_MAX_TOKENS = 10.0
+# Hedged GETs: number of recent latencies kept, and needed before hedging
+LATENCY_WINDOW = 100
+HEDGE_MIN_SAMPLES = 20
+# Connections kept alive per device by the background loop of the blocking calls
+BACKGROUND_POOL_PER_HOST = 2
+# Maximum rate (commands per second) of continuous-valued commands (volume, mute, stand)
+COMMAND_MAX_RATE = 10.0
+
+# Upper bounds (seconds) of the request latency histogram buckets
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Circuit breaker constants
+CIRCUIT_FAILURE_THRESHOLD = 2
+CIRCUIT_RESET_TIMEOUT = 15.0
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+# Fleet constants
+FLEET_MAX_CONCURRENCY = 64
+FLEET_MAX_PER_HOST = 2
+FLEET_DNS_CACHE_TTL = 300
+FLEET_KEEPALIVE_TIMEOUT = 30.0
+FLEET_NOTIFY_STARTUP_SPREAD = 5.0
+
+# Discovery constants
+# Hosts probed at the same time
+DISCOVERY_MAX_CONCURRENCY = 256
+# Seconds to wait for a host to accept the connection and answer
+DISCOVERY_TIMEOUT = 1.0
+
+# Seconds to wait for a device to appear in (or disappear from) the listeners
+# of the primary experience when joining (leaving) a multiroom group
+GROUP_CONFIRM_TIMEOUT = 10.0
+
+# Notification supervisor constants
+# B&O devices close the stream after 5 minutes of inactivity: a longer silence is a stall
+NOTIFY_STALL_TIMEOUT = 330.0
+NOTIFY_BACKOFF_BASE = 1.0
+NOTIFY_BACKOFF_MAX = 60.0
+NOTIFY_STABLE_AFTER = 30.0
+
+NOTIFY_STATE_CONNECTING = 'connecting'
+NOTIFY_STATE_CONNECTED = 'connected'
+NOTIFY_STATE_DISCONNECTED = 'disconnected'
+NOTIFY_STATE_BACKOFF = 'backoff'
+NOTIFY_STATE_STOPPED = 'stopped'
 
 # BeoPlay constants
 BEOPLAY_URL_NOTIFICATIONS = 'BeoNotify/Notifications'
@@ -38,8 +99,35 @@ BEOPLAY_URL_SET_SOUND_MODE = 'BeoZone/Zone/Sound/Mode/Active'
 
 BEOPLAY_URL_JOIN_EXPERIENCE = 'BeoZone/Zone/Device/OneWayJoin'
 BEOPLAY_URL_LEAVE_EXPERIENCE = 'BeoZone/Zone/ActiveSources/primaryExperience'
+# jid of a device: typeNumber.itemNumber.serialNumber@products.bang-olufsen.com
+BEOPLAY_JID_FORMAT = '{0}.{1}.{2}@products.bang-olufsen.com'
 BEOPLAY_URL_PLAYQUEUE = 'BeoZone/Zone/PlayQueue'
 BEOPLAY_URL_PLAYQUEUE_INSTANT = '?instantplay'
+BEOPLAY_URL_DEVICE = 'BeoDevice'
+
+# Response cache: time to live (seconds) of the cacheable read endpoints
+CACHE_TTLS = {
+    BEOPLAY_URL_DEVICE: 3600.0,
+    BEOPLAY_URL_GET_SOURCES: 300.0,
+    BEOPLAY_URL_GET_SOUND_MODE: 60.0,
+    BEOPLAY_URL_STAND: 3600.0,
+}
+# Response cache: endpoints invalidated by a notification type (None: all the endpoints)
+CACHE_INVALIDATIONS = {
+    'SOURCE': [BEOPLAY_URL_GET_SOURCES],
+    'SOURCE_EXPERIENCE_CHANGED': [BEOPLAY_URL_GET_SOURCES],
+    'SOUND_ACTIVE_MODE_CHANGED': [BEOPLAY_URL_GET_SOUND_MODE],
+    'SHUTDOWN': None,
+}
+# Response cache: endpoints invalidated by a command sent to that path (None: all the endpoints)
+CACHE_COMMAND_INVALIDATIONS = {
+    BEOPLAY_URL_SET_SOUND_MODE: [BEOPLAY_URL_GET_SOUND_MODE],
+    BEOPLAY_URL_STAND_ACTIVE: [BEOPLAY_URL_STAND],
+    BEOPLAY_URL_ACTIVE_SOURCES: [BEOPLAY_URL_GET_SOURCES],
+    BEOPLAY_URL_JOIN_EXPERIENCE: [BEOPLAY_URL_GET_SOURCES],
+    BEOPLAY_URL_LEAVE_EXPERIENCE: [BEOPLAY_URL_GET_SOURCES],
+    BEOPLAY_URL_STANDBY: None,
+}
 
 
 BEOPLAY_REMOTE_COMMANDS = ['Cursor/Select', 'Cursor/Up', 'Cursor/Down', 'Cursor/Left', 'Cursor/Right', 'Cursor/Exit', 'Cursor/Back', 'Cursor/PageUp', 'Cursor/PageDown', 'Cursor/Clear', 'Stream/Play', 'Stream/Stop', 'Stream/Pause', 'Stream/Wind', 'Stream/Rewind', 'Stream/Forward', 'Stream/Backward', 'List/StepUp', 'List/StepDown', 'List/PreviousElement', 'List/Shuffle', 'List/Repeat', 'Menu/Root', 'Menu/Option', 'Menu/Setup', 'Menu/Contents', 'Menu/Favorites', 'Menu/ElectronicProgramGuide', 'Menu/VideoOnDemand', 'Menu/Text', 'Menu/HbbTV,Menu/HomeControl', 'Device/Information', 'Device/Eject', 'Device/TogglePower', 'Device/Languages', 'Device/Subtitles', 'Device/OneWayJoin', 'Device/Mots', 'Record/Record', 'Generic/Blue', 'Generic/Red', 'Generic/Green', 'Generic/Yellow']
@@ -48,3 +136,18 @@ BEOPLAY_REMOTE_PREFIX = 'BeoZone/Zone/'
 BEOPLAY_DIGITS = [ '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
 BEOPLAY_DIGITS_URL = 'BeoZone/Zone/Digits'
 BEOPLAY_DIGITS_KEY = 'digits'
+
+# Seconds between the keys of a macro (BeoPlay.key_delay), measured from the
+# start of the previous key: devices drop keys that arrive too close together
+MACRO_KEY_DELAY = 0.3
+
+# Notifications queued for each subscriber (see pybeoplay.pubsub)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Notifications kept by the history of a device (see pybeoplay.history)
+HISTORY_CAPACITY = 1000
+
+# Directory of the metadata store, in the user cache directory (see pybeoplay.metadata)
+METADATA_DIRECTORY_NAME = "pybeoplay"
+# Endpoints whose responses are kept in the metadata store
+METADATA_ENDPOINTS = [BEOPLAY_URL_DEVICE, BEOPLAY_URL_GET_SOURCES, BEOPLAY_URL_GET_SOUND_MODE, BEOPLAY_URL_STAND]
@@ -0,0 +1,154 @@
+"""
+
+Discover BeoPlay devices by probing an address range.
+
+Every address of a network (CIDR notation, e.g. "192.168.1.0/24") is probed for
+the BeoDevice endpoint, a bounded number of addresses at a time and with a short
+timeout, so that silent addresses do not hold up the scan. Devices are returned
+as soon as they answer, as BeoPlay objects with their device information
+(name, serial number, type...) filled in.
+
+Usage: python -m pybeoplay.discovery 192.168.1.0/24 [--port 8080]
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import logging
+from typing import Optional
+
+
+from . import BeoPlay
+from .const import *
+from .lazy import aiohttp
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _targets(network, ports):
+    for address in ipaddress.ip_network(network, strict=False).hosts():
+        for port in ports:
+            yield str(address), port
+
+
+async def _probe(session, host, port, timeout):
+    """Return the BeoDevice response of host:port, or None."""
+    url = BASE_URL_PORT.format(host, port, BEOPLAY_URL_DEVICE)
+    try:
+        async with session.get(
+            url, timeout=aiohttp.ClientTimeout(total=timeout, connect=timeout)
+        ) as resp:
+            if resp.status != 200:
+                return None
+            r = await resp.json(content_type=None)
+            if isinstance(r, dict) and "beoDevice" in r:
+                return r
+    except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as _e:
+        LOG.debug("Probe of %s:%s failed: %s", host, port, str(_e))
+    return None
+
+
+async def async_discover(
+    network,
+    session: Optional[aiohttp.ClientSession] = None,
+    port=DEFAULT_PORT,
+    max_concurrency: int = DISCOVERY_MAX_CONCURRENCY,
+    timeout: float = DISCOVERY_TIMEOUT,
+    **kwargs
+):
+    """Probe the addresses of a network and yield the BeoPlay devices found, in the
+    order they answer.
+    network: the address range in CIDR notation ("192.168.1.0/24"), or a single address
+    session (optional): the aiohttp ClientSession used for the probes and given to
+    the devices found. If not provided a session is created for the scan only, and
+    the devices found have no session (only blocking calls work).
+    port: the HTTP port to probe, or a list of ports
+    max_concurrency: maximum number of probes at the same time
+    timeout: seconds to wait for each address to answer
+    kwargs: passed to BeoPlay (cache, metrics...)
+    """
+    ports = [port] if isinstance(port, int) else list(port)
+    own_session = session is None
+    if own_session:
+        probe_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, force_close=True)
+        )
+    else:
+        probe_session = session
+    targets = _targets(network, ports)
+    found = asyncio.Queue()
+    done = object()
+
+    async def worker():
+        try:
+            # the generator is shared: each target is taken by one worker
+            for host, target_port in targets:
+                r = await _probe(probe_session, host, target_port, timeout)
+                if r is not None:
+                    device = BeoPlay(host, session, port=target_port, **kwargs)
+                    try:
+                        device._processDeviceInfo(r)
+                    except (KeyError, TypeError):
+                        LOG.debug("Unexpected device information: %s", str(r))
+                        continue
+                    await found.put(device)
+        finally:
+            await found.put(done)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, max_concurrency))]
+    try:
+        running = len(workers)
+        while running:
+            device = await found.get()
+            if device is done:
+                running -= 1
+            else:
+                yield device
+        for task in workers:
+            # surface unexpected errors of the workers
+            task.result()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_session:
+            await probe_session.close()
+
+
+async def async_discover_all(network, **kwargs) -> list:
+    """Probe the addresses of a network and return the list of BeoPlay devices
+    found (see async_discover)."""
+    return [device async for device in async_discover(network, **kwargs)]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Discover BeoPlay devices")
+    parser.add_argument("network", help="address range, e.g. 192.168.1.0/24")
+    parser.add_argument("--port", type=int, nargs="+", default=[DEFAULT_PORT])
+    parser.add_argument("--concurrency", type=int, default=DISCOVERY_MAX_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=DISCOVERY_TIMEOUT)
+    args = parser.parse_args()
+
+    async def main():
+        start = time.monotonic()
+        count = 0
+        async for device in async_discover(
+            args.network,
+            port=args.port,
+            max_concurrency=args.concurrency,
+            timeout=args.timeout,
+        ):
+            count += 1
+            print(
+                "%-21s %-30s %-12s %s"
+                % (device.address, device.name, device.serialNumber, device.typeName)
+            )
+        print("%d devices in %.1fs" % (count, time.monotonic() - start))
+
+    asyncio.run(main())
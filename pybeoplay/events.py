@@ -0,0 +1,290 @@
+"""
+
+Typed notification events.
+
+Each event class wraps the content of the "notification" key of a BeoNotify
+message and exposes its payload as typed properties, instead of the deep
+["data"]["primaryExperience"][...] indexing of the raw dict. The events are
+__slots__ objects holding a reference to the decoded notification, and each
+property reads (and converts) its fields when it is accessed. They are used by
+the notification history, and by the subscribers that want a typed API:
+
+    event = event_for(await subscription.get())
+
+Events are also read-only mappings of the notification (event["type"],
+event.get("data")...), so they can be used where the dict was.
+
+"""
+
+from typing import Optional
+
+
+class NotificationEvent(object):
+    """A notification of any type."""
+
+    __slots__ = ("_notification", "_data")
+
+    def __init__(self, notification: dict):
+        self._notification = notification
+        # the payload, read by every property (None if missing)
+        self._data = notification.get("data")
+
+    @property
+    def notification(self) -> dict:
+        """Return the notification dict wrapped by the event."""
+        return self._notification
+
+    @property
+    def type(self) -> str:
+        return self._notification["type"]
+
+    @property
+    def kind(self) -> Optional[str]:
+        return self._notification.get("kind")
+
+    @property
+    def id(self) -> Optional[int]:
+        return self._notification.get("id")
+
+    @property
+    def timestamp(self) -> Optional[str]:
+        return self._notification.get("timestamp")
+
+    @property
+    def data(self):
+        """Return the raw payload of the notification."""
+        return self._data
+
+    def __getitem__(self, key):
+        return self._notification[key]
+
+    def __contains__(self, key):
+        return key in self._notification
+
+    def get(self, key, default=None):
+        return self._notification.get(key, default)
+
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, self._notification.get("type"))
+
+
+class VolumeEvent(NotificationEvent):
+    """VOLUME: level, range and mute of the speaker."""
+
+    __slots__ = ()
+
+    @property
+    def volume(self) -> float:
+        """Return the volume level, between 0 and 1."""
+        return int(self._data["speaker"]["level"]) / 100
+
+    @property
+    def min_volume(self) -> float:
+        return int(self._data["speaker"]["range"]["minimum"]) / 100
+
+    @property
+    def max_volume(self) -> float:
+        return int(self._data["speaker"]["range"]["maximum"]) / 100
+
+    @property
+    def muted(self) -> bool:
+        return self._data["speaker"]["muted"]
+
+
+class SourceEvent(NotificationEvent):
+    """SOURCE and SOURCE_EXPERIENCE_CHANGED: the primary experience of the device.
+    An empty payload means that no source is playing."""
+
+    __slots__ = ()
+
+    @property
+    def empty(self) -> bool:
+        """Return True if no source is playing."""
+        return not self._data
+
+    @property
+    def source(self) -> str:
+        """Return the friendly name of the source of the primary experience."""
+        return self._data["primaryExperience"]["source"]["friendlyName"]
+
+    @property
+    def source_data(self) -> dict:
+        """Return the source object of the primary experience (id, friendlyName,
+        sourceType, product...)."""
+        return self._data["primaryExperience"]["source"]
+
+    @property
+    def source_id(self) -> Optional[str]:
+        return self._data.get("primary")
+
+    @property
+    def state(self) -> str:
+        return self._data["primaryExperience"]["state"]
+
+    @property
+    def listeners(self) -> Optional[list]:
+        """Return the jids listening to the primary experience, or None if the
+        notification does not list them."""
+        if not self._data:
+            return []
+        return self._data["primaryExperience"].get("listener")
+
+
+class ProgressEvent(NotificationEvent):
+    """PROGRESS_INFORMATION: the state of play."""
+
+    __slots__ = ()
+
+    @property
+    def state(self) -> str:
+        return self._data["state"]
+
+
+class StoredMusicEvent(NotificationEvent):
+    """NOW_PLAYING_STORED_MUSIC: a track of a music library."""
+
+    __slots__ = ()
+
+    @property
+    def image_url(self) -> Optional[str]:
+        images = self._data["trackImage"]
+        return images[0]["url"] if images else None
+
+    @property
+    def track(self) -> str:
+        return self._data["name"]
+
+    @property
+    def artist(self) -> str:
+        return self._data["artist"]
+
+    @property
+    def album(self) -> str:
+        return self._data["album"]
+
+    @property
+    def genre(self) -> str:
+        return self._data["genre"]
+
+
+class StoredVideoEvent(NotificationEvent):
+    """NOW_PLAYING_STORED_VIDEO: a video of a library."""
+
+    __slots__ = ()
+
+    @property
+    def track(self) -> str:
+        return self._data["name"]
+
+
+class NetRadioEvent(NotificationEvent):
+    """NOW_PLAYING_NET_RADIO: an internet radio station. The properties are None
+    when the station does not provide them."""
+
+    __slots__ = ()
+
+    @property
+    def image_url(self) -> Optional[str]:
+        images = self._data.get("image")
+        if not images:
+            return None
+        # some B&O devices provide a hostname with trailing '.' which doesn't resolve
+        return images[0]["url"].replace(".:8080/", ":8080/")
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._data.get("name")
+
+    @property
+    def live_description(self) -> Optional[str]:
+        return self._data.get("liveDescription")
+
+    @property
+    def genre(self) -> Optional[str]:
+        return self._data.get("genre")
+
+    @property
+    def country(self) -> Optional[str]:
+        return self._data.get("country")
+
+    @property
+    def languages(self) -> Optional[str]:
+        return self._data.get("languages")
+
+
+class LegacyEvent(NotificationEvent):
+    """NOW_PLAYING_LEGACY: a source of a legacy (Masterlink) product."""
+
+    __slots__ = ()
+
+    @property
+    def track_number(self) -> int:
+        return self._data["trackNumber"]
+
+    @property
+    def playing(self) -> bool:
+        return self._notification["kind"] == "playing"
+
+
+class NowPlayingEndedEvent(NotificationEvent):
+    """NOW_PLAYING_ENDED: nothing is playing anymore."""
+
+    __slots__ = ()
+
+
+class NumberAndNameEvent(NotificationEvent):
+    """NUMBER_AND_NAME: a numbered channel, e.g. of a TV."""
+
+    __slots__ = ()
+
+    @property
+    def number(self) -> int:
+        return self._data["number"]
+
+    @property
+    def name(self) -> str:
+        return self._data["name"]
+
+    @property
+    def track(self) -> str:
+        """Return "number. name", as shown as the media track."""
+        return str(self._data["number"]) + ". " + self._data["name"]
+
+
+class SoundModeEvent(NotificationEvent):
+    """SOUND_ACTIVE_MODE_CHANGED: the active sound mode."""
+
+    __slots__ = ()
+
+    @property
+    def mode(self) -> str:
+        return self._data["friendlyName"]
+
+
+class ShutdownEvent(NotificationEvent):
+    """SHUTDOWN: the device is shutting down (or going to standby)."""
+
+    __slots__ = ()
+
+
+# Notification type -> event class
+EVENT_TYPES = {
+    "VOLUME": VolumeEvent,
+    "SOURCE": SourceEvent,
+    "SOURCE_EXPERIENCE_CHANGED": SourceEvent,
+    "PROGRESS_INFORMATION": ProgressEvent,
+    "NOW_PLAYING_STORED_MUSIC": StoredMusicEvent,
+    "NOW_PLAYING_STORED_VIDEO": StoredVideoEvent,
+    "NOW_PLAYING_NET_RADIO": NetRadioEvent,
+    "NOW_PLAYING_LEGACY": LegacyEvent,
+    "NOW_PLAYING_ENDED": NowPlayingEndedEvent,
+    "NUMBER_AND_NAME": NumberAndNameEvent,
+    "SOUND_ACTIVE_MODE_CHANGED": SoundModeEvent,
+    "SHUTDOWN": ShutdownEvent,
+}
+
+
+def event_for(notification: dict) -> NotificationEvent:
+    """Return the typed event of a notification (the content of the "notification"
+    key of a message); NotificationEvent for the types without a class."""
+    return EVENT_TYPES.get(notification.get("type"), NotificationEvent)(notification)
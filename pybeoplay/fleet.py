@@ -0,0 +1,372 @@
+"""
+
+BeoPlayFleet: manage many BeoPlay devices over one shared aiohttp session.
+
+All devices share a single tuned connector, and fan-out operations are bounded
+by a global concurrency limit and a per-host limit, so that "refresh all" or
+"all off" across a building does not turn into a thundering herd.
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import namedtuple
+from typing import Optional
+
+
+from . import BeoPlay
+from .cache import ResponseCache
+from .const import *
+from .lazy import aiohttp
+from .discovery import async_discover
+from .metadata import MetadataStore
+from .metrics import MetricsSink
+from .supervisor import NotificationSupervisor
+
+
+LOG = logging.getLogger(__name__)
+
+FleetResult = namedtuple("FleetResult", ["results", "errors"])
+FleetResult.__doc__ = """Result of a fan-out operation.
+results: dict host -> return value, for the devices that succeeded
+errors: dict host -> exception, for the devices that failed
+"""
+
+
+class BeoPlayFleet(object):
+    def __init__(
+        self,
+        hosts=(),
+        session: Optional[aiohttp.ClientSession] = None,
+        max_concurrency: int = FLEET_MAX_CONCURRENCY,
+        max_per_host: int = FLEET_MAX_PER_HOST,
+        cache: Optional[ResponseCache] = None,
+        metrics: Optional[MetricsSink] = None,
+        history_size: int = 0,
+        metadata: Optional[MetadataStore] = None,
+    ):
+        """Initializes a fleet of BeoPlay devices.
+        hosts: the IP addresses of the devices to add to the fleet ("host", or
+        "host:port" for devices not on the default port, e.g. simulated devices)
+        session (optional): a shared aiohttp ClientSession. If not provided the
+        fleet creates (and owns) one with a tuned connector when it is opened.
+        max_concurrency: maximum number of devices that are operated on at once
+        by a fan-out operation
+        max_per_host: maximum number of concurrent requests to a single device
+        cache (optional): a ResponseCache shared by all the devices
+        metrics (optional): a MetricsSink shared by all the devices
+        history_size: the number of recent notifications kept by each device (see
+        BeoPlay.history)
+        metadata (optional): a MetadataStore shared by all the devices. Their saved
+        metadata is loaded when they are added, and revalidated in the background
+        when the fleet is opened (see async_revalidate_all).
+        """
+        self._session = session
+        self._own_session = session is None
+        self._max_concurrency = max_concurrency
+        self._max_per_host = max_per_host
+        self._cache = cache
+        self._metrics = metrics
+        self._history_size = history_size
+        self._metadata = metadata
+        self._revalidation = None
+        self._semaphore = None
+        self._host_semaphores = {}
+        self._devices = {}
+        self._supervisors = {}
+        for host in hosts:
+            self.add(host)
+
+    async def __aenter__(self):
+        await self.async_open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.async_close()
+
+    async def async_open(self):
+        """Create the shared session (if not provided) on the running loop."""
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                # no global cap on connections: each device holds a long lived
+                # BeoNotify stream on top of its regular requests. Fan-out is
+                # bounded by the semaphores instead.
+                limit=0,
+                # one extra connection per host for the notification stream
+                limit_per_host=self._max_per_host + 1,
+                ttl_dns_cache=FLEET_DNS_CACHE_TTL,
+                keepalive_timeout=FLEET_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, connect=TIMEOUT),
+            )
+            self._own_session = True
+            for device in self._devices.values():
+                device._clientsession = self._session
+        if self._metadata is not None and self._revalidation is None:
+            # the devices are usable with their saved metadata meanwhile
+            self._revalidation = asyncio.ensure_future(self.async_revalidate_all())
+        return self
+
+    async def async_close(self):
+        """Stop the notification streams and close the shared session, if it is
+        owned by the fleet."""
+        await self.async_stop_notifications()
+        if self._revalidation is not None:
+            self._revalidation.cancel()
+            await asyncio.gather(self._revalidation, return_exceptions=True)
+            self._revalidation = None
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+            for device in self._devices.values():
+                device._clientsession = None
+
+    @property
+    def session(self):
+        """Return the shared aiohttp session."""
+        return self._session
+
+    @property
+    def devices(self):
+        """Return the list of devices in the fleet."""
+        return list(self._devices.values())
+
+    @property
+    def hosts(self):
+        """Return the list of hosts in the fleet."""
+        return list(self._devices.keys())
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self):
+        return iter(self._devices.values())
+
+    def __contains__(self, host):
+        return host in self._devices
+
+    def __getitem__(self, host) -> BeoPlay:
+        return self._devices[host]
+
+    def add(self, host, port: int = None) -> BeoPlay:
+        """Add a device to the fleet and return it. Adding an existing host
+        returns the device that is already in the fleet.
+        host: the IP address of the device, or "host:port"
+        port: the HTTP port of the device, if not given in host (default 8080)
+        """
+        if port is None:
+            port = DEFAULT_PORT
+            if host.count(":") == 1:
+                host, port = host.split(":")
+                port = int(port)
+        address = host if port == DEFAULT_PORT else "{0}:{1}".format(host, port)
+        device = self._devices.get(address)
+        if device is None:
+            device = BeoPlay(
+                host,
+                self._session,
+                cache=self._cache,
+                port=port,
+                metrics=self._metrics,
+                history_size=self._history_size,
+                metadata=self._metadata,
+            )
+            self._devices[address] = device
+        return device
+
+    def remove(self, host):
+        """Remove a device from the fleet. Its notification stream, if any, is
+        stopped in the background."""
+        supervisor = self._supervisors.pop(host, None)
+        if supervisor is not None:
+            asyncio.ensure_future(supervisor.async_stop())
+        self._devices.pop(host, None)
+        self._host_semaphores.pop(host, None)
+
+    async def async_discover(self, network, **kwargs) -> list:
+        """Probe the addresses of a network and add the BeoPlay devices found to
+        the fleet (see discovery.async_discover).
+        kwargs: port, max_concurrency, timeout
+        Returns the list of devices found that were not in the fleet yet.
+        """
+        await self.async_open()
+        added = []
+        async for found in async_discover(
+            network,
+            self._session,
+            cache=self._cache,
+            metrics=self._metrics,
+            history_size=self._history_size,
+            metadata=self._metadata,
+            **kwargs
+        ):
+            if found.address not in self._devices:
+                self._devices[found.address] = found
+                added.append(found)
+        return added
+
+    ###############################################################
+    # FAN-OUT OPERATIONS
+    ###############################################################
+
+    def _host_semaphore(self, host):
+        sem = self._host_semaphores.get(host)
+        if sem is None:
+            sem = asyncio.Semaphore(self._max_per_host)
+            self._host_semaphores[host] = sem
+        return sem
+
+    async def _run_one(self, device: BeoPlay, func):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            async with self._host_semaphore(device.address):
+                return await func(device)
+
+    def _select(self, hosts) -> list:
+        if hosts is None:
+            return self.devices
+        return [self._devices[host] for host in hosts if host in self._devices]
+
+    async def async_fan_out(self, func, hosts=None) -> FleetResult:
+        """Run func(device) for every device (or for the given hosts) with
+        bounded concurrency.
+        func: a coroutine function taking a BeoPlay instance
+        Returns a FleetResult with the per-device results and errors.
+        """
+        devices = self._select(hosts)
+        outcomes = await asyncio.gather(
+            *[self._run_one(device, func) for device in devices],
+            return_exceptions=True,
+        )
+        results = {}
+        errors = {}
+        for device, outcome in zip(devices, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, BaseException):
+                LOG.info("Fleet error %s on %s", str(outcome), device.address)
+                errors[device.address] = outcome
+            else:
+                results[device.address] = outcome
+        return FleetResult(results, errors)
+
+    async def async_refresh_all(self, hosts=None) -> FleetResult:
+        """Read device info, sources, active source and standby state of
+        every device."""
+
+        async def refresh(device: BeoPlay):
+            await device.async_get_device_info()
+            await device.async_get_sources()
+            await device.async_get_source()
+            return await device.async_get_standby()
+
+        return await self.async_fan_out(refresh, hosts)
+
+    async def async_revalidate_all(self, hosts=None) -> FleetResult:
+        """Revalidate the saved metadata of every device (see
+        BeoPlay.async_revalidate_metadata). Results are True for the devices
+        whose metadata was refreshed."""
+        return await self.async_fan_out(
+            lambda device: device.async_revalidate_metadata(), hosts
+        )
+
+    @property
+    def revalidation(self) -> Optional[asyncio.Task]:
+        """Return the background revalidation started when the fleet was opened
+        with a metadata store, or None."""
+        return self._revalidation
+
+    async def async_get_standby_all(self, hosts=None) -> FleetResult:
+        """Read the power state of every device."""
+        return await self.async_fan_out(lambda device: device.async_get_standby(), hosts)
+
+    async def async_standby_all(self, hosts=None) -> FleetResult:
+        """Put every device in standby."""
+        return await self.async_fan_out(lambda device: device.async_standby(), hosts)
+
+    async def async_set_volume_all(self, volume, hosts=None) -> FleetResult:
+        """Set the volume of every device."""
+        return await self.async_fan_out(
+            lambda device: device.async_set_volume(volume), hosts
+        )
+
+    async def async_join_all(
+        self, primary, hosts=None, timeout: Optional[float] = GROUP_CONFIRM_TIMEOUT
+    ) -> FleetResult:
+        """Join every device (or the given hosts) to the experience of the primary
+        host, concurrently (see group.async_join_group)."""
+        from .group import async_join_group
+
+        return await async_join_group(self._devices[primary], self._select(hosts), timeout)
+
+    async def async_leave_all(
+        self, primary, hosts=None, timeout: Optional[float] = GROUP_CONFIRM_TIMEOUT
+    ) -> FleetResult:
+        """Make every device (or the given hosts) leave the experience of the
+        primary host, concurrently (see group.async_leave_group)."""
+        from .group import async_leave_group
+
+        return await async_leave_group(self._devices[primary], self._select(hosts), timeout)
+
+    ###############################################################
+    # NOTIFICATIONS
+    ###############################################################
+
+    def start_notifications(
+        self,
+        callback=None,
+        state_callback=None,
+        change_callback=None,
+        startup_spread: float = FLEET_NOTIFY_STARTUP_SPREAD,
+        **kwargs
+    ):
+        """Start a supervised notification stream for every device that does not
+        have one yet.
+        callback: a function called as callback(device, notification)
+        state_callback: a function called as state_callback(device, state) on
+        every connection state transition
+        change_callback: a function called as change_callback(device, changes)
+        with the state fields changed by a notification
+        startup_spread: the first connections are spread randomly over this many
+        seconds, to avoid connecting to the whole fleet at the same moment
+        kwargs: passed to NotificationSupervisor
+        Returns the dict host -> NotificationSupervisor.
+        """
+        for host, device in self._devices.items():
+            if host in self._supervisors:
+                continue
+            supervisor = NotificationSupervisor(
+                device,
+                callback=None if callback is None else self._bind(callback, device),
+                state_callback=None
+                if state_callback is None
+                else self._bind(state_callback, device),
+                change_callback=None
+                if change_callback is None
+                else self._bind(change_callback, device),
+                initial_jitter=startup_spread,
+                **kwargs
+            )
+            supervisor.start()
+            self._supervisors[host] = supervisor
+        return dict(self._supervisors)
+
+    @staticmethod
+    def _bind(func, device):
+        return lambda arg: func(device, arg)
+
+    async def async_stop_notifications(self):
+        """Stop all the notification streams."""
+        supervisors = list(self._supervisors.values())
+        self._supervisors = {}
+        await asyncio.gather(*[supervisor.async_stop() for supervisor in supervisors])
+
+    @property
+    def notification_states(self):
+        """Return the dict host -> notification connection state."""
+        return {host: supervisor.state for host, supervisor in self._supervisors.items()}
@@ -0,0 +1,159 @@
+"""
+
+Multiroom group orchestration: join or leave many devices to the experience of
+a primary device at once.
+
+The join (leave) requests are sent to all the devices concurrently, and each
+device is confirmed when its jid appears in (disappears from) the listeners of
+the primary experience, as reported by the notifications of the primary device.
+Grouping a whole floor takes about one round trip, instead of one per device.
+
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from . import BeoPlay
+from .const import *
+from .fleet import FleetResult
+
+
+LOG = logging.getLogger(__name__)
+
+
+class GroupError(Exception):
+    """A device refused to join or leave the experience."""
+
+
+async def _async_jid(device: BeoPlay):
+    if device.jid is None:
+        await device.async_get_device_info()
+    if device.jid is None:
+        raise GroupError("No device information for {0}".format(device.address))
+    return device.jid
+
+
+class _PrimaryStream(object):
+    """Keeps a notification stream connected to the primary device while the
+    group operation runs, unless one is already connected."""
+
+    def __init__(self, primary: BeoPlay, timeout):
+        self._primary = primary
+        self._timeout = timeout
+        self._task = None
+
+    async def __aenter__(self):
+        if self._primary.streaming:
+            return self
+        connected = asyncio.Event()
+        self._task = asyncio.ensure_future(
+            self._primary.async_notificationsTask(connected_callback=connected.set)
+        )
+        waiter = asyncio.ensure_future(connected.wait())
+        await asyncio.wait(
+            [waiter, self._task],
+            timeout=self._timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        waiter.cancel()
+        if not connected.is_set():
+            LOG.info(
+                "No notification stream from %s, confirming by polling",
+                self._primary.address,
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def _async_confirm(primary: BeoPlay, predicate, timeout):
+    """Wait for predicate(primary) through the notifications of the primary; when
+    they do not confirm in time, check the listeners of the primary once more."""
+    try:
+        await primary.async_wait_for(predicate, timeout)
+    except asyncio.TimeoutError:
+        await primary.async_get_source()
+        if not predicate(primary):
+            raise
+
+
+async def _async_group(primary: BeoPlay, devices, join: bool, timeout) -> FleetResult:
+    loop = asyncio.get_running_loop()
+    # the jid of the primary device is needed to tell it apart from the others
+    await _async_jid(primary)
+
+    async def one(device: BeoPlay):
+        start = loop.time()
+        jid = await _async_jid(device)
+        if join:
+            predicate = lambda p: jid in (p.listeners or ())
+            send = device.async_join_experience
+        else:
+            predicate = lambda p: jid not in (p.listeners or ())
+            send = device.async_leave_experience
+        # listen before sending: the notification can arrive before the response
+        confirmed = asyncio.ensure_future(_async_confirm(primary, predicate, timeout))
+        try:
+            if not await send():
+                raise GroupError(
+                    "{0} refused to {1} the experience".format(
+                        device.address, "join" if join else "leave"
+                    )
+                )
+            await confirmed
+        finally:
+            if confirmed.done():
+                if not confirmed.cancelled():
+                    confirmed.exception()
+            else:
+                confirmed.cancel()
+        return loop.time() - start
+
+    devices = [device for device in devices if device is not primary]
+    async with _PrimaryStream(primary, timeout):
+        # start from the current listeners of the primary experience
+        await primary.async_get_source()
+        outcomes = await asyncio.gather(
+            *[one(device) for device in devices], return_exceptions=True
+        )
+    results = {}
+    errors = {}
+    for device, outcome in zip(devices, outcomes):
+        if isinstance(outcome, asyncio.CancelledError):
+            raise outcome
+        if isinstance(outcome, BaseException):
+            LOG.info("Group error %s on %s", str(outcome), device.address)
+            errors[device.address] = outcome
+        else:
+            results[device.address] = outcome
+    return FleetResult(results, errors)
+
+
+async def async_join_group(
+    primary: BeoPlay, devices, timeout: Optional[float] = GROUP_CONFIRM_TIMEOUT
+) -> FleetResult:
+    """Join devices to the experience playing on the primary device, concurrently,
+    and wait until each one is listed as a listener of the primary experience.
+    The primary must be playing, and be the latest experience started on the
+    network (devices join the latest experience, see OneWayJoin).
+    primary: the BeoPlay playing the experience
+    devices: the BeoPlay devices to join
+    timeout: seconds to wait for each device to be confirmed
+    Returns a FleetResult: results maps the address of each device confirmed to
+    the seconds it took, errors maps the others to the exception (GroupError,
+    asyncio.TimeoutError, aiohttp.ClientError...).
+    """
+    return await _async_group(primary, devices, True, timeout)
+
+
+async def async_leave_group(
+    primary: BeoPlay, devices, timeout: Optional[float] = GROUP_CONFIRM_TIMEOUT
+) -> FleetResult:
+    """Make devices leave the experience of the primary device, concurrently, and
+    wait until none of them is listed as a listener of the primary experience.
+    Returns a FleetResult, like async_join_group."""
+    return await _async_group(primary, devices, False, timeout)
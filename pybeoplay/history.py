@@ -0,0 +1,255 @@
+"""
+
+Per-device history of the recent notifications.
+
+EventHistory keeps the last capacity notifications of a device in a ring buffer
+of array-backed columns: the time received, a type code and one value extracted
+from the payload (the volume level, the source, the track...). An entry takes 13
+bytes, plus the distinct strings it refers to, so memory is capped per device
+whatever the rate of the notifications, and hundreds of devices can keep an
+hour of history in one process.
+
+Entries are stored in time order, so the entries of a time range are found by
+binary search:
+
+    history.query(start=time.time() - 3600, types={"SOURCE"})
+    history.count("VOLUME", start=time.time() - 3600)
+
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from operator import attrgetter
+
+from .const import *
+from .events import EVENT_TYPES
+
+
+HistoryEntry = namedtuple("HistoryEntry", ["time", "type", "value"])
+
+# how the value of a type is stored in the value column
+_TEXT = 0  # index + 1 in the string table, 0 for None
+_PERCENT = 1  # a 0-1 value, stored as an integer percentage
+_NUMBER = 2  # an integer
+# numeric value column of the _PERCENT and _NUMBER values that are None
+_NONE = -(2 ** 31)
+
+# Notification type -> (how the value is stored, function extracting it from the event)
+HISTORY_FIELDS = {
+    "VOLUME": (_PERCENT, attrgetter("volume")),
+    "SOURCE": (_TEXT, lambda event: None if event.empty else event.source),
+    "SOURCE_EXPERIENCE_CHANGED": (_NUMBER, lambda event: len(event.listeners or ())),
+    "PROGRESS_INFORMATION": (_TEXT, attrgetter("state")),
+    "NOW_PLAYING_STORED_MUSIC": (_TEXT, attrgetter("track")),
+    "NOW_PLAYING_STORED_VIDEO": (_TEXT, attrgetter("track")),
+    "NOW_PLAYING_NET_RADIO": (_TEXT, attrgetter("name")),
+    "NOW_PLAYING_LEGACY": (_NUMBER, attrgetter("track_number")),
+    "NUMBER_AND_NAME": (_TEXT, attrgetter("track")),
+    "SOUND_ACTIVE_MODE_CHANGED": (_TEXT, attrgetter("mode")),
+}
+
+# type of the entries of the types seen after the 255 first ones
+_OTHER = "OTHER"
+
+
+class EventHistory(object):
+    def __init__(self, capacity: int = HISTORY_CAPACITY, clock=time.time):
+        """Ring buffer of the last capacity notifications of a device.
+        clock: the source of the times of the entries (seconds since the epoch)
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self._capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._times = array("d", bytes(8 * capacity))
+        self._codes = array("B", bytes(capacity))
+        self._values = array("i", bytes(4 * capacity))
+        # physical index of the oldest entry, and number of entries
+        self._start = 0
+        self._size = 0
+        self._last = 0.0
+        # type code -> (type, how its value is stored)
+        self._types = []
+        self._typeCodes = {}
+        # the strings of the _TEXT values: id - 1 -> string
+        self._strings = []
+        self._stringIds = {}
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Return the size of the columns, in bytes (the strings are not included)."""
+        return sum(
+            column.itemsize * len(column)
+            for column in (self._times, self._codes, self._values)
+        )
+
+    def _typeCode(self, notificationType) -> int:
+        code = self._typeCodes.get(notificationType)
+        if code is None:
+            if len(self._types) >= 255 and notificationType != _OTHER:
+                return self._typeCode(_OTHER)
+            code = len(self._types)
+            field = HISTORY_FIELDS.get(notificationType)
+            self._types.append((notificationType, None if field is None else field[0]))
+            self._typeCodes[notificationType] = code
+        return code
+
+    def _stringId(self, value) -> int:
+        if value is None:
+            return 0
+        stringId = self._stringIds.get(value)
+        if stringId is None:
+            if len(self._strings) >= 2 * self._capacity:
+                self._compactStrings()
+            self._strings.append(value)
+            stringId = len(self._strings)
+            self._stringIds[value] = stringId
+        return stringId
+
+    def _compactStrings(self):
+        """Drop the strings no entry refers to anymore."""
+        strings = []
+        stringIds = {}
+        types, codes, values = self._types, self._codes, self._values
+        for i in self._physical(0, self._size):
+            stringId = values[i]
+            if stringId and types[codes[i]][1] == _TEXT:
+                value = self._strings[stringId - 1]
+                newId = stringIds.get(value)
+                if newId is None:
+                    strings.append(value)
+                    newId = len(strings)
+                    stringIds[value] = newId
+                values[i] = newId
+        self._strings = strings
+        self._stringIds = stringIds
+
+    def record(self, notification, when: float = None):
+        """Add a notification (the content of the "notification" key of a message).
+        when: the time it was received (defaults to now)"""
+        notificationType = notification.get("type")
+        value = 0
+        field = HISTORY_FIELDS.get(notificationType)
+        with self._lock:
+            if field is not None:
+                kind, extract = field
+                try:
+                    value = extract(EVENT_TYPES[notificationType](notification))
+                except (KeyError, TypeError, ValueError, AttributeError):
+                    value = None
+                if kind == _TEXT:
+                    value = self._stringId(value if value is None else str(value))
+                elif value is None:
+                    value = _NONE
+                elif kind == _PERCENT:
+                    value = round(value * 100)
+                else:
+                    value = int(value)
+            if when is None:
+                when = self._clock()
+            # keep the times ordered, even if the clock goes back
+            if when < self._last:
+                when = self._last
+            self._last = when
+            code = self._typeCode(notificationType)
+            if self._size < self._capacity:
+                i = (self._start + self._size) % self._capacity
+                self._size += 1
+            else:
+                i = self._start
+                self._start = (self._start + 1) % self._capacity
+            self._times[i] = when
+            self._codes[i] = code
+            self._values[i] = value
+
+    def _physical(self, lo, hi):
+        """Return the physical indexes of the entries lo (included) to hi (excluded),
+        counted from the oldest."""
+        start, capacity = self._start, self._capacity
+        return [(start + i) % capacity for i in range(lo, hi)]
+
+    def _index(self, when) -> int:
+        """Return the number of entries older than when. The entries are ordered,
+        and stored in two ordered runs: from _start to the end of the columns, and
+        from the start of the columns."""
+        times, start, size = self._times, self._start, self._size
+        first = min(size, self._capacity - start)
+        index = bisect_left(times, when, start, start + first) - start
+        if index < first:
+            return index
+        return first + bisect_left(times, when, 0, size - first)
+
+    def _range(self, start, end):
+        lo = 0 if start is None else self._index(start)
+        hi = self._size if end is None else self._index(end)
+        return lo, hi
+
+    def _decode(self, code, value):
+        notificationType, kind = self._types[code]
+        if kind == _TEXT:
+            value = self._strings[value - 1] if value else None
+        elif kind is None or value == _NONE:
+            value = None
+        elif kind == _PERCENT:
+            value = value / 100
+        return notificationType, value
+
+    def query(self, start: float = None, end: float = None, types=None) -> list:
+        """Return the entries received from start (included) to end (excluded),
+        oldest first, as HistoryEntry(time, type, value) tuples.
+        start, end: times in seconds since the epoch (None: no limit)
+        types: the notification types returned, or None for all
+        The value is the volume (0-1) for VOLUME, the friendly name of the source
+        for SOURCE (None when nothing plays), the number of listeners for
+        SOURCE_EXPERIENCE_CHANGED, the state for PROGRESS_INFORMATION, the track or
+        station for the NOW_PLAYING types, the sound mode for
+        SOUND_ACTIVE_MODE_CHANGED, and None for the other types.
+        """
+        entries = []
+        with self._lock:
+            codes = self._codesOf(types)
+            lo, hi = self._range(start, end)
+            for i in self._physical(lo, hi):
+                code = self._codes[i]
+                if codes is None or code in codes:
+                    notificationType, value = self._decode(code, self._values[i])
+                    entries.append(HistoryEntry(self._times[i], notificationType, value))
+        return entries
+
+    def count(self, types=None, start: float = None, end: float = None) -> int:
+        """Return the number of notifications received from start (included) to
+        end (excluded).
+        types: a notification type, a collection of types, or None for all
+        """
+        with self._lock:
+            lo, hi = self._range(start, end)
+            codes = self._codesOf(types)
+            if codes is None:
+                return hi - lo
+            allCodes = self._codes
+            return sum(1 for i in self._physical(lo, hi) if allCodes[i] in codes)
+
+    def _codesOf(self, types):
+        if types is None:
+            return None
+        if isinstance(types, str):
+            types = (types,)
+        return {self._typeCodes[t] for t in types if t in self._typeCodes}
+
+    def clear(self):
+        with self._lock:
+            self._start = 0
+            self._size = 0
+            self._strings = []
+            self._stringIds = {}
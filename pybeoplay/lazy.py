@@ -0,0 +1,58 @@
+"""
+
+Optional dependencies, imported on first use.
+
+The HTTP stack (aiohttp, used by the async API and, through the background event
+loop, by the blocking API) takes a few hundred milliseconds and several MB to
+import. Tools that only parse recorded notifications, build state records or
+never reach a device should not pay for it, so the modules of the package refer
+to it through a LazyModule: a stand-in that imports the module the first time
+one of its attributes is used. If the module is not installed, that first use
+raises an ImportError naming the extra to install.
+
+"""
+
+import importlib
+import threading
+
+
+class LazyModule(object):
+    def __init__(self, name, extra):
+        """Stand-in for the module name, imported on first attribute access.
+        extra: the pybeoplay extra that installs it
+        """
+        self._name = name
+        self._extra = extra
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Return True once the module has been imported."""
+        return self._module is not None
+
+    def load(self):
+        """Import the module (if not imported yet) and return it."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    try:
+                        self._module = importlib.import_module(self._name)
+                    except ImportError as _e:
+                        raise ImportError(
+                            "{0} is required for this feature: pip install pybeoplay[{1}]".format(
+                                self._name, self._extra
+                            )
+                        ) from _e
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        return "<LazyModule {0}{1}>".format(
+            self._name, "" if self._module is None else " (loaded)"
+        )
+
+
+aiohttp = LazyModule("aiohttp", "async")
@@ -0,0 +1,142 @@
+"""
+
+Persistent on-disk cache of the static metadata of the devices.
+
+Device information, sources, sound modes and stand positions take four round
+trips per device to read, and rarely change. MetadataStore keeps the responses
+on disk, one JSON file per device named after its serial number and holding its
+software version, so that a BeoPlay created with the store is usable as soon as
+it is constructed, without contacting the device. The store is revalidated in
+the background (BeoPlay.async_revalidate_metadata, or automatically by a
+BeoPlayFleet): the device information is read again and, when the serial number
+or the software version changed, all the metadata is refreshed and saved.
+
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from .const import *
+
+
+LOG = logging.getLogger(__name__)
+
+MetadataEntry = namedtuple(
+    "MetadataEntry", ["address", "serial", "software", "saved", "responses"]
+)
+
+
+def default_directory() -> str:
+    """Return the default directory of the store: pybeoplay in the user cache
+    directory ($XDG_CACHE_HOME, or ~/.cache)."""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache, METADATA_DIRECTORY_NAME)
+
+
+class MetadataStore(object):
+    def __init__(self, directory: str = None):
+        """A directory of device metadata files.
+        directory: where the files are kept (see default_directory). It is created
+        on the first save.
+        The files are read once, on the first lookup.
+        """
+        self._directory = directory if directory is not None else default_directory()
+        self._lock = threading.Lock()
+        # address -> MetadataEntry
+        self._entries = None
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _path(self, serial) -> str:
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(serial))
+        return os.path.join(self._directory, name + ".json")
+
+    def _load(self):
+        entries = {}
+        try:
+            names = sorted(os.listdir(self._directory))
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._directory, name), encoding="utf-8") as file:
+                    data = json.load(file)
+                entry = MetadataEntry(
+                    data["address"],
+                    data["serial"],
+                    data["software"],
+                    data["saved"],
+                    data["responses"],
+                )
+            except (OSError, ValueError, KeyError, TypeError) as _e:
+                LOG.debug("Skipping metadata file %s: %s", name, str(_e))
+                continue
+            previous = entries.get(entry.address)
+            # a device moved to the address of another: keep the latest
+            if previous is None or previous.saved < entry.saved:
+                entries[entry.address] = entry
+        return entries
+
+    def _loaded(self) -> dict:
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+        return self._entries
+
+    def __len__(self):
+        return len(self._loaded())
+
+    def get(self, address) -> MetadataEntry:
+        """Return the metadata of the device at an address, or None."""
+        return self._loaded().get(address)
+
+    def put(self, address, serial, software, responses: dict) -> MetadataEntry:
+        """Save the metadata of a device.
+        responses: endpoint -> the JSON response of the device
+        """
+        entry = MetadataEntry(address, serial, software, time.time(), responses)
+        entries = self._loaded()
+        with self._lock:
+            os.makedirs(self._directory, exist_ok=True)
+            # write and rename, so that a crash never leaves a truncated file
+            fd, temp = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as file:
+                    json.dump(entry._asdict(), file)
+                os.replace(temp, self._path(serial))
+            except BaseException:
+                os.unlink(temp)
+                raise
+            for other in [a for a, e in entries.items() if e.serial == serial]:
+                del entries[other]
+            entries[address] = entry
+        return entry
+
+    def remove(self, address):
+        """Forget the metadata of the device at an address."""
+        entries = self._loaded()
+        with self._lock:
+            entry = entries.pop(address, None)
+            if entry is not None:
+                try:
+                    os.unlink(self._path(entry.serial))
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Forget the metadata of all the devices."""
+        for address in list(self._loaded()):
+            self.remove(address)
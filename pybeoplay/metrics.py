@@ -0,0 +1,205 @@
+"""
+
+Per-host, per-endpoint request and notification metrics.
+
+BeoPlay reports every request (status, latency, bytes read), every failed request
+(timeout or connection error) and every notification received to a MetricsSink.
+MetricsSink is the interface, to forward the metrics to any monitoring system;
+InMemoryMetrics collects counters and latency histograms and renders them in the
+Prometheus text exposition format.
+
+When no sink is configured the requests only pay for one "is None" test.
+
+"""
+
+import bisect
+import threading
+
+from .const import *
+
+
+ERROR_TIMEOUT = "timeout"
+ERROR_CONNECTION = "connection"
+
+
+class MetricsSink(object):
+    """Receives the metrics of BeoPlay objects. The methods do nothing: subclass
+    and override the ones of interest. They can be called from several threads
+    (blocking calls) and must be fast."""
+
+    def record_request(self, host, method, path, status, seconds, size=0):
+        """A request completed.
+        host: the device address
+        method: GET, PUT, POST or DELETE
+        path: the path of the request
+        status: the HTTP status code
+        seconds: the time taken by the request
+        size: the number of bytes of the response body read
+        """
+
+    def record_error(self, host, method, path, error, seconds):
+        """A request failed without a response.
+        error: ERROR_TIMEOUT or ERROR_CONNECTION
+        """
+
+    def record_notification(self, host, notificationType):
+        """A notification was received."""
+
+    def record_stream_bytes(self, host, size):
+        """Bytes were read from the notification stream."""
+
+
+def endpoint(path) -> str:
+    """Return the endpoint of a request path, without the query string."""
+    return path.partition("?")[0]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    return ",".join(
+        '{0}="{1}"'.format(name, _escape(value)) for name, value in zip(names, values)
+    )
+
+
+class InMemoryMetrics(MetricsSink):
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        """Collects the metrics in memory.
+        buckets: the upper bounds, in seconds, of the latency histogram buckets
+        """
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # (host, method, endpoint, status) -> count
+        self.requests = {}
+        # (host, method, endpoint, error) -> count
+        self.errors = {}
+        # (host, method, endpoint) -> [count per bucket..., +Inf count, sum]
+        self.latency = {}
+        # (host, endpoint) -> bytes
+        self.bytes_read = {}
+        # (host, type) -> count
+        self.notifications = {}
+        # host -> bytes
+        self.stream_bytes = {}
+
+    def _observe(self, key, seconds):
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = [0] * (len(self._buckets) + 1) + [0.0]
+            self.latency[key] = histogram
+        histogram[bisect.bisect_left(self._buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def record_request(self, host, method, path, status, seconds, size=0):
+        path = endpoint(path)
+        key = (host, method, path, status)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._observe((host, method, path), seconds)
+            if size:
+                key = (host, path)
+                self.bytes_read[key] = self.bytes_read.get(key, 0) + size
+
+    def record_error(self, host, method, path, error, seconds):
+        path = endpoint(path)
+        key = (host, method, path, error)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+            self._observe((host, method, path), seconds)
+
+    def record_notification(self, host, notificationType):
+        key = (host, notificationType)
+        with self._lock:
+            self.notifications[key] = self.notifications.get(key, 0) + 1
+
+    def record_stream_bytes(self, host, size):
+        with self._lock:
+            self.stream_bytes[host] = self.stream_bytes.get(host, 0) + size
+
+    def request_count(self, host=None, status=None) -> int:
+        """Return the number of completed requests, of a host and/or with a status."""
+        with self._lock:
+            return sum(
+                count
+                for (h, _, _, s), count in self.requests.items()
+                if (host is None or h == host) and (status is None or s == status)
+            )
+
+    def error_count(self, host=None, error=None) -> int:
+        """Return the number of failed requests, of a host and/or of a kind."""
+        with self._lock:
+            return sum(
+                count
+                for (h, _, _, e), count in self.errors.items()
+                if (host is None or h == host) and (error is None or e == error)
+            )
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.errors.clear()
+            self.latency.clear()
+            self.bytes_read.clear()
+            self.notifications.clear()
+            self.stream_bytes.clear()
+
+    def render_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def counter(name, help, names, values):
+            lines.append("# HELP {0} {1}".format(name, help))
+            lines.append("# TYPE {0} counter".format(name))
+            for key, value in sorted(values.items()):
+                if not isinstance(key, tuple):
+                    key = (key,)
+                lines.append("{0}{{{1}}} {2}".format(name, _labels(names, key), value))
+
+        with self._lock:
+            counter(
+                "beoplay_requests_total",
+                "Requests completed, by HTTP status.",
+                ("host", "method", "endpoint", "status"),
+                self.requests,
+            )
+            counter(
+                "beoplay_request_errors_total",
+                "Requests failed without a response (timeout or connection error).",
+                ("host", "method", "endpoint", "error"),
+                self.errors,
+            )
+            name = "beoplay_request_duration_seconds"
+            lines.append("# HELP {0} Request latency.".format(name))
+            lines.append("# TYPE {0} histogram".format(name))
+            names = ("host", "method", "endpoint")
+            for key, histogram in sorted(self.latency.items()):
+                labels = _labels(names, key)
+                cumulative = 0
+                for bound, count in zip(self._buckets + ("+Inf",), histogram):
+                    cumulative += count
+                    lines.append(
+                        '{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, bound, cumulative)
+                    )
+                lines.append("{0}_sum{{{1}}} {2}".format(name, labels, histogram[-1]))
+                lines.append("{0}_count{{{1}}} {2}".format(name, labels, cumulative))
+            counter(
+                "beoplay_response_bytes_total",
+                "Bytes of response bodies read.",
+                ("host", "endpoint"),
+                self.bytes_read,
+            )
+            counter(
+                "beoplay_notifications_total",
+                "Notifications received, by type.",
+                ("host", "type"),
+                self.notifications,
+            )
+            counter(
+                "beoplay_notification_bytes_total",
+                "Bytes read from the notification stream.",
+                ("host",),
+                self.stream_bytes,
+            )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,245 @@
+"""
+
+Publish/subscribe fan-out of the notifications of a device.
+
+Every subscriber has its own bounded asyncio queue, an optional filter on the
+notification type, and an overflow policy for when it falls behind:
+
+- OVERFLOW_DROP_OLDEST: the oldest queued notification is discarded (a UI only
+  needs the latest state)
+- OVERFLOW_DROP_NEWEST: the new notification is discarded
+- OVERFLOW_BLOCK: nothing is discarded; the stream reader waits for room in the
+  queue, so a blocking subscriber slows the stream down (for consumers that must
+  see every notification, e.g. a database writer)
+
+With the drop policies publishing never waits, so a slow consumer can not stall
+the reading of the socket. Subscriptions are async iterators:
+
+    async for notification in device.subscribe(types={"VOLUME"}):
+        ...
+
+A subscription belongs to the event loop it is created on. The notifications
+published on another loop (e.g. by the stream of the blocking API, on the
+background loop) are handed over to its loop thread-safely, and never waited
+for: with OVERFLOW_BLOCK they are kept, without bound, until the queue has room.
+
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+from .const import *
+
+
+LOG = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_BLOCK = "block"
+
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK)
+
+# put in the queue to wake up the consumer of a closed subscription
+_CLOSED = object()
+
+
+class Subscription(object):
+    def __init__(
+        self,
+        hub,
+        types=None,
+        maxsize: int = SUBSCRIBER_QUEUE_SIZE,
+        overflow: str = OVERFLOW_DROP_OLDEST,
+    ):
+        """A subscriber to the notifications of a NotificationHub.
+        types: the notification types received (e.g. {"VOLUME", "SOURCE"}), or None
+        for all
+        maxsize: the number of notifications queued
+        overflow: what to do when the queue is full (OVERFLOW_DROP_OLDEST,
+        OVERFLOW_DROP_NEWEST or OVERFLOW_BLOCK)
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: {0}".format(overflow))
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self._hub = hub
+        self.types = frozenset(types) if types is not None else None
+        self.overflow = overflow
+        self._queue = asyncio.Queue(maxsize)
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # created outside of a loop: consumed on the loop publishing
+            self._loop = None
+        # notifications of a blocking subscriber waiting for room in the queue
+        self._pending = deque()
+        self._putter = None
+        self._drainer = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def qsize(self) -> int:
+        """Return the number of notifications waiting to be consumed."""
+        return self._queue.qsize() + len(self._pending)
+
+    def _offer(self, notification) -> bool:
+        """Queue a notification without waiting. Returns False if it is pending
+        (blocking subscriber with a full queue)."""
+        if self._closed:
+            return True
+        if self.types is not None and notification.get("type") not in self.types:
+            return True
+        self.received += 1
+        if self._pending:
+            self._pending.append(notification)
+            return False
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._queue.get_nowait()
+                self._queue.put_nowait(notification)
+                self.dropped += 1
+            elif self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped += 1
+            else:
+                self._pending.append(notification)
+                return False
+        return True
+
+    def _offerThreadsafe(self, notification):
+        """_offer, on the loop of the subscription, of a notification published
+        on another loop. The pending notifications are queued by a task of this
+        loop: the publisher does not wait for them."""
+        if not self._offer(notification) and (
+            self._drainer is None or self._drainer.done()
+        ):
+            self._drainer = asyncio.ensure_future(self._async_drain())
+
+    async def _async_drain(self):
+        """Wait until the pending notifications are queued."""
+        while self._pending and not self._closed:
+            # a task, that close can cancel if the consumer is gone
+            self._putter = asyncio.ensure_future(self._queue.put(self._pending[0]))
+            try:
+                await self._putter
+            except asyncio.CancelledError:
+                if not self._closed:
+                    raise
+                break
+            finally:
+                self._putter = None
+            self._pending.popleft()
+        if self._closed:
+            self._pending.clear()
+
+    def get_nowait(self):
+        """Return the next notification. Raises asyncio.QueueEmpty if there is none."""
+        notification = self._queue.get_nowait()
+        if notification is _CLOSED:
+            raise asyncio.QueueEmpty()
+        return notification
+
+    async def get(self):
+        """Wait for the next notification. Raises StopAsyncIteration once the
+        subscription is closed and its queue consumed."""
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        notification = await self._queue.get()
+        if notification is _CLOSED:
+            raise StopAsyncIteration
+        return notification
+
+    def close(self):
+        """Stop receiving notifications. The ones already queued can still be
+        consumed."""
+        if self._closed:
+            return
+        self._closed = True
+        self._hub._remove(self)
+        if self._putter is not None:
+            self._putter.cancel()
+        try:
+            self._queue.put_nowait(_CLOSED)
+        except asyncio.QueueFull:
+            # the consumer is not waiting: it stops when the queue is consumed
+            pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NotificationHub(object):
+    def __init__(self):
+        """Fans out the notifications of a device to any number of subscribers."""
+        self._subscriptions = []
+        self._blocked = []
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    @property
+    def subscriptions(self) -> list:
+        return list(self._subscriptions)
+
+    def subscribe(
+        self,
+        types=None,
+        maxsize: int = SUBSCRIBER_QUEUE_SIZE,
+        overflow: str = OVERFLOW_DROP_OLDEST,
+    ) -> Subscription:
+        """Add a subscriber (see Subscription)."""
+        subscription = Subscription(self, types, maxsize, overflow)
+        # copy on write: publish may be iterating over the list
+        self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def _remove(self, subscription: Subscription):
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def publish(self, notification) -> bool:
+        """Offer a notification to all the subscribers, without waiting. Returns
+        False if a blocking subscriber could not take it: call async_drain before
+        publishing more. Must be called from a running event loop."""
+        loop = asyncio.get_running_loop()
+        delivered = True
+        for subscription in self._subscriptions:
+            if subscription._loop is not None and subscription._loop is not loop:
+                # asyncio queues are not thread-safe
+                subscription._loop.call_soon_threadsafe(
+                    subscription._offerThreadsafe, notification
+                )
+            elif not subscription._offer(notification):
+                self._blocked.append(subscription)
+                delivered = False
+        return delivered
+
+    async def async_drain(self):
+        """Wait until the blocking subscribers have room for the notifications
+        published so far."""
+        while self._blocked:
+            blocked = list(dict.fromkeys(self._blocked))
+            self._blocked = []
+            for subscription in blocked:
+                await subscription._async_drain()
+
+    def close(self):
+        """Close all the subscriptions."""
+        for subscription in self._subscriptions:
+            subscription.close()
+        self._blocked = []
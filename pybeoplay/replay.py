@@ -0,0 +1,204 @@
+"""
+
+Record and replay BeoNotify notification streams.
+
+NotificationRecorder captures the raw lines of the stream read by
+async_notificationsTask to a file, one line per notification, prefixed by the
+time it was received:
+
+    <unix time>\t<raw JSON line>
+
+NotificationReplayer feeds a recording (or the examples in EVENTS.md) back
+through BeoPlay._processNotification and the callbacks, at the recorded pace,
+N times faster, or as fast as possible to measure the throughput of the parsing
+and state update path.
+
+Usage: python -m pybeoplay.replay FILE [--speed N] [--repeat N]
+
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from .stream import json_loads
+
+
+LOG = logging.getLogger(__name__)
+
+
+class NotificationRecorder(object):
+    def __init__(self, path, clock=time.time):
+        """Records the raw notification stream to a file.
+        path: the file to write (appended to, if it exists)
+        """
+        self._file = open(path, "ab")
+        self._clock = clock
+        self._pending = b""
+        self.lines = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def feed(self, data):
+        """Record the bytes received from the stream (one or more lines, or any chunk)."""
+        data = self._pending + bytes(data)
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        if not lines:
+            return
+        stamp = b"%.6f\t" % self._clock()
+        out = []
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line:
+                out.append(stamp + line + b"\n")
+        if out:
+            self._file.write(b"".join(out))
+            self.lines += len(out)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._pending.strip():
+            self.feed(b"\n")
+        self._file.close()
+
+
+def load_recording(path) -> list:
+    """Load a recording as a list of (unix time, raw line) tuples."""
+    records = []
+    with open(path, "rb") as file:
+        for line in file:
+            stamp, _, raw = line.rstrip(b"\r\n").partition(b"\t")
+            if raw:
+                records.append((float(stamp), raw))
+    return records
+
+
+def load_events_md(path, interval: float = 0.1) -> list:
+    """Load the notification examples of EVENTS.md as a recording, spaced by interval
+    seconds. Returns a list of (time, raw line) tuples."""
+    with open(path, "r") as file:
+        text = file.read().replace("\r", " ").replace("\n", " ")
+    decoder = json.JSONDecoder()
+    records = []
+    i = text.find('{"notification"')
+    while i >= 0:
+        obj, end = decoder.raw_decode(text, i)
+        records.append((len(records) * interval, json.dumps(obj).encode("utf-8")))
+        i = text.find('{"notification"', end)
+    return records
+
+
+class NotificationReplayer(object):
+    def __init__(self, records: list, loads=None):
+        """Replays a recorded notification stream.
+        records: a list of (time, raw line) tuples, see load_recording and load_events_md
+        loads: the JSON backend (defaults to orjson, if installed)
+        """
+        self.records = records
+        self._loads = loads if loads is not None else json_loads
+
+    @classmethod
+    def load(cls, path, loads=None):
+        """Load a recording file, or the examples of an EVENTS.md file."""
+        if str(path).lower().endswith(".md"):
+            return cls(load_events_md(path), loads)
+        return cls(load_recording(path), loads)
+
+    def __len__(self):
+        return len(self.records)
+
+    def replay(self, beoplay, callback=None, change_callback=None, repeat: int = 1) -> dict:
+        """Replay the recording as fast as possible, without an event loop.
+        Returns the statistics: events, seconds, events_per_second."""
+        loads = self._loads
+        process = beoplay._processNotification
+        trackChanges = change_callback is not None
+        lines = [raw for _, raw in self.records]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for raw in lines:
+                data = loads(raw)
+                changes = process(data, trackChanges)
+                if callback is not None:
+                    callback(data["notification"])
+                if changes and change_callback is not None:
+                    change_callback(changes)
+        return self._stats(len(lines) * repeat, time.perf_counter() - start)
+
+    async def async_replay(
+        self, beoplay, callback=None, change_callback=None, speed: float = 1.0
+    ) -> dict:
+        """Replay the recording at the recorded pace divided by speed (speed=None or 0
+        for as fast as possible, yielding to the event loop between notifications).
+        Returns the statistics: events, seconds, events_per_second."""
+        loop = asyncio.get_running_loop()
+        loads = self._loads
+        trackChanges = change_callback is not None
+        start = loop.time()
+        first = self.records[0][0] if self.records else 0.0
+        for stamp, raw in self.records:
+            if speed:
+                delay = start + (stamp - first) / speed - loop.time()
+                await asyncio.sleep(max(0.0, delay))
+            else:
+                await asyncio.sleep(0)
+            data = loads(raw)
+            changes = beoplay._processNotification(data, trackChanges)
+            if callback is not None:
+                callback(data["notification"])
+            if changes and change_callback is not None:
+                change_callback(changes)
+        return self._stats(len(self.records), loop.time() - start)
+
+    @staticmethod
+    def _stats(events, seconds) -> dict:
+        return {
+            "events": events,
+            "seconds": seconds,
+            "events_per_second": events / seconds if seconds > 0 else float("inf"),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from . import BeoPlay
+
+    parser = argparse.ArgumentParser(description="Replay a BeoNotify recording")
+    parser.add_argument("file", help="a recording, or EVENTS.md")
+    parser.add_argument(
+        "--speed", type=float, default=0, help="replay speed (0: as fast as possible)"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=10000, help="repetitions at maximum speed"
+    )
+    parser.add_argument(
+        "--changes", action="store_true", help="compute the change set of each notification"
+    )
+    args = parser.parse_args()
+
+    replayer = NotificationReplayer.load(args.file)
+    device = BeoPlay("localhost")
+    change_callback = (lambda changes: None) if args.changes else None
+    if args.speed:
+        stats = asyncio.run(
+            replayer.async_replay(
+                device, change_callback=change_callback, speed=args.speed
+            )
+        )
+    else:
+        stats = replayer.replay(
+            device, change_callback=change_callback, repeat=args.repeat
+        )
+    print(
+        "%d events in %.3fs: %.0f events/s"
+        % (stats["events"], stats["seconds"], stats["events_per_second"])
+    )
@@ -0,0 +1,95 @@
+"""
+
+Retry budget and latency tracking for the GET requests.
+
+GETs are idempotent and can be retried after a timeout or a connection error, or
+hedged: a second request is sent when the first one is slower than a percentile
+of the recent latencies of the device, and the first answer wins. Both add load
+to a device that may already be struggling, so they draw from a RetryBudget: a
+token bucket that earns a fraction of a token per request (and a minimum number
+per second), and spends one per retry or hedge.
+
+"""
+
+import threading
+import time
+from collections import deque
+
+from .const import *
+
+
+class RetryBudget(object):
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+        max_tokens: float = RETRY_BUDGET_MAX_TOKENS,
+        clock=time.monotonic,
+    ):
+        """Initializes a retry budget.
+        ratio: retries allowed per request (0.2: at most one retry every 5 requests)
+        min_per_second: retries allowed per second even with few requests
+        max_tokens: maximum number of retries that can be saved up
+        """
+        self._ratio = ratio
+        self._min_per_second = min_per_second
+        self._max_tokens = max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._last = clock()
+        self.withdrawn = 0
+        self.rejected = 0
+
+    def _refill(self, earned):
+        now = self._clock()
+        earned += (now - self._last) * self._min_per_second
+        self._last = now
+        self._tokens = min(self._max_tokens, self._tokens + earned)
+
+    def deposit(self):
+        """Record a request."""
+        with self._lock:
+            self._refill(self._ratio)
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry or a hedge. Returns False if the budget is spent."""
+        with self._lock:
+            self._refill(0.0)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.withdrawn += 1
+                return True
+            self.rejected += 1
+            return False
+
+    @property
+    def tokens(self) -> float:
+        """Return the number of retries currently available."""
+        with self._lock:
+            self._refill(0.0)
+            return self._tokens
+
+
+class LatencyTracker(object):
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        """Keeps the latencies of the last window requests.
+        min_samples: no percentile is reported before this many requests
+        """
+        self._samples = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, percentile: float):
+        """Return the given percentile (0-100) of the recent latencies, or None if
+        there are not enough samples."""
+        if len(self._samples) < self._min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
@@ -0,0 +1,595 @@
+"""
+
+Simulated BeoPlay device, for load testing without real hardware.
+
+SimulatedDevice is a small aiohttp server that serves the BeoPlay endpoints used
+by this library (BeoDevice, Sources, ActiveSources, Sound/Mode, Stand, Volume,
+PlayQueue, standby, the remote commands and digits) and a streaming BeoNotify
+feed. It keeps its own state, updates it when commands arrive and publishes the
+matching notifications. Latency, error rate and the rate of spontaneous
+notifications are configurable, and many devices can run in one process, each on
+its own port. Devices on the same SimulatedNetwork can join each other's
+experience (OneWayJoin), like multiroom B&O products.
+
+Usage: python -m pybeoplay.simulator [--count N] [--host H] [--port P] [--latency S]
+
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime
+
+from aiohttp import web
+
+from .const import *
+
+
+LOG = logging.getLogger(__name__)
+
+JID_FORMAT = BEOPLAY_JID_FORMAT
+
+DEFAULT_SOURCES = [
+    ("RADIO", "Radio", "RADIO", False),
+    ("TP1", "Streaming (A.MEM)", "A.MEM", False),
+    ("LINEIN", "Line-In", "LINE IN", False),
+    ("BLUETOOTH", "Bluetooth", "BLUETOOTH", False),
+    ("DEEZER", "Deezer", "DEEZER", False),
+]
+DEFAULT_SOUND_MODES = ["Adaptive", "Optimised", "Clear Voice", "Movie", "Music"]
+DEFAULT_STAND_POSITIONS = ["Start-up", "Standby", "Position 1", "Position 2"]
+
+
+class SimulatedNetwork(object):
+    """The simulated devices of one home network. A device joining an experience
+    (OneWayJoin) joins the latest experience started on another device of its
+    network."""
+
+    def __init__(self):
+        self.devices = set()
+
+    def latest_experience(self, exclude=None):
+        """Return the device that started the latest experience, or None."""
+        hosts = [
+            device
+            for device in self.devices
+            if device is not exclude
+            and device.active_source is not None
+            and device.experience_host is None
+        ]
+        return max(hosts, key=lambda device: device.experience_started, default=None)
+
+
+# the network of the devices created without one
+DEFAULT_NETWORK = SimulatedNetwork()
+
+
+class SimulatedDevice(object):
+    def __init__(
+        self,
+        name: str = "Simulated BeoPlay",
+        serial: str = "12345678",
+        typeNumber: str = "1790",
+        itemNumber: str = "1179011",
+        software_version: str = "1.0.0",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        notification_rate: float = 0.0,
+        idle_timeout: float = None,
+        seed=None,
+        network: SimulatedNetwork = None,
+    ):
+        """Initializes a simulated device.
+        latency: seconds added to every response
+        jitter: random seconds (up to) added to the latency
+        error_rate: probability (0-1) that a request fails with status 500
+        notification_rate: spontaneous notifications per second (progress and
+        volume), on top of the ones caused by commands
+        idle_timeout: close the notification stream after this many seconds
+        without notifications, like real devices do after 5 minutes (None: never)
+        seed: seed of the random generator, for reproducible runs
+        network: the SimulatedNetwork of the device (defaults to DEFAULT_NETWORK)
+        """
+        self.name = name
+        self.serial = serial
+        self.typeNumber = typeNumber
+        self.itemNumber = itemNumber
+        self.software_version = software_version
+        self.jid = JID_FORMAT.format(typeNumber, itemNumber, serial)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # paths (without the leading /) that always fail with status 500
+        self.failing_paths = set()
+        self.notification_rate = notification_rate
+        self.idle_timeout = idle_timeout
+        self._random = random.Random(seed)
+        self.network = network if network is not None else DEFAULT_NETWORK
+        # state
+        self.volume = 30
+        self.volume_range = (0, 90)
+        self.muted = False
+        self.power = "standby"
+        self.play_state = "stop"
+        self.sources = [
+            (
+                "{0}:{1}".format(prefix, self.jid),
+                {
+                    "id": "{0}:{1}".format(prefix, self.jid),
+                    "friendlyName": friendlyName,
+                    "sourceType": {"type": sourceType},
+                    "category": "MEDIA",
+                    "inUse": True,
+                    "borrowed": borrowed,
+                    "profile": "",
+                    "linkable": True,
+                    "product": {"jid": self.jid, "friendlyName": name},
+                },
+            )
+            for prefix, friendlyName, sourceType, borrowed in DEFAULT_SOURCES
+        ]
+        self.active_source = None
+        self.listeners = []
+        # the device whose experience this device joined, if any
+        self.experience_host = None
+        self.experience_started = 0.0
+        self.sound_modes = list(enumerate(DEFAULT_SOUND_MODES))
+        self.sound_mode = 0
+        self.stand_positions = list(enumerate(DEFAULT_STAND_POSITIONS))
+        self.stand_position = 0
+        self.play_queue = []
+        self.commands = deque(maxlen=1000)
+        self.requests = 0
+        self.errors = 0
+        self._notification_id = 0
+        self._subscribers = set()
+        self._runner = None
+        self._ticker = None
+        self.host = None
+        self.port = None
+
+    ###############################################################
+    # SERVER
+    ###############################################################
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start serving on host:port (port 0 picks a free port). Returns the port."""
+        app = web.Application(middlewares=[self._middleware])
+        router = app.router
+        router.add_get("/" + BEOPLAY_URL_DEVICE, self._get_device)
+        router.add_get("/" + BEOPLAY_URL_NOTIFICATIONS, self._get_notifications)
+        router.add_get("/" + BEOPLAY_URL_GET_SOURCES, self._get_sources)
+        router.add_get("/" + BEOPLAY_URL_ACTIVE_SOURCES, self._get_active_sources)
+        router.add_post("/" + BEOPLAY_URL_ACTIVE_SOURCES, self._set_active_source)
+        router.add_delete("/" + BEOPLAY_URL_LEAVE_EXPERIENCE, self._leave_experience)
+        router.add_post("/" + BEOPLAY_URL_JOIN_EXPERIENCE, self._join_experience)
+        router.add_get("/" + BEOPLAY_URL_STANDBY, self._get_standby)
+        router.add_put("/" + BEOPLAY_URL_STANDBY, self._set_standby)
+        router.add_get("/BeoZone/Zone/Sound/Volume", self._get_volume)
+        router.add_get("/" + BEOPLAY_URL_SET_VOLUME, self._get_volume_level)
+        router.add_put("/" + BEOPLAY_URL_SET_VOLUME, self._set_volume)
+        router.add_get("/" + BEOPLAY_URL_MUTE, self._get_muted)
+        router.add_put("/" + BEOPLAY_URL_MUTE, self._set_muted)
+        router.add_get("/" + BEOPLAY_URL_GET_SOUND_MODE, self._get_sound_modes)
+        router.add_put("/" + BEOPLAY_URL_SET_SOUND_MODE, self._set_sound_mode)
+        router.add_get("/" + BEOPLAY_URL_STAND, self._get_stand_positions)
+        router.add_get("/" + BEOPLAY_URL_STAND_ACTIVE, self._get_stand_position)
+        router.add_put("/" + BEOPLAY_URL_STAND_ACTIVE, self._set_stand_position)
+        router.add_post("/" + BEOPLAY_URL_PLAYQUEUE, self._play_queue)
+        router.add_post("/" + BEOPLAY_DIGITS_URL, self._digits)
+        # stream commands and remote commands share the BeoZone/Zone/<group>/<key> paths
+        router.add_post("/" + BEOPLAY_REMOTE_PREFIX + "{group}/{key}", self._command)
+        router.add_post(
+            "/" + BEOPLAY_REMOTE_PREFIX + "{group}/{key}" + BEOPLAY_URL_RELEASE,
+            self._release,
+        )
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.host = host
+        self.port = self._runner.addresses[-1][1]
+        if self.notification_rate > 0:
+            self._ticker = asyncio.ensure_future(self._tick())
+        self.network.devices.add(self)
+        return self.port
+
+    async def stop(self):
+        """Stop serving and close the notification streams."""
+        if self in self.network.devices:
+            self._end_experience()
+            self.network.devices.discard(self)
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        for queue in list(self._subscribers):
+            queue.put_nowait(None)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def address(self):
+        """Return host:port, as accepted by BeoPlayFleet."""
+        return "{0}:{1}".format(self.host, self.port)
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.requests += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if request.path[1:] in self.failing_paths or (
+            self.error_rate and self._random.random() < self.error_rate
+        ):
+            self.errors += 1
+            return web.json_response({"error": "simulated"}, status=500)
+        if request.method != "GET":
+            body = None
+            if request.can_read_body:
+                try:
+                    body = await request.json()
+                except ValueError:
+                    body = None
+            self.commands.append((request.method, request.path_qs[1:], body))
+        return await handler(request)
+
+    ###############################################################
+    # NOTIFICATIONS
+    ###############################################################
+
+    def notify(self, notificationType: str, kind: str, data: dict):
+        """Publish a notification to all the connected streams."""
+        self._notification_id += 1
+        notification = {
+            "notification": {
+                "id": self._notification_id,
+                "timestamp": datetime.now().isoformat(),
+                "type": notificationType,
+                "kind": kind,
+                "data": data,
+            }
+        }
+        line = json.dumps(notification, separators=(",", ":")).encode("utf-8") + b"\r\n"
+        self.notify_raw(line)
+
+    def notify_raw(self, line: bytes):
+        """Write raw bytes to all the connected streams (e.g. a malformed line)."""
+        for queue in self._subscribers:
+            queue.put_nowait(line)
+
+    async def _get_notifications(self, request):
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        response = web.StreamResponse()
+        response.content_type = "application/json"
+        try:
+            await response.prepare(request)
+            await response.write(b"\r\n")
+            while True:
+                try:
+                    line = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if line is None:
+                    break
+                await response.write(line)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._subscribers.discard(queue)
+        return response
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self._random.expovariate(self.notification_rate))
+            if self._random.random() < 0.5:
+                self.notify("PROGRESS_INFORMATION", "playing", {"state": self.play_state})
+            else:
+                self.volume = self._random.randint(*self.volume_range)
+                self._notify_volume()
+
+    def _notify_volume(self):
+        self.notify("VOLUME", "renderer", self._volume_data())
+
+    def _source_data(self):
+        host = self.experience_host or self
+        if host.active_source is None:
+            return {}
+        source = dict(host.sources)[host.active_source]
+        return {
+            "primary": host.active_source,
+            "primaryJid": host.jid,
+            "primaryExperience": {
+                "source": source,
+                "listener": list(host.listeners),
+                "lastUsed": datetime.now().isoformat(),
+                "state": host.play_state,
+            },
+        }
+
+    def _followers(self):
+        return [device for device in self.network.devices if device.experience_host is self]
+
+    def _notify_experience(self):
+        """Publish the listeners of the experience hosted by this device, on this
+        device and on the devices that joined it."""
+        data = {"primaryExperience": self._source_data()["primaryExperience"]}
+        for device in [self] + self._followers():
+            device.notify("SOURCE_EXPERIENCE_CHANGED", "source", data)
+
+    def _end_experience(self):
+        """Leave the experience joined, or stop the experience hosted (the devices
+        that joined it leave it too)."""
+        host = self.experience_host
+        if host is not None:
+            self.experience_host = None
+            if self.jid in host.listeners:
+                host.listeners.remove(self.jid)
+            host._notify_experience()
+        for device in self._followers():
+            device.experience_host = None
+            device.play_state = "stop"
+            device.notify("SOURCE", "source", {})
+        self.active_source = None
+        self.listeners = []
+        self.play_state = "stop"
+        self.notify("SOURCE", "source", {})
+
+    ###############################################################
+    # HANDLERS
+    ###############################################################
+
+    async def _get_device(self, request):
+        return web.json_response(
+            {
+                "beoDevice": {
+                    "productId": {
+                        "productType": "BeoPlay Simulator",
+                        "typeNumber": self.typeNumber,
+                        "serialNumber": self.serial,
+                        "itemNumber": self.itemNumber,
+                    },
+                    "productFriendlyName": {"productFriendlyName": self.name},
+                    "software": {"version": self.software_version},
+                    "hardware": {"version": "1"},
+                }
+            }
+        )
+
+    async def _get_sources(self, request):
+        return web.json_response({"sources": [list(source) for source in self.sources]})
+
+    async def _get_active_sources(self, request):
+        host = self.experience_host or self
+        if host.active_source is None:
+            return web.json_response({"primaryExperience": {"source": {}}})
+        source = dict(host.sources)[host.active_source]
+        return web.json_response(
+            {
+                "primaryExperience": {
+                    "source": source,
+                    "listenerList": {
+                        "listener": [{"jid": jid} for jid in host.listeners]
+                    },
+                    "state": host.play_state,
+                }
+            }
+        )
+
+    async def _set_active_source(self, request):
+        body = await request.json()
+        sourceId = body["primaryExperience"]["source"]["id"]
+        if sourceId not in dict(self.sources):
+            return web.json_response({"error": "unknown source"}, status=404)
+        if self.experience_host is not None:
+            self._end_experience()
+        self.active_source = sourceId
+        self.power = "on"
+        self.play_state = "play"
+        self.experience_started = time.monotonic()
+        # the devices that joined follow the new source
+        self.listeners = [self.jid] + [device.jid for device in self._followers()]
+        for device in [self] + self._followers():
+            device.notify("SOURCE", "source", device._source_data())
+        return web.json_response({})
+
+    async def _join_experience(self, request):
+        host = self.network.latest_experience(exclude=self)
+        if host is None:
+            return web.json_response({"error": "no experience to join"}, status=404)
+        if self.experience_host is not host:
+            if self.experience_host is not None or self.active_source is not None:
+                self._end_experience()
+            self.experience_host = host
+            self.power = "on"
+            host.listeners.append(self.jid)
+            self.notify("SOURCE", "source", self._source_data())
+            host._notify_experience()
+        return web.json_response({})
+
+    async def _leave_experience(self, request):
+        self._end_experience()
+        return web.json_response({})
+
+    async def _get_standby(self, request):
+        return web.json_response({"standby": {"powerState": self.power}})
+
+    async def _set_standby(self, request):
+        body = await request.json()
+        self.power = body["standby"]["powerState"]
+        if self.power == "standby":
+            self._end_experience()
+            self.notify("SHUTDOWN", "device", {"reason": "standby"})
+        return web.json_response({})
+
+    def _volume_data(self):
+        return {
+            "speaker": {
+                "level": self.volume,
+                "muted": self.muted,
+                "range": {
+                    "minimum": self.volume_range[0],
+                    "maximum": self.volume_range[1],
+                },
+            }
+        }
+
+    async def _get_volume(self, request):
+        return web.json_response(self._volume_data())
+
+    async def _get_volume_level(self, request):
+        return web.json_response({"level": self.volume})
+
+    async def _set_volume(self, request):
+        body = await request.json()
+        self.volume = max(self.volume_range[0], min(self.volume_range[1], int(body["level"])))
+        self._notify_volume()
+        return web.json_response({})
+
+    async def _get_muted(self, request):
+        return web.json_response({"muted": self.muted})
+
+    async def _set_muted(self, request):
+        body = await request.json()
+        self.muted = bool(body["muted"])
+        self._notify_volume()
+        return web.json_response({})
+
+    async def _get_sound_modes(self, request):
+        return web.json_response(
+            {
+                "mode": {
+                    "list": [
+                        {"id": modeId, "friendlyName": friendlyName}
+                        for modeId, friendlyName in self.sound_modes
+                    ],
+                    "active": self.sound_mode,
+                }
+            }
+        )
+
+    async def _set_sound_mode(self, request):
+        body = await request.json()
+        modes = dict(self.sound_modes)
+        if body["active"] not in modes:
+            return web.json_response({"error": "unknown sound mode"}, status=404)
+        self.sound_mode = body["active"]
+        self.notify(
+            "SOUND_ACTIVE_MODE_CHANGED",
+            "sound",
+            {"id": self.sound_mode, "friendlyName": modes[self.sound_mode]},
+        )
+        return web.json_response({})
+
+    async def _get_stand_positions(self, request):
+        return web.json_response(
+            {
+                "stand": {
+                    "list": [
+                        {"id": standId, "friendlyName": friendlyName}
+                        for standId, friendlyName in self.stand_positions
+                    ]
+                }
+            }
+        )
+
+    async def _get_stand_position(self, request):
+        return web.json_response({"active": self.stand_position})
+
+    async def _set_stand_position(self, request):
+        body = await request.json()
+        if body["active"] not in dict(self.stand_positions):
+            return web.json_response({"error": "unknown stand position"}, status=404)
+        self.stand_position = body["active"]
+        return web.json_response({})
+
+    async def _play_queue(self, request):
+        body = await request.json()
+        self.play_queue.append(body)
+        if request.query_string == BEOPLAY_URL_PLAYQUEUE_INSTANT[1:]:
+            self.play_state = "play"
+            self.notify("PROGRESS_INFORMATION", "playing", {"state": self.play_state})
+        return web.json_response({})
+
+    async def _digits(self, request):
+        body = await request.json()
+        if not 0 <= int(body[BEOPLAY_DIGITS_KEY]) <= 9:
+            return web.json_response({"error": "invalid digit"}, status=400)
+        return web.json_response({})
+
+    async def _command(self, request):
+        key = request.match_info["key"]
+        if request.match_info["group"] == "Stream":
+            if key in ("Play", "Pause", "Stop"):
+                self.play_state = key.lower()
+                self.notify("PROGRESS_INFORMATION", "playing", {"state": self.play_state})
+        return web.json_response({})
+
+    async def _release(self, request):
+        return web.json_response({})
+
+
+async def start_devices(
+    count: int, host: str = "127.0.0.1", port: int = 0, **kwargs
+) -> list:
+    """Start count simulated devices on consecutive ports from port (or on free
+    ports if port is 0). kwargs are passed to SimulatedDevice.
+    Returns the list of started devices."""
+    devices = []
+    for i in range(count):
+        device = SimulatedDevice(
+            name="Simulated BeoPlay {0}".format(i + 1),
+            serial=str(10000000 + i),
+            **kwargs
+        )
+        await device.start(host, port + i if port else 0)
+        devices.append(device)
+    return devices
+
+
+async def stop_devices(devices):
+    """Stop simulated devices."""
+    await asyncio.gather(*[device.stop() for device in devices])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run simulated BeoPlay devices")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--notification-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    async def main():
+        devices = await start_devices(
+            args.count,
+            args.host,
+            args.port,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            notification_rate=args.notification_rate,
+        )
+        for device in devices:
+            print(device.address, device.name)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await stop_devices(devices)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
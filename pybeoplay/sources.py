@@ -0,0 +1,216 @@
+"""
+
+Registry of the sources of a device.
+
+The sources are indexed by id, friendly name, source type and product jid, so
+that selecting a source by name is one dictionary lookup, and is updated in place
+from the SOURCE notifications (a source seen for the first time is added) instead
+of by reading the whole list again. Several sources can have the same friendly
+name (e.g. the same source borrowed from two products): lookups by name return
+one of them, the device's own source first.
+
+The lists of names, ids and borrowed flags of the earlier API are available as
+read-only lists (SourcesView) that the registry keeps up to date: they can be
+used wherever a list is expected, including json.dumps.
+
+"""
+
+class Source(object):
+    """A source of a device (or borrowed from another product)."""
+
+    __slots__ = ("id", "name", "type", "jid", "borrowed")
+
+    def __init__(self, id, name, type=None, jid=None, borrowed: bool = False):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.jid = jid
+        self.borrowed = borrowed
+
+    @classmethod
+    def from_json(cls, source: dict, borrowed: bool = None) -> "Source":
+        """Return the Source of a source object of the API (a Sources list element,
+        or the source of a primary experience).
+        borrowed: overrides the borrowed flag of the source object, if given"""
+        if borrowed is None:
+            borrowed = source.get("borrowed", False)
+        return cls(
+            source["id"],
+            source["friendlyName"],
+            (source.get("sourceType") or {}).get("type"),
+            (source.get("product") or {}).get("jid"),
+            borrowed,
+        )
+
+    def _key(self):
+        return (self.id, self.name, self.type, self.jid, self.borrowed)
+
+    def __eq__(self, other):
+        return isinstance(other, Source) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return "Source({0!r}, {1!r}, {2!r}, {3!r}, {4!r})".format(*self._key())
+
+
+def _add(index, key, source):
+    if key is not None:
+        index.setdefault(key, []).append(source)
+
+
+def _discard(index, key, source):
+    sources = index.get(key)
+    if sources is not None:
+        sources.remove(source)
+        if not sources:
+            del index[key]
+
+
+class SourceRegistry(object):
+    def __init__(self, sources=()):
+        """Sources indexed by id, friendly name, source type and product jid, in
+        the order they were added."""
+        self._byId = {}
+        self._byName = {}
+        self._byType = {}
+        self._byJid = {}
+        # attribute -> view of the names, ids or borrowed flags
+        self._views = {}
+        for source in sources:
+            self._add(source)
+        self._refresh()
+
+    def __len__(self):
+        return len(self._byId)
+
+    def __iter__(self):
+        return iter(list(self._byId.values()))
+
+    def __contains__(self, id):
+        return id in self._byId
+
+    def get(self, id) -> Source:
+        """Return the source with an id, or None."""
+        return self._byId.get(id)
+
+    def by_name(self, name) -> Source:
+        """Return the source with a friendly name (the device's own one, if several
+        have that name), or None."""
+        sources = self._byName.get(name)
+        if not sources:
+            return None
+        for source in sources:
+            if not source.borrowed:
+                return source
+        return sources[0]
+
+    def all_by_name(self, name) -> list:
+        """Return all the sources with a friendly name."""
+        return list(self._byName.get(name, ()))
+
+    def by_type(self, sourceType) -> list:
+        """Return the sources of a source type (e.g. RADIO)."""
+        return list(self._byType.get(sourceType, ()))
+
+    def by_jid(self, jid) -> list:
+        """Return the sources of a product."""
+        return list(self._byJid.get(jid, ()))
+
+    def add(self, source: Source) -> bool:
+        """Add a source, or replace the one with the same id. Returns False if the
+        registry already had that exact source."""
+        if not self._add(source):
+            return False
+        self._refresh()
+        return True
+
+    def _add(self, source: Source) -> bool:
+        previous = self._byId.get(source.id)
+        if previous is not None:
+            if previous == source:
+                return False
+            self._unindex(previous)
+        self._byId[source.id] = source
+        _add(self._byName, source.name, source)
+        _add(self._byType, source.type, source)
+        _add(self._byJid, source.jid, source)
+        return True
+
+    def _unindex(self, source: Source):
+        _discard(self._byName, source.name, source)
+        _discard(self._byType, source.type, source)
+        _discard(self._byJid, source.jid, source)
+
+    def remove(self, id) -> bool:
+        """Remove the source with an id. Returns False if there is none."""
+        source = self._byId.pop(id, None)
+        if source is None:
+            return False
+        self._unindex(source)
+        self._refresh()
+        return True
+
+    def replace(self, sources):
+        """Replace all the sources."""
+        self._clear()
+        for source in sources:
+            self._add(source)
+        self._refresh()
+
+    def clear(self):
+        self._clear()
+        self._refresh()
+
+    def _clear(self):
+        self._byId.clear()
+        self._byName.clear()
+        self._byType.clear()
+        self._byJid.clear()
+
+    def _refresh(self):
+        if self._views:
+            sources = self._byId.values()
+            for attribute, view in self._views.items():
+                view._set([getattr(source, attribute) for source in sources])
+
+    def view(self, attribute) -> "SourcesView":
+        """Return the read-only list of an attribute (name, id or borrowed) of the
+        sources, in order, kept up to date by the registry."""
+        view = self._views.get(attribute)
+        if view is None:
+            view = self._views[attribute] = SourcesView(self, attribute)
+        return view
+
+
+def _readOnly(self, *args, **kwargs):
+    raise TypeError("SourcesView is read-only")
+
+
+class SourcesView(list):
+    """Read-only list of an attribute of the sources of a SourceRegistry, that
+    follows the changes of the registry. Copy it (list(view)) to keep the current
+    content."""
+
+    __slots__ = ("_registry", "_attribute")
+
+    def __init__(self, registry: SourceRegistry, attribute):
+        list.__init__(
+            self, [getattr(source, attribute) for source in registry._byId.values()]
+        )
+        self._registry = registry
+        self._attribute = attribute
+
+    def _set(self, values):
+        list.__setitem__(self, slice(None), values)
+
+    def __contains__(self, value):
+        if self._attribute == "name":
+            return value in self._registry._byName
+        if self._attribute == "id":
+            return value in self._registry._byId
+        return list.__contains__(self, value)
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readOnly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readOnly
@@ -0,0 +1,88 @@
+"""
+
+Compact state record of a BeoPlay device.
+
+The public state attributes of BeoPlay (volume, source, media_*, state, ...) are
+stored in a BeoPlayState, a __slots__ record updated in place by the parsers.
+The fields a notification may touch are read before and after it is processed,
+and compared, to produce the set of fields whose value actually changed, so that
+consumers can patch only those.
+
+"""
+
+from operator import attrgetter
+
+STATE_FIELDS = (
+    "on",
+    "min_volume",
+    "max_volume",
+    "volume",
+    "muted",
+    "state",
+    "media_url",
+    "media_track",
+    "media_artist",
+    "media_album",
+    "media_genre",
+    "media_country",
+    "media_languages",
+    "primary_experience",
+    "source",
+    "listeners",
+    "soundMode",
+    "standPosition",
+)
+
+
+class BeoPlayState(object):
+    __slots__ = STATE_FIELDS
+
+    def __init__(self):
+        for field in STATE_FIELDS:
+            setattr(self, field, None)
+        self.listeners = []
+
+    def __repr__(self):
+        return "BeoPlayState(%s)" % ", ".join(
+            "%s=%r" % (field, getattr(self, field)) for field in STATE_FIELDS
+        )
+
+    def as_dict(self) -> dict:
+        """Return all the fields as a dict."""
+        return {field: getattr(self, field) for field in STATE_FIELDS}
+
+
+def field_getter(fields):
+    """Return a function reading the given fields of a BeoPlayState as a tuple."""
+    if len(fields) == 1:
+        getter = attrgetter(fields[0])
+        return lambda state: (getter(state),)
+    return attrgetter(*fields)
+
+
+def diff(fields, before, after) -> dict:
+    """Return the dict field -> new value of the fields whose value changed,
+    given their values before and after (as returned by a field_getter)."""
+    if before == after:
+        return {}
+    return {
+        field: new for field, old, new in zip(fields, before, after) if old != new
+    }
+
+
+class StateField(object):
+    """Descriptor exposing a field of the BeoPlayState record of a BeoPlay object
+    (stored in its _snapshot attribute) as an attribute."""
+
+    __slots__ = ("_slot",)
+
+    def __init__(self, field):
+        self._slot = BeoPlayState.__dict__[field]
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return self._slot.__get__(obj._snapshot)
+
+    def __set__(self, obj, value):
+        self._slot.__set__(obj._snapshot, value)
@@ -0,0 +1,108 @@
+"""
+
+Incremental parser for the BeoNotify notification stream.
+
+The stream is a sequence of JSON documents separated by CR/LF. The parser is fed
+raw byte chunks as they arrive from the socket, splits frames on the raw bytes
+and decodes each frame with the fastest JSON backend available (orjson if it is
+installed, the standard json module otherwise).
+
+"""
+
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _json_loads_bytes(frame):
+    # the json module does not accept memoryview
+    return json.loads(bytes(frame))
+
+
+if orjson is not None:
+    json_loads = orjson.loads
+else:
+    json_loads = _json_loads_bytes
+
+
+class NotificationParser(object):
+    def __init__(self, loads=None):
+        """Incremental notification parser.
+        loads: the JSON backend, a function decoding a bytes-like object
+        (bytes or memoryview). Defaults to orjson when installed.
+        """
+        self._loads = loads if loads is not None else json_loads
+        self._buffer = bytearray()
+        self.frames = 0
+        self.errors = 0
+
+    def feed(self, chunk) -> list:
+        """Feed a chunk of bytes and return the list of complete notifications
+        it contains, in order. Incomplete trailing data is kept until the next chunk."""
+        result = []
+        start = 0
+        if self._buffer:
+            # a frame is spanning chunks: only the new bytes are searched, and
+            # only the part of the chunk that ends the frame is copied
+            end = chunk.find(b"\n")
+            if end < 0:
+                self._buffer += chunk
+                return result
+            buffer = self._buffer
+            buffer += chunk[:end]
+            self._buffer = bytearray()
+            if buffer[-1:] == b"\r":
+                del buffer[-1:]
+            if buffer:
+                self._decode(buffer, result)
+            start = end + 1
+        view = memoryview(chunk)
+        loads = self._loads
+        find = chunk.find
+        size = len(chunk)
+        while start < size:
+            end = find(b"\n", start)
+            if end < 0:
+                self._buffer += view[start:]
+                break
+            stop = end
+            if stop > start and chunk[stop - 1] == 13:  # \r
+                stop -= 1
+            if stop > start:
+                frame = view[start:stop]
+                try:
+                    result.append(loads(frame))
+                    self.frames += 1
+                except ValueError:
+                    self.errors += 1
+                    LOG.debug("Malformed notification frame: %s", bytes(frame))
+            start = end + 1
+        view.release()
+        return result
+
+    def _decode(self, frame, result):
+        try:
+            result.append(self._loads(frame))
+            self.frames += 1
+        except ValueError:
+            self.errors += 1
+            LOG.debug("Malformed notification frame: %s", bytes(frame))
+
+    def flush(self) -> list:
+        """Decode any pending data left when the stream ends."""
+        if not self._buffer.strip():
+            self._buffer = bytearray()
+            return []
+        return self.feed(b"\n")
+
+    @property
+    def pending(self) -> int:
+        """Number of bytes waiting for the end of their frame."""
+        return len(self._buffer)
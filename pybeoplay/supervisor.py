@@ -0,0 +1,164 @@
+"""
+
+Supervised BeoNotify stream.
+
+B&O devices drop the notification connection after 5 minutes of inactivity, and
+any network blip drops it too. NotificationSupervisor keeps the stream of one
+device alive: it reconnects with jittered exponential backoff (so that a fleet
+does not reconnect all at once), treats a stream that is silent for too long as
+stalled, and reports its connection state transitions.
+
+"""
+
+import asyncio
+import logging
+import random
+from typing import Optional
+
+
+from .const import *
+from .lazy import aiohttp
+
+
+LOG = logging.getLogger(__name__)
+
+
+class NotificationSupervisor(object):
+    def __init__(
+        self,
+        beoplay,
+        callback=None,
+        state_callback=None,
+        batch_callback=None,
+        chunked: bool = None,
+        change_callback=None,
+        recorder=None,
+        stall_timeout: Optional[float] = NOTIFY_STALL_TIMEOUT,
+        backoff_base: float = NOTIFY_BACKOFF_BASE,
+        backoff_max: float = NOTIFY_BACKOFF_MAX,
+        stable_after: float = NOTIFY_STABLE_AFTER,
+        initial_jitter: float = 0.0,
+    ):
+        """Keeps the notification stream of a BeoPlay device alive.
+        beoplay: the BeoPlay device
+        callback / batch_callback / chunked / change_callback / recorder: passed
+        to async_notificationsTask
+        state_callback: a function called as state_callback(state) on every
+        connection state transition (NOTIFY_STATE_* constants)
+        stall_timeout: seconds without any data after which the stream is
+        considered stalled and reconnected (None to disable)
+        backoff_base, backoff_max: the reconnect delay is a random value between 0
+        and min(backoff_max, backoff_base * 2 ** failures)
+        stable_after: a connection that lasted this long resets the backoff
+        initial_jitter: wait a random delay up to this many seconds before the
+        first connection, to spread the startup of a fleet
+        """
+        self._beoplay = beoplay
+        self._callback = callback
+        self._state_callback = state_callback
+        self._batch_callback = batch_callback
+        self._chunked = chunked
+        self._change_callback = change_callback
+        self._recorder = recorder
+        self._stall_timeout = stall_timeout
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._stable_after = stable_after
+        self._initial_jitter = initial_jitter
+        self._state = NOTIFY_STATE_STOPPED
+        self._task = None
+        self._failures = 0
+        self._received = 0
+        self.connections = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        """Return the current connection state."""
+        return self._state
+
+    @property
+    def running(self) -> bool:
+        """Return True if the supervisor task is running."""
+        return self._task is not None and not self._task.done()
+
+    def _set_state(self, state):
+        if state == self._state:
+            return
+        LOG.debug("Notifications %s: %s -> %s", self._beoplay.host, self._state, state)
+        self._state = state
+        if self._state_callback is not None:
+            try:
+                self._state_callback(state)
+            except Exception:
+                LOG.exception("Error in notification state callback")
+
+    def _on_connected(self):
+        self.connections += 1
+        self._set_state(NOTIFY_STATE_CONNECTED)
+
+    def _on_notification(self, notification):
+        self._received += 1
+        if self._callback is not None:
+            self._callback(notification)
+
+    def backoff_delay(self) -> float:
+        """Return the delay before the next reconnection attempt (full jitter)."""
+        ceiling = min(self._backoff_max, self._backoff_base * (2 ** self._failures))
+        return random.uniform(0, ceiling)
+
+    async def run(self):
+        """Run the supervisor until cancelled."""
+        loop = asyncio.get_running_loop()
+        try:
+            if self._initial_jitter > 0:
+                await asyncio.sleep(random.uniform(0, self._initial_jitter))
+            while True:
+                self._set_state(NOTIFY_STATE_CONNECTING)
+                self._received = 0
+                started = loop.time()
+                try:
+                    await self._beoplay.async_notificationsTask(
+                        self._on_notification,
+                        batch_callback=self._batch_callback,
+                        chunked=self._chunked,
+                        change_callback=self._change_callback,
+                        recorder=self._recorder,
+                        read_timeout=self._stall_timeout,
+                        connected_callback=self._on_connected,
+                    )
+                    self.last_error = None
+                except (asyncio.TimeoutError, aiohttp.ClientError) as _e:
+                    self.last_error = _e
+                    LOG.info("Notifications %s: %s", self._beoplay.host, repr(_e))
+                except Exception as _e:
+                    # e.g. a failing callback: the stream must not stop for good
+                    self.last_error = _e
+                    LOG.exception("Notifications %s: unexpected error", self._beoplay.host)
+                self._set_state(NOTIFY_STATE_DISCONNECTED)
+                if self._received or loop.time() - started >= self._stable_after:
+                    self._failures = 0
+                delay = self.backoff_delay()
+                self._failures += 1
+                self._set_state(NOTIFY_STATE_BACKOFF)
+                await asyncio.sleep(delay)
+        finally:
+            self._set_state(NOTIFY_STATE_STOPPED)
+
+    def start(self) -> asyncio.Task:
+        """Start the supervisor as a task on the running loop."""
+        if not self.running:
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def async_stop(self):
+        """Stop the supervisor and close the stream."""
+        if self._task is None:
+            return
+        task = self._task
+        self._task = None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -13,6 +13,16 @@ PACKAGES = find_packages(exclude=['tests', 'tests.*', 'dist', 'ccu', 'build'])
 
 REQUIRES = []
 
+# The HTTP stack is optional, and imported on first use (see pybeoplay/lazy.py).
+# The blocking calls run on aiohttp too, in a background event loop.
+AIOHTTP = 'aiohttp>=3.7'
+
+EXTRAS_REQUIRE = {
+    'async': [AIOHTTP],
+    'blocking': [AIOHTTP],
+    'fast': ['orjson'],
+}
+
 long_description = readme()
 
 
@@ -33,6 +43,7 @@ setup(
         zip_safe=False,
         platforms='any',
         install_requires=REQUIRES,
+        extras_require=EXTRAS_REQUIRE,
         keywords=['beoplay', 'pybeoplay', 'B&O' , 'Bang & Olufsen'],
         classifiers=[
             'Intended Audience :: Developers',
@@ -1,36 +1,22 @@
-import responses
+import json
+import os
 
 from pybeoplay import BeoPlay
-from pybeoplay.const import BEOPLAY_URL_STAND, BEOPLAY_URL_STAND_ACTIVE
+from pybeoplay.background import get_background_loop
+from pybeoplay.simulator import SimulatedDevice
 import logging
 
 LOG = logging.getLogger(__name__)
 
+HERE = os.path.dirname(os.path.abspath(__file__))
 
-@responses.activate
-def test_standpositions(gateway: BeoPlay):
-    # register via direct arguments
-    with open('standpositionstest.json', 'r') as file:
-        content = file.read()    
-        file.close()
-    responses.add(
-        responses.GET,
-        "http://192.168.1.98:8080/" + BEOPLAY_URL_STAND,
-        body=content.encode('utf-8'),
-        status=200,
-    )
-
-    with open('standpositiontest.json', 'r') as file:
-        content = file.read()  
-        file.close()  
-    responses.add(
-        responses.GET,
-        "http://192.168.1.98:8080/" + BEOPLAY_URL_STAND_ACTIVE,
-        body=content.encode('utf-8'),
-        status=200,
-    )
 
+def load_fixture(name):
+    with open(os.path.join(HERE, name), 'r') as file:
+        return json.load(file)
 
+
+def check_standpositions(gateway: BeoPlay):
     print ("--- STAND POSITIONS ---")
     gateway.getStandPositions()
     print (gateway.standPositions)
@@ -39,6 +25,30 @@ def test_standpositions(gateway: BeoPlay):
     print ("Stand Position: ", gateway.standPosition)
 
 
+def test_standpositions():
+    # serve the recorded stand responses from a simulated device
+    positions = load_fixture('standpositionstest.json')
+    position = load_fixture('standpositiontest.json')
+
+    background = get_background_loop()
+    device = SimulatedDevice()
+    device.stand_positions = [
+        (element["id"], element["friendlyName"])
+        for element in positions["stand"]["list"]
+    ]
+    device.stand_position = position["active"]
+    background.run(device.start())
+    try:
+        gateway = BeoPlay(device.host, port=device.port)
+        check_standpositions(gateway)
+        assert gateway.standPositions == {
+            element["friendlyName"]: element["id"]
+            for element in positions["stand"]["list"]
+        }
+        assert gateway.standPosition == position["active"]
+        gateway.close()
+    finally:
+        background.run(device.stop())
 
 
 if __name__ == '__main__':
@@ -53,5 +63,4 @@ if __name__ == '__main__':
 
     gateway = BeoPlay(sys.argv[1])
 
-    test_standpositions(gateway)   
-
+    check_standpositions(gateway)
@@ -0,0 +1,785 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+
+from pybeoplay import BeoPlay, BeoPlayFleet, InMemoryMetrics, async_discover_all
+from pybeoplay.background import get_background_loop
+from pybeoplay.breaker import CircuitBreaker, CircuitOpenError
+from pybeoplay.cache import ResponseCache
+from pybeoplay.const import (
+    BEOPLAY_URL_DEVICE,
+    BEOPLAY_URL_GET_SOUND_MODE,
+    BEOPLAY_URL_SET_VOLUME,
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    NOTIFY_STATE_BACKOFF,
+    NOTIFY_STATE_CONNECTED,
+    NOTIFY_STATE_STOPPED,
+)
+from pybeoplay.events import VolumeEvent, event_for
+from pybeoplay.metadata import MetadataStore
+from pybeoplay.pubsub import OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST
+from pybeoplay.replay import NotificationRecorder, NotificationReplayer
+from pybeoplay.simulator import SimulatedDevice, start_devices, stop_devices
+from pybeoplay.supervisor import NotificationSupervisor
+
+LOG = logging.getLogger(__name__)
+
+
+async def check_device(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+
+        await gateway.async_get_device_info()
+        print ("Serial Number: " , gateway.serialNumber)
+        print ("Name: ", gateway.name)
+        assert gateway.serialNumber == device.serial
+
+        sources = await gateway.async_get_sources()
+        print ("Sources: ", sources)
+        assert "Radio" in sources
+
+        changes = []
+        task = asyncio.ensure_future(
+            gateway.async_notificationsTask(change_callback=changes.append)
+        )
+        await asyncio.sleep(0.1)
+
+        await gateway.async_set_source("Radio")
+        await gateway.async_set_volume(0.45)
+        await gateway.async_set_sound_mode("Movie")
+        await asyncio.sleep(0.1)
+        print ("Changes: ", changes)
+        # only the fields that changed: the volume was already set locally
+        assert changes == [
+            {"source": "Radio", "state": "play", "on": True, "listeners": [device.jid]},
+            {"min_volume": 0.0, "max_volume": 0.9, "muted": False},
+            {"soundMode": "Movie"},
+        ]
+        assert device.active_source.startswith("RADIO:")
+        assert device.volume == 45
+        assert gateway.source == "Radio"
+        assert gateway.soundMode == "Movie"
+
+        await gateway.async_standby()
+        await asyncio.sleep(0.1)
+        assert gateway.on is False
+        assert await gateway.async_get_standby() is False
+        task.cancel()
+
+
+async def check_fleet(count):
+    devices = await start_devices(count)
+    try:
+        async with BeoPlayFleet([device.address for device in devices]) as fleet:
+            result = await fleet.async_refresh_all()
+            print ("Refreshed: ", len(result.results), "Errors: ", len(result.errors))
+            assert len(result.results) == count
+            result = await fleet.async_set_volume_all(0.2)
+            assert all(device.volume == 20 for device in devices)
+    finally:
+        await stop_devices(devices)
+
+
+async def wait_until(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def check_supervisor(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+        states = []
+        levels = []
+
+        def callback(notification):
+            if notification["type"] == "VOLUME":
+                level = notification["data"]["speaker"]["level"]
+                if level < 0:
+                    raise ValueError("failing callback")
+                levels.append(level)
+
+        supervisor = NotificationSupervisor(
+            gateway,
+            callback,
+            state_callback=states.append,
+            chunked=False,
+            stall_timeout=0.3,
+            backoff_base=0.05,
+            backoff_max=0.1,
+        )
+        supervisor.start()
+        await wait_until(lambda: supervisor.state == NOTIFY_STATE_CONNECTED)
+
+        # a malformed line is skipped
+        device.notify_raw(b"{malformed\r\n")
+        device.notify("VOLUME", "renderer", {"speaker": {"level": 1}})
+        await wait_until(lambda: levels == [1])
+        assert supervisor.connections == 1
+
+        # a failing callback reconnects, after a backoff
+        device.notify("VOLUME", "renderer", {"speaker": {"level": -1}})
+        await wait_until(lambda: supervisor.connections == 2)
+        assert isinstance(supervisor.last_error, ValueError)
+        assert NOTIFY_STATE_BACKOFF in states
+        await wait_until(lambda: supervisor.state == NOTIFY_STATE_CONNECTED)
+        device.notify("VOLUME", "renderer", {"speaker": {"level": 2}})
+        await wait_until(lambda: levels == [1, 2])
+
+        # a silent stream is stalled, and reconnected
+        await wait_until(lambda: supervisor.connections == 3)
+        assert isinstance(supervisor.last_error, asyncio.TimeoutError)
+
+        # the device closing the stream reconnects too
+        await wait_until(lambda: supervisor.state == NOTIFY_STATE_CONNECTED)
+        device.idle_timeout, idle_timeout = 0.05, device.idle_timeout
+        device.notify("VOLUME", "renderer", {"speaker": {"level": 3}})
+        await wait_until(lambda: supervisor.connections == 4)
+        assert supervisor.last_error is None
+        device.idle_timeout = idle_timeout
+
+        await supervisor.async_stop()
+        assert supervisor.state == NOTIFY_STATE_STOPPED
+        print ("Supervisor states: ", states)
+
+
+async def check_breaker(device: SimulatedDevice):
+    now = [0.0]
+    breaker = CircuitBreaker(clock=lambda: now[0])
+    async with aiohttp.ClientSession() as session:
+        closed = BeoPlay(device.host, session, port=1, breaker=breaker)
+        gateway = BeoPlay(device.host, session, port=device.port, breaker=breaker)
+
+        async def fail():
+            try:
+                await closed.async_getReq("BeoDevice")
+                assert False, "no connection error"
+            except aiohttp.ClientError:
+                pass
+
+        for _ in range(breaker.failure_threshold):
+            assert breaker.state == CIRCUIT_CLOSED
+            await fail()
+        assert breaker.state == CIRCUIT_OPEN and breaker.opened == 1
+
+        # open: fails without contacting the device
+        requests = device.requests
+        try:
+            await gateway.async_getReq("BeoDevice")
+            assert False, "circuit not open"
+        except CircuitOpenError:
+            pass
+        assert device.requests == requests and breaker.rejected == 1
+
+        # half open: a failed probe opens it again
+        now[0] += breaker.reset_timeout
+        assert breaker.state == CIRCUIT_HALF_OPEN
+        await fail()
+        assert breaker.state == CIRCUIT_OPEN and breaker.opened == 2
+
+        # half open: a successful probe closes it
+        now[0] += breaker.reset_timeout
+        assert breaker.state == CIRCUIT_HALF_OPEN
+        await gateway.async_get_device_info()
+        assert breaker.state == CIRCUIT_CLOSED and breaker.failures == 0
+
+
+async def check_cache(device: SimulatedDevice):
+    now = [0.0]
+    cache = ResponseCache(clock=lambda: now[0])
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port, cache=cache)
+        requests = device.requests
+        await gateway.async_get_device_info()
+        await gateway.async_get_device_info()
+        assert device.requests == requests + 1
+        assert cache.hits == 1
+
+        # expired after its time to live
+        now[0] += cache.ttl(BEOPLAY_URL_DEVICE) + 1
+        await gateway.async_get_device_info()
+        assert device.requests == requests + 2
+
+        # invalidated by a related notification
+        await gateway.async_get_sources()
+        assert len(cache) == 2
+        gateway._processNotification(
+            {"notification": {"type": "SOURCE", "kind": "source", "data": {}}}, False
+        )
+        assert len(cache) == 1
+
+        # invalidated by our own commands, and the active mode is never cached
+        await gateway.async_set_sound_mode("Optimised")
+        assert await gateway.async_get_sound_mode() == "Optimised"
+        await gateway.async_set_sound_mode("Movie")
+        assert await gateway.async_get_sound_mode() == "Movie"
+        assert "Movie" in await gateway.async_get_sound_modes()
+        await gateway.async_set_sound_mode("Adaptive")
+        assert cache.get(gateway._address, BEOPLAY_URL_GET_SOUND_MODE) is None
+
+
+async def check_coalescing(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+        requests = device.requests
+        device.latency = 0.1
+        try:
+            results = await asyncio.gather(
+                *[gateway.async_getReq("BeoDevice") for _ in range(5)]
+            )
+        finally:
+            device.latency = 0.0
+        assert all(result is results[0] for result in results)
+        assert gateway.issued_get_requests == 1
+        assert gateway.coalesced_get_requests == 4
+        assert device.requests == requests + 1
+
+        # once answered, the next call issues a new request
+        await gateway.async_getReq("BeoDevice")
+        assert gateway.issued_get_requests == 2
+        assert gateway.coalesced_get_requests == 4
+        assert device.requests == requests + 2
+
+
+async def check_latest_wins(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+        device.commands.clear()
+        # the next volumes replace each other while the first one is in flight:
+        # only the latest is sent, and all the callers resolve
+        device.latency = 0.1
+        try:
+            first = asyncio.ensure_future(gateway.async_set_volume(0.1))
+            await asyncio.sleep(0.05)
+            await asyncio.gather(
+                first,
+                *[gateway.async_set_volume(level / 100) for level in range(20, 60, 10)]
+            )
+        finally:
+            device.latency = 0.0
+        levels = [
+            body["level"]
+            for method, path, body in device.commands
+            if path == BEOPLAY_URL_SET_VOLUME
+        ]
+        assert levels == [10, 50]
+        assert device.volume == 50
+        channel = gateway._channels["volume"]
+        assert channel.sent == 2 and channel.dropped == 3
+
+
+async def check_replay(device: SimulatedDevice, path):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+        await gateway.async_get_sources()
+        received = []
+        with NotificationRecorder(path) as recorder:
+            task = asyncio.ensure_future(
+                gateway.async_notificationsTask(
+                    received.append, chunked=True, recorder=recorder
+                )
+            )
+            await asyncio.sleep(0.1)
+            await gateway.async_set_volume(0.2)
+            await gateway.async_set_source("Radio")
+            await gateway.async_set_volume(0.4)
+            await wait_until(
+                lambda: received
+                and received[-1]["type"] == "VOLUME"
+                and received[-1]["data"]["speaker"]["level"] == 40
+            )
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        assert recorder.lines == len(received)
+
+    # replayed, the recording rebuilds the same state
+    replayer = NotificationReplayer.load(path)
+    assert len(replayer) == len(received)
+    replayed = BeoPlay("127.0.0.1")
+    changes = []
+    stats = replayer.replay(replayed, change_callback=changes.append)
+    assert stats["events"] == len(received)
+    assert replayed.snapshot.as_dict() == gateway.snapshot.as_dict()
+    assert [change["volume"] for change in changes if "volume" in change] == [0.2, 0.4]
+
+    # at the recorded pace, sped up
+    types = []
+    await replayer.async_replay(
+        BeoPlay("127.0.0.1"), lambda notification: types.append(notification["type"]), speed=100
+    )
+    assert types == [notification["type"] for notification in received]
+
+
+async def check_metrics(device: SimulatedDevice):
+    metrics = InMemoryMetrics()
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port, metrics=metrics)
+        await gateway.async_get_device_info()
+        await gateway.async_set_volume(0.3)
+    print (metrics.render_prometheus())
+    assert metrics.request_count(device.address, 200) == 2
+    assert metrics.bytes_read[(device.address, "BeoDevice")] > 0
+    assert 'beoplay_requests_total{host="%s",method="GET",endpoint="BeoDevice",status="200"} 1' % device.address in metrics.render_prometheus()
+
+
+async def check_discovery(count):
+    devices = await start_devices(count)
+    try:
+        # one closed port, that must not be reported
+        ports = [device.port for device in devices] + [1]
+        found = await async_discover_all("127.0.0.1/32", port=ports)
+        print ("Discovered: ", [device.address for device in found])
+        assert sorted(device.address for device in found) == sorted(
+            device.address for device in devices
+        )
+        assert all(device.serialNumber is not None for device in found)
+    finally:
+        await stop_devices(devices)
+
+
+async def check_macro(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+        gateway.key_delay = 0.01
+        device.commands.clear()
+        assert await gateway.async_enter_channel(42, confirm=True)
+        await gateway.async_digits("99")
+        print ("Keys: ", list(device.commands))
+        assert [body for _, _, body in device.commands] == [
+            {"digits": 4},
+            {"digits": 2},
+            {"toBeReleased": False},
+            {"digits": 9},
+            {"digits": 9},
+        ]
+
+
+async def check_group(count):
+    devices = await start_devices(count, latency=0.02)
+    try:
+        async with BeoPlayFleet([device.address for device in devices]) as fleet:
+            primary = fleet.hosts[0]
+            await fleet[primary].async_get_sources()
+            await fleet[primary].async_set_source("Radio")
+            result = await fleet.async_join_all(primary, timeout=5)
+            print ("Joined: ", result.results, "Errors: ", result.errors)
+            assert len(result.results) == count - 1
+            assert len(fleet[primary].listeners) == count
+            assert len(devices[0].listeners) == count
+            result = await fleet.async_leave_all(primary, fleet.hosts[1:3], timeout=5)
+            assert len(result.results) == 2
+            assert len(fleet[primary].listeners) == count - 2
+    finally:
+        await stop_devices(devices)
+
+
+async def check_deadline(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port, hedge_percentile=90)
+        for _ in range(20):
+            await gateway.async_get_device_info()
+        device.jitter = 0.05
+        for _ in range(20):
+            await gateway.async_getReq("BeoDevice")
+        print ("Hedged: ", gateway.hedged_get_requests)
+        assert gateway.hedged_get_requests > 0
+
+        device.jitter = 0.0
+        device.latency = 1.0
+        start = asyncio.get_running_loop().time()
+        try:
+            await gateway.async_getReq("BeoDevice", timeout=0.2)
+            assert False, "deadline not enforced"
+        except asyncio.TimeoutError:
+            pass
+        assert asyncio.get_running_loop().time() - start < 0.5
+
+        # a longer deadline does not join the request of a shorter one
+        device.latency = 0.5
+        short, long = await asyncio.gather(
+            gateway.async_getReq("BeoDevice", bypass_cache=True, timeout=0.1),
+            gateway.async_getReq("BeoDevice", bypass_cache=True, timeout=5.0),
+            return_exceptions=True,
+        )
+        assert isinstance(short, asyncio.TimeoutError)
+        assert long["beoDevice"]["productId"]["serialNumber"] == device.serial
+
+        # nor does a call started late in the window of an earlier one
+        device.latency = 1.0
+        gateway.breaker.reset()
+        loop = asyncio.get_running_loop()
+        issued = gateway.issued_get_requests
+
+        async def late():
+            await asyncio.sleep(0.3)
+            start = loop.time()
+            try:
+                await gateway.async_getReq("BeoDevice", bypass_cache=True, timeout=0.4)
+                assert False, "deadline not enforced"
+            except asyncio.TimeoutError:
+                return loop.time() - start
+
+        first, elapsed = await asyncio.gather(
+            gateway.async_getReq("BeoDevice", bypass_cache=True, timeout=0.4),
+            late(),
+            return_exceptions=True,
+        )
+        assert isinstance(first, asyncio.TimeoutError)
+        assert elapsed > 0.39
+        assert gateway.issued_get_requests == issued + 2
+
+        # a call joining a request that gives up slightly earlier tries again
+        # in the time left
+        gateway.breaker.reset()
+        coalesced = gateway.coalesced_get_requests
+        start = loop.time()
+        results = await asyncio.gather(
+            gateway.async_getReq("BeoDevice", bypass_cache=True, timeout=0.3),
+            gateway.async_getReq("BeoDevice", bypass_cache=True, timeout=0.33),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+        assert loop.time() - start > 0.32
+        assert gateway.coalesced_get_requests == coalesced + 1
+        assert gateway.issued_get_requests == issued + 4
+        device.latency = 0.0
+        gateway.breaker.reset()
+
+        # connection refused: retried, then raised. The retries count as one
+        # failure for the (default) circuit breaker
+        closed = BeoPlay(device.host, session, port=1)
+        closed.breaker.reset()
+        try:
+            await closed.async_getReq("BeoDevice")
+            assert False, "no connection error"
+        except aiohttp.ClientError:
+            pass
+        assert closed.retried_get_requests == closed.get_retries
+        assert closed.breaker.failures == 1
+        assert closed.breaker.state == CIRCUIT_CLOSED
+        closed.breaker.reset()
+
+
+async def check_subscribe(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port)
+        volumes = gateway.subscribe(types={"VOLUME"})
+        # never consumed: must not stall the stream
+        stalled = gateway.subscribe(maxsize=2, overflow=OVERFLOW_DROP_NEWEST)
+        lossless = gateway.subscribe(maxsize=1, overflow=OVERFLOW_BLOCK)
+        received = []
+
+        async def consume():
+            async for notification in lossless:
+                received.append(notification["type"])
+
+        consumer = asyncio.ensure_future(consume())
+        task = asyncio.ensure_future(gateway.async_notificationsTask(chunked=True))
+        await asyncio.sleep(0.1)
+        for level in range(10):
+            device.notify("VOLUME", "renderer", {"speaker": {"level": level}})
+            device.notify("PROGRESS_INFORMATION", "playing", {"state": "play"})
+        await asyncio.sleep(0.1)
+        levels = []
+        while volumes.qsize():
+            event = event_for(volumes.get_nowait())
+            assert isinstance(event, VolumeEvent) and event["type"] == "VOLUME"
+            levels.append(event.volume)
+        print ("Levels: ", levels, "Dropped: ", stalled.dropped)
+        assert levels == [level / 100 for level in range(10)]
+        assert stalled.qsize() == 2 and stalled.dropped == 18
+        assert received == ["VOLUME", "PROGRESS_INFORMATION"] * 10
+        lossless.close()
+        await consumer
+        assert len(gateway._hub) == 2
+        task.cancel()
+
+
+async def check_history(device: SimulatedDevice):
+    async with aiohttp.ClientSession() as session:
+        gateway = BeoPlay(device.host, session, port=device.port, history_size=4)
+        await gateway.async_get_sources()
+        task = asyncio.ensure_future(gateway.async_notificationsTask())
+        await asyncio.sleep(0.1)
+        start = time.time()
+        for level in range(6):
+            device.notify("VOLUME", "renderer", {"speaker": {"level": level}})
+        await gateway.async_set_source("Radio")
+        await asyncio.sleep(0.1)
+        task.cancel()
+        history = gateway.history
+        entries = history.query()
+        print ("History: ", entries)
+        # the oldest entries were overwritten
+        assert [(entry.type, entry.value) for entry in entries] == [
+            ("VOLUME", 0.03),
+            ("VOLUME", 0.04),
+            ("VOLUME", 0.05),
+            ("SOURCE", "Radio"),
+        ]
+        assert entries[0].time >= start
+        assert history.query(start=entries[1].time) == entries[1:]
+        assert history.query(types={"SOURCE"}) == entries[3:]
+        assert history.count("VOLUME", end=entries[3].time) == 3
+        assert history.query(end=start) == []
+
+
+async def check_metadata(count, directory):
+    devices = await start_devices(count)
+    hosts = [device.address for device in devices]
+    try:
+        async with BeoPlayFleet(hosts, metadata=MetadataStore(directory)) as fleet:
+            result = await fleet.revalidation
+            assert all(result.results.values()) and len(result.results) == count
+
+        # a new process: usable before any request
+        requests = sum(device.requests for device in devices)
+        fleet = BeoPlayFleet(hosts, metadata=MetadataStore(directory))
+        assert all(fleet[host].serialNumber == device.serial for host, device in zip(hosts, devices))
+        assert all("Radio" in fleet[host].sources for host in hosts)
+        assert sum(device.requests for device in devices) == requests
+        async with fleet:
+            result = await fleet.revalidation
+            # one request per device, nothing changed
+            assert not any(result.results.values())
+            assert sum(device.requests for device in devices) == requests + count
+            devices[0].software_version = "2.0.0"
+            result = await fleet.async_revalidate_all()
+            assert result.results[hosts[0]] is True and not any(list(result.results.values())[1:])
+        assert MetadataStore(directory).get(hosts[0]).software == "2.0.0"
+
+        # a response that cannot be read keeps its previous value
+        devices[0].software_version = "2.0.1"
+        devices[0].sound_modes = [(0, "Movie")]
+        devices[0].failing_paths.add(BEOPLAY_URL_GET_SOUND_MODE)
+        async with BeoPlayFleet(hosts, metadata=MetadataStore(directory)) as fleet:
+            soundModes = fleet[hosts[0]].soundModes
+            assert len(soundModes) > 1
+            result = await fleet.revalidation
+            assert result.results[hosts[0]] is True
+            assert fleet[hosts[0]].soundModes == soundModes
+            assert fleet[hosts[0]].standPositions
+        entry = MetadataStore(directory).get(hosts[0])
+        assert entry.software == "2.0.1"
+        assert BEOPLAY_URL_GET_SOUND_MODE in entry.responses
+    finally:
+        await stop_devices(devices)
+
+
+async def check_sources(device: SimulatedDevice):
+    # the same friendly name, borrowed from another product
+    other = "2714.1200298.28124412@products.bang-olufsen.com"
+    borrowed = dict(device.sources[0][1], id="RADIO:" + other, borrowed=True)
+    borrowed["product"] = {"jid": other, "friendlyName": "Kitchen"}
+    device.sources.append((borrowed["id"], borrowed))
+    try:
+        async with aiohttp.ClientSession() as session:
+            gateway = BeoPlay(device.host, session, port=device.port)
+            await gateway.async_get_device_info()
+            sources = await gateway.async_get_sources()
+            registry = gateway.source_registry
+            assert json.loads(json.dumps(gateway.sources)) == sources
+            try:
+                gateway.sources.append("Tidal")
+                assert False, "sources not read-only"
+            except TypeError:
+                pass
+            assert list(gateway.sources).count("Radio") == 2
+            assert len(gateway.sourcesID) == len(gateway.sourcesBorrowed) == len(registry)
+            assert registry.by_name("Radio").jid == gateway.jid
+            assert [source.jid for source in registry.by_type("RADIO")] == [gateway.jid, other]
+
+            device.commands.clear()
+            assert await gateway.async_set_source("Radio")
+            assert len(device.commands) == 1
+            assert device.active_source == registry.by_name("Radio").id
+
+            # a source seen in a notification is added without reading the list
+            task = asyncio.ensure_future(gateway.async_notificationsTask())
+            await asyncio.sleep(0.1)
+            added = dict(device.sources[1][1], id="TIDAL:" + gateway.jid, friendlyName="Tidal")
+            added["sourceType"] = {"type": "TIDAL"}
+            device.sources.append((added["id"], added))
+            device.active_source = added["id"]
+            device.notify("SOURCE", "source", device._source_data())
+            await asyncio.sleep(0.1)
+            assert "Tidal" in gateway.sources
+            assert gateway.sources[-1] == "Tidal"
+            # the list returned earlier does not change
+            assert "Tidal" not in sources
+            assert registry.by_type("TIDAL")[0].borrowed is False
+            task.cancel()
+    finally:
+        device.sources = [source for source in device.sources if source[1]["id"] not in (borrowed["id"], "TIDAL:" + device.jid)]
+        device.active_source = None
+
+
+def run_with_device(check, *args):
+    """Run check(device, *args) with a simulated device of its own."""
+    async def run():
+        device = SimulatedDevice()
+        await device.start()
+        try:
+            await check(device, *args)
+        finally:
+            await device.stop()
+
+    asyncio.run(run())
+
+
+def test_device():
+    run_with_device(check_device)
+
+
+def test_supervisor():
+    run_with_device(check_supervisor)
+
+
+def test_breaker():
+    run_with_device(check_breaker)
+
+
+def test_cache():
+    run_with_device(check_cache)
+
+
+def test_coalescing():
+    run_with_device(check_coalescing)
+
+
+def test_latest_wins():
+    run_with_device(check_latest_wins)
+
+
+def test_replay(tmp_path):
+    run_with_device(check_replay, tmp_path / "notifications.log")
+
+
+def test_fleet():
+    asyncio.run(check_fleet(20))
+
+
+def test_metrics():
+    run_with_device(check_metrics)
+
+
+def test_discovery():
+    asyncio.run(check_discovery(5))
+
+
+def test_macro():
+    run_with_device(check_macro)
+
+
+def test_group():
+    asyncio.run(check_group(8))
+
+
+def test_blocking():
+    # the simulated device runs on the background loop of the blocking calls
+    background = get_background_loop()
+    device = SimulatedDevice()
+    background.run(device.start())
+    try:
+        gateway = BeoPlay(device.host, port=device.port)
+        gateway.getDeviceInfo()
+        assert gateway.serialNumber == device.serial
+        gateway.getSources()
+        sources = gateway.getSources()
+        print ("Sources: ", sources)
+        assert len(sources) == len(set(sources))
+        gateway.setSource("Radio")
+        gateway.setVolume(0.35)
+        assert device.volume == 35
+        assert gateway.getStandby() is True
+        assert gateway.getSource() == "Radio"
+        gateway.close()
+    finally:
+        background.run(device.stop())
+
+
+def test_deadline():
+    run_with_device(check_deadline)
+
+
+def test_lazy_import():
+    # the HTTP stack is imported on first use, not with the package
+    import subprocess
+    import sys
+    output = subprocess.run(
+        [sys.executable, "-c", "import sys, pybeoplay; print('aiohttp' in sys.modules)"],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    assert output.strip() == "False"
+
+
+def test_subscribe():
+    run_with_device(check_subscribe)
+
+
+def test_subscribe_blocking():
+    # the stream of the blocking API publishes from the background loop to a
+    # subscriber on another loop
+    background = get_background_loop()
+    device = SimulatedDevice()
+    background.run(device.start())
+    gateway = BeoPlay(device.host, port=device.port)
+
+    async def notify(levels):
+        for level in levels:
+            device.notify("VOLUME", "renderer", {"speaker": {"level": level}})
+
+    async def run():
+        volumes = gateway.subscribe(types={"VOLUME"})
+        lossless = gateway.subscribe(maxsize=1, overflow=OVERFLOW_BLOCK)
+        supervisor = gateway.startNotifications()
+        await wait_until(lambda: supervisor.state == NOTIFY_STATE_CONNECTED)
+        background.submit(notify(range(5)))
+        levels = []
+        for _ in range(5):
+            notification = await asyncio.wait_for(volumes.get(), 2.0)
+            levels.append(notification["data"]["speaker"]["level"])
+        assert levels == list(range(5))
+        # not waited for by the stream, but nothing lost
+        await wait_until(lambda: lossless.received == 5)
+        assert lossless.qsize() == 5
+        received = [await lossless.get() for _ in range(5)]
+        assert [notification["data"]["speaker"]["level"] for notification in received] == levels
+        volumes.close()
+        lossless.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        gateway.close()
+        background.run(device.stop())
+
+
+def test_history():
+    run_with_device(check_history)
+
+
+def test_metadata(tmp_path):
+    asyncio.run(check_metadata(5, str(tmp_path)))
+
+
+def test_sources():
+    run_with_device(check_sources)
+
+
+if __name__ == '__main__':
+    import sys
+    ch = logging.StreamHandler(sys.stdout)
+    logging.basicConfig(level=logging.DEBUG)
+    ch.setLevel(logging.DEBUG)
+    LOG.addHandler(ch)
+
+    run_with_device(check_device)
+    asyncio.run(check_fleet(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
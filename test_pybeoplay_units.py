@@ -0,0 +1,329 @@
+import asyncio
+import json
+import logging
+import os
+
+from pybeoplay import BeoPlay
+from pybeoplay.breaker import CircuitBreaker
+from pybeoplay.cache import ResponseCache
+from pybeoplay.commands import LatestValueChannel
+from pybeoplay.const import (
+    BEOPLAY_URL_DEVICE,
+    BEOPLAY_URL_GET_SOUND_MODE,
+    BEOPLAY_URL_GET_SOURCES,
+    BEOPLAY_URL_SET_SOUND_MODE,
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+)
+from pybeoplay.events import (
+    LegacyEvent,
+    NetRadioEvent,
+    NotificationEvent,
+    NowPlayingEndedEvent,
+    NumberAndNameEvent,
+    ProgressEvent,
+    ShutdownEvent,
+    SoundModeEvent,
+    SourceEvent,
+    StoredMusicEvent,
+    StoredVideoEvent,
+    VolumeEvent,
+    event_for,
+)
+from pybeoplay.replay import NotificationReplayer
+from pybeoplay.stream import NotificationParser
+
+LOG = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+JID = "1790.1179011.26212907@products.bang-olufsen.com"
+
+
+def volume_notification(level):
+    return {
+        "notification": {
+            "type": "VOLUME",
+            "kind": "renderer",
+            "data": {
+                "speaker": {
+                    "level": level,
+                    "muted": False,
+                    "range": {"minimum": 0, "maximum": 90},
+                }
+            },
+        }
+    }
+
+
+def source_notification(name, listeners=None):
+    experience = {
+        "source": {"id": "RADIO:" + JID, "friendlyName": name},
+        "state": "play",
+    }
+    if listeners is not None:
+        experience["listener"] = listeners
+    return {
+        "notification": {
+            "id": 1333,
+            "timestamp": "2022-12-12T05:49:43.574598",
+            "type": "SOURCE",
+            "kind": "source",
+            "data": {"primary": "RADIO:" + JID, "primaryExperience": experience},
+        }
+    }
+
+
+def test_handlers():
+    gateway = BeoPlay("127.0.0.1")
+    changes = gateway._processNotification(volume_notification(40))
+    assert changes == {
+        "volume": 0.4, "min_volume": 0.0, "max_volume": 0.9, "muted": False
+    }
+
+    # per device handler, for a type with no built-in handler
+    shutdowns = []
+    gateway.register_notification_handler(
+        "SHUTDOWN", lambda beoplay, notification: shutdowns.append(notification)
+    )
+    assert gateway._processNotification(
+        {"notification": {"type": "SHUTDOWN", "data": {}}}
+    ) == {}
+    assert len(shutdowns) == 1
+    assert BeoPlay("127.0.0.1")._notification_handlers.get("SHUTDOWN") is None
+
+    # removing a built-in handler ignores the type
+    removed = BeoPlay("127.0.0.1")
+    removed.register_notification_handler("VOLUME", None)
+    assert removed._processNotification(volume_notification(60)) == {}
+    assert removed.volume is None
+
+    # class-wide handler, changing more fields than the built-in one
+    def volume_and_source(beoplay, notification):
+        BeoPlay._BUILTIN_NOTIFICATION_HANDLERS["VOLUME"](beoplay, notification)
+        beoplay.source = "Radio"
+
+    handlers = BeoPlay._NOTIFICATION_HANDLERS
+    before = BeoPlay("127.0.0.1")
+    BeoPlay.register_default_notification_handler("VOLUME", volume_and_source)
+    try:
+        # only for the objects created afterwards
+        assert before._processNotification(volume_notification(50)) == {
+            "volume": 0.5, "min_volume": 0.0, "max_volume": 0.9, "muted": False
+        }
+        other = BeoPlay("127.0.0.1")
+        changes = other._processNotification(volume_notification(50))
+        assert changes["volume"] == 0.5 and changes["source"] == "Radio"
+        # the device registered before keeps its handlers
+        assert gateway._processNotification(volume_notification(50)) == {"volume": 0.5}
+    finally:
+        BeoPlay._NOTIFICATION_HANDLERS = handlers
+
+
+def test_parser():
+    parser = NotificationParser()
+    # a frame spanning many chunks, and a CR/LF split between two chunks
+    frame = json.dumps({"notification": {"data": "x" * 100000}}).encode("utf-8")
+    notifications = []
+    for i in range(0, len(frame), 4096):
+        notifications += parser.feed(frame[i:i + 4096])
+    assert notifications == [] and parser.pending == len(frame)
+    assert parser.feed(b"\r") == []
+    assert parser.feed(b'\n{"a": 1}\r\n{"b"') == [json.loads(frame), {"a": 1}]
+    assert parser.feed(b": 2}\r\n{malformed\r\n") == [{"b": 2}]
+    assert parser.frames == 3 and parser.errors == 1 and parser.pending == 0
+
+
+def test_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(clock=lambda: now[0])
+    for _ in range(breaker.failure_threshold):
+        assert breaker.state == CIRCUIT_CLOSED and breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN and breaker.opened == 1
+    assert not breaker.allow() and breaker.rejected == 1
+    assert breaker.retry_after == breaker.reset_timeout
+
+    # half open: a single probe, that opens it again if it fails
+    now[0] += breaker.reset_timeout
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN and breaker.opened == 2
+
+    # and closes it if it succeeds
+    now[0] += breaker.reset_timeout
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED and breaker.failures == 0
+
+
+def test_cache():
+    now = [0.0]
+    cache = ResponseCache(clock=lambda: now[0])
+    host = "127.0.0.1"
+    cache.put(host, BEOPLAY_URL_DEVICE, {"device": 1})
+    cache.put(host, BEOPLAY_URL_GET_SOURCES, {"sources": 1})
+    cache.put(host, BEOPLAY_URL_GET_SOUND_MODE, {"mode": 1})
+    assert cache.get(host, BEOPLAY_URL_DEVICE) == {"device": 1}
+    assert cache.get("other", BEOPLAY_URL_DEVICE) is None
+    assert cache.hits == 1 and cache.misses == 1
+
+    # invalidated by a related notification, or a related command
+    cache.invalidate_notification(host, "SOURCE")
+    assert cache.get(host, BEOPLAY_URL_GET_SOURCES) is None
+    cache.invalidate_command(host, BEOPLAY_URL_SET_SOUND_MODE)
+    assert cache.get(host, BEOPLAY_URL_GET_SOUND_MODE) is None
+    assert len(cache) == 1
+
+    # expired after its time to live
+    now[0] += cache.ttl(BEOPLAY_URL_DEVICE) + 1
+    assert cache.get(host, BEOPLAY_URL_DEVICE) is None
+
+
+def test_latest_value_channel():
+    # the callers whose value was replaced get the result of the command that
+    # superseded it, errors included
+    async def send(value):
+        await asyncio.sleep(0.01)
+        if value < 0:
+            raise ValueError(value)
+        return value
+
+    async def run():
+        channel = LatestValueChannel(send, max_rate=None)
+        assert await asyncio.gather(*[channel.submit(value) for value in (1, 2, 3)]) == [3, 3, 3]
+        results = await asyncio.gather(
+            *[channel.submit(value) for value in (1, 2, -1)], return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert channel.sent == 2 and channel.dropped == 4
+        assert not channel.busy
+
+        # a worker cancelled while sending cancels the callers of the value in
+        # flight, and of the value waiting
+        sending = asyncio.ensure_future(channel.submit(1))
+        await asyncio.sleep(0.005)
+        waiting = asyncio.ensure_future(channel.submit(2))
+        await asyncio.sleep(0)
+        channel._worker.cancel()
+        results = await asyncio.wait_for(
+            asyncio.gather(sending, waiting, return_exceptions=True), 1.0
+        )
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        assert not channel.busy
+
+    asyncio.run(run())
+
+
+def test_replay_events():
+    replayer = NotificationReplayer.load(os.path.join(HERE, "EVENTS.md"))
+    gateway = BeoPlay("127.0.0.1")
+    types = []
+    changes = []
+    stats = replayer.replay(
+        gateway,
+        callback=lambda notification: types.append(notification["type"]),
+        change_callback=changes.append,
+    )
+    assert stats["events"] == len(replayer) == len(types)
+    assert "VOLUME" in types and "SOURCE" in types
+    assert {"volume": 0.32, "min_volume": 0.0, "max_volume": 0.9, "muted": False} in changes
+    assert gateway.volume == 0.32
+
+
+def test_events():
+    notification = volume_notification(40)["notification"]
+    event = event_for(notification)
+    assert isinstance(event, VolumeEvent) and event.notification is notification
+    assert (event.volume, event.min_volume, event.max_volume, event.muted) == (
+        0.4, 0.0, 0.9, False
+    )
+    assert event.type == "VOLUME" and event.kind == "renderer"
+    assert event.id is None and event.timestamp is None
+    # a read-only mapping of the notification
+    assert event["type"] == "VOLUME" and "data" in event and event.get("id", 1) == 1
+    assert event.data is notification["data"]
+
+    event = event_for(source_notification("Radio", listeners=[JID])["notification"])
+    assert isinstance(event, SourceEvent) and not event.empty
+    assert event.id == 1333 and event.timestamp == "2022-12-12T05:49:43.574598"
+    assert event.source == "Radio" and event.source_id == "RADIO:" + JID
+    assert event.source_data["id"] == "RADIO:" + JID
+    assert event.state == "play" and event.listeners == [JID]
+    assert event_for(source_notification("Radio")["notification"]).listeners is None
+    event = event_for({"type": "SOURCE", "data": {}})
+    assert event.empty and event.listeners == []
+    assert isinstance(
+        event_for({"type": "SOURCE_EXPERIENCE_CHANGED", "data": {}}), SourceEvent
+    )
+
+    event = event_for({"type": "PROGRESS_INFORMATION", "data": {"state": "stop"}})
+    assert isinstance(event, ProgressEvent) and event.state == "stop"
+
+    event = event_for(
+        {
+            "type": "NOW_PLAYING_STORED_MUSIC",
+            "data": {
+                "name": "Pacific",
+                "artist": "808 State",
+                "album": "808_State",
+                "genre": "",
+                "trackImage": [{"url": "http://host/track.jpg"}],
+            },
+        }
+    )
+    assert isinstance(event, StoredMusicEvent)
+    assert (event.track, event.artist, event.album, event.genre) == (
+        "Pacific", "808 State", "808_State", ""
+    )
+    assert event.image_url == "http://host/track.jpg"
+    event = event_for({"type": "NOW_PLAYING_STORED_MUSIC", "data": {"trackImage": []}})
+    assert event.image_url is None
+
+    event = event_for({"type": "NOW_PLAYING_STORED_VIDEO", "data": {"name": "Mov08c-1"}})
+    assert isinstance(event, StoredVideoEvent) and event.track == "Mov08c-1"
+
+    event = event_for(
+        {
+            "type": "NOW_PLAYING_NET_RADIO",
+            "data": {
+                "name": "Radio 1",
+                "liveDescription": "News",
+                "genre": "Talk",
+                "country": "Denmark",
+                "languages": "Danish",
+                "image": [{"url": "http://host.:8080/station.png"}],
+            },
+        }
+    )
+    assert isinstance(event, NetRadioEvent)
+    assert (event.name, event.live_description, event.genre) == ("Radio 1", "News", "Talk")
+    assert (event.country, event.languages) == ("Denmark", "Danish")
+    assert event.image_url == "http://host:8080/station.png"
+    event = event_for({"type": "NOW_PLAYING_NET_RADIO", "data": {}})
+    assert event.name is None and event.image_url is None
+
+    event = event_for(
+        {"type": "NOW_PLAYING_LEGACY", "kind": "playing", "data": {"trackNumber": 1}}
+    )
+    assert isinstance(event, LegacyEvent) and event.track_number == 1 and event.playing
+
+    assert isinstance(event_for({"type": "NOW_PLAYING_ENDED"}), NowPlayingEndedEvent)
+
+    event = event_for({"type": "NUMBER_AND_NAME", "data": {"number": 7, "name": "DR1"}})
+    assert isinstance(event, NumberAndNameEvent)
+    assert (event.number, event.name, event.track) == (7, "DR1", "7. DR1")
+
+    event = event_for(
+        {"type": "SOUND_ACTIVE_MODE_CHANGED", "data": {"friendlyName": "Movie"}}
+    )
+    assert isinstance(event, SoundModeEvent) and event.mode == "Movie"
+
+    event = event_for({"type": "SHUTDOWN", "data": {"reason": "standby"}})
+    assert isinstance(event, ShutdownEvent) and event.data == {"reason": "standby"}
+
+    # no class for the other types
+    event = event_for({"type": "NOW_PLAYING_STORED_PHOTO", "data": {"name": "io-ag"}})
+    assert type(event) is NotificationEvent and event.data["name"] == "io-ag"